@@ -0,0 +1,147 @@
+'''
+    Measures the cold start of the command line application.
+    @note: Each measurement runs in a new Python process, so no module is
+    already imported. Three measurements are taken:
+    1) The time to import main.
+    2) The import time of each module of the gcs package, in the order
+       main imports them (modules imported by an earlier one cost 0).
+    3) The wall time of main.py --head gs://bucketname/objectname, from the
+       process start to its exit. It requires stored credentials and the
+       project ID, so the application does not prompt.
+    The results are printed as JSON.
+    Usage: python benchmarks/startup_benchmark.py [--runs N] [--head gs://bucketname/objectname]
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import json
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+
+# The directory that contains main.py.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Measures the import of main in a new process.
+IMPORT_MAIN_SCRIPT = '''
+import sys, time
+start = time.time()
+import main
+sys.stdout.write('%r' % (time.time() - start))
+'''
+
+# Measures the import of each gcs module in a new process.
+IMPORT_MODULES_SCRIPT = '''
+import json, sys, time
+times = []
+for name in sys.argv[1:]:
+    start = time.time()
+    __import__(name)
+    times.append([name, time.time() - start])
+sys.stdout.write(json.dumps(times))
+'''
+
+# The modules measured by the import breakdown, dependencies first. httplib2
+# is not listed: it is imported at the first request, so a module that 
+# imports it at load time shows its cost.
+MODULES = ['gflags',
+           'gcs.config', 'gcs.metadata_records', 'gcs.retry_policy',
+           'gcs.metrics', 'gcs.xml_responses', 'gcs.connection_pool',
+           'gcs.command_utilities', 'gcs.bucket_commands', 'gcs.checksums',
+           'gcs.object_commands', 'gcs.token_manager', 'gcs.authentication',
+           'gcs.commands']
+
+
+def run_python(arguments):
+    '''
+        Runs Python in a new process from the application directory.
+        @param arguments: The command line arguments after the interpreter.
+        @return: The standard output and the wall time in seconds.
+        @raise RuntimeError: If the process failed.
+    '''
+    start = time.time()
+    process = subprocess.Popen([sys.executable] + arguments, cwd=APP_DIR,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = process.communicate()
+    elapsed = time.time() - start
+    if process.returncode != 0:
+        raise RuntimeError('%s failed with exit status %d:\n%s' % (
+                                ' '.join(arguments), process.returncode, errors))
+    return output, elapsed
+
+
+def summarize(samples):
+    '''
+        @param samples: The measurements in seconds.
+        @return: Dictionary of the runs, the minimum, median, 90th
+        percentile and maximum in milliseconds.
+    '''
+    samples = sorted(samples)
+    def at(fraction):
+        return round(samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000.0, 3)
+    return {'runs' : len(samples),
+            'min_ms' : round(samples[0] * 1000.0, 3),
+            'median_ms' : at(0.5),
+            'p90_ms' : at(0.9),
+            'max_ms' : round(samples[-1] * 1000.0, 3)}
+
+
+def measure_imports(runs):
+    '''
+        @param runs: The number of processes to start.
+        @return: The summary of the import time of main, and the median
+        import time in milliseconds of each module.
+    '''
+    main_samples = []
+    module_samples = {}
+    for run in range(runs):
+        output, elapsed = run_python(['-c', IMPORT_MAIN_SCRIPT])
+        main_samples.append(float(output))
+
+        output, elapsed = run_python(['-c', IMPORT_MODULES_SCRIPT] + MODULES)
+        for name, seconds in json.loads(output):
+            module_samples.setdefault(name, []).append(seconds)
+
+    modules = []
+    for name in MODULES:
+        modules.append({'module' : name,
+                        'median_ms' : summarize(module_samples[name])['median_ms']})
+    return summarize(main_samples), modules
+
+
+def measure_head(runs, object_path):
+    '''
+        @param runs: The number of processes to start.
+        @param object_path: The object in the format gs://bucketname/objectname.
+        @return: The summary of the wall time of main.py --head.
+    '''
+    samples = []
+    for run in range(runs):
+        output, elapsed = run_python(['main.py', '--head', object_path])
+        samples.append(elapsed)
+    return summarize(samples)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [--runs N] [--head gs://bucketname/objectname]')
+    parser.add_option('--runs', type='int', default=20,
+                      help='Number of processes to start per measurement.')
+    parser.add_option('--head', default=None,
+                      help='Object to request with main.py --head. Skipped if not set.')
+    options, arguments = parser.parse_args()
+
+    import_main, modules = measure_imports(options.runs)
+    results = {'python' : sys.version.split()[0],
+               'import_main' : import_main,
+               'import_modules' : modules}
+    if options.head:
+        results['head'] = measure_head(options.runs, options.head)
+    print json.dumps(results, sort_keys=True, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+'''
+    Measures the throughput and latency of the object and bucket operations
+    against the local fake XML API server (gcs/fake_server.py).
+    @note: The server runs in its own process, so the CPU time measured is
+    the client's only. The workloads are run at each concurrency level:
+    1) small_put, small_get: ops/s of small objects (_put_object_data,
+       _get_object).
+    2) head: the latency distribution of _head_object.
+    3) large_put, large_get: MB/s of large files (_put_object,
+       _get_object_to_file), which take the resumable and composite paths
+       above their thresholds.
+    4) list: entries/s of iter_objects over a bucket of list_count objects.
+    The metadata and content caches and the request rate limit are
+    disabled, so every operation reaches the server unpaced. Each result holds the operations, bytes, elapsed
+    time, rates, latency percentiles, HTTP requests, errors and the client
+    CPU time per operation and per request. The results are written as
+    JSON, to compare releases.
+    Usage: python benchmarks/transfer_benchmark.py [--concurrency 1,4,16]
+    [--workloads small_put,head] [--latency_ms 5] [--output results.json]
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import json
+import optparse
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# The directory that contains main.py.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from gcs import config
+from gcs.command_utilities import set_endpoint
+from gcs.commands import GCS_Command
+from gcs.metrics import metrics
+from gcs.worker_pool import GCS_Worker_Pool
+
+
+# The workloads, in the order they run.
+WORKLOADS = ('small_put', 'small_get', 'head', 'large_put', 'large_get', 'list')
+
+# The bucket the workloads use.
+BUCKET_NAME = 'benchmark'
+
+# Seconds to wait for the server to accept connections.
+SERVER_START_SECS = 10
+
+
+class _Static_Credentials(object):
+    '''
+        Credentials with a fixed token, which the fake server ignores.
+    '''
+    access_token = 'benchmark'
+    access_token_expired = False
+
+    def apply(self, headers):
+        headers['Authorization'] = 'Bearer %s' % self.access_token
+
+    def refresh(self, http):
+        pass
+
+
+def start_server(options):
+    '''
+        Starts the fake server in a new process.
+        @param options: The command line options.
+        @return: The server process and its URL.
+        @raise RuntimeError: If the server does not start.
+    '''
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    arguments = [sys.executable, os.path.join(APP_DIR, 'gcs', 'fake_server.py'),
+                 '--port', str(port), '--bucket', BUCKET_NAME,
+                 '--latency_ms', str(options.latency_ms)]
+    if options.bandwidth_mbps:
+        arguments += ['--bandwidth_mbps', str(options.bandwidth_mbps)]
+    process = subprocess.Popen(arguments, stdout=open(os.devnull, 'w'))
+
+    deadline = time.time() + SERVER_START_SECS
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            break
+        except socket.error:
+            if process.poll() is not None or time.time() > deadline:
+                if process.poll() is None:
+                    process.kill()
+                raise RuntimeError('The fake server did not start.')
+            time.sleep(0.05)
+    return process, 'http://127.0.0.1:%d' % port
+
+
+def create_client(url):
+    '''
+        Creates the command object, pointed at the fake server.
+        @param url: The server URL.
+        @return: The GCS_Command.
+    '''
+    set_endpoint(url)
+    commands = GCS_Command(0)
+    config.app_data['credentials'] = _Static_Credentials()
+    config.app_data['project_id'] = 'benchmark'
+    # Every operation must reach the server, at the pace of the client.
+    commands.metadata_cache.max_entries = 0
+    commands.content_cache.max_bytes = 0
+    commands.flow_controller.rate = None
+    return commands
+
+
+def make_file(path, size):
+    '''
+        Writes a file of random bytes.
+        @param path: The file path.
+        @param size: The number of bytes.
+    '''
+    data_file = open(path, 'wb')
+    try:
+        block = os.urandom(1024 * 1024)
+        for offset in range(0, size, len(block)):
+            data_file.write(block[:min(len(block), size - offset)])
+    finally:
+        data_file.close()
+
+
+def get_cpu_secs():
+    '''
+        @return: The user and system CPU seconds of the process, all
+        threads included.
+    '''
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_request_count():
+    '''
+        @return: The number of HTTP requests recorded by the metrics.
+    '''
+    return sum([operation['requests'] for operation in metrics.snapshot()['operations']])
+
+
+def percentile(samples, percent):
+    '''
+        @param samples: The sorted latencies in seconds.
+        @param percent: The percentile, such as 99.
+        @return: The latency in milliseconds, or None without samples.
+    '''
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(len(samples) * percent / 100.0))
+    return round(samples[index] * 1000.0, 3)
+
+
+def run_workload(name, func, items, concurrency):
+    '''
+        Runs an operation for each item and measures it.
+        @param name: The workload name.
+        @param func: The operation. It receives an item and returns the
+        number of bytes or entries it transferred.
+        @param items: The list of items.
+        @param concurrency: The number of operations in progress at once.
+        @return: The result dictionary.
+    '''
+    latencies = []
+
+    def timed(item):
+        start = time.time()
+        count = func(item)
+        latencies.append(time.time() - start)
+        return count
+
+    metrics.reset()
+    errors = 0
+    total = 0
+    cpu_start = get_cpu_secs()
+    start = time.time()
+    pool = GCS_Worker_Pool(concurrency, retries=0)
+    for item, count, error, attempts in pool.imap_unordered(timed, items):
+        if error is not None:
+            errors += 1
+        else:
+            total += count
+    elapsed = time.time() - start
+    cpu_secs = get_cpu_secs() - cpu_start
+    requests = get_request_count()
+
+    latencies.sort()
+    result = {'workload' : name,
+              'concurrency' : concurrency,
+              'ops' : len(items),
+              'errors' : errors,
+              'elapsed_secs' : round(elapsed, 3),
+              'ops_per_sec' : round(len(items) / elapsed, 1),
+              'requests' : requests,
+              'cpu_ms_per_op' : round(cpu_secs * 1000.0 / max(1, len(items)), 3),
+              'cpu_ms_per_request' : round(cpu_secs * 1000.0 / max(1, requests), 3),
+              'latency_ms' : {'mean' : (round(sum(latencies) * 1000.0 / len(latencies), 3)
+                                        if latencies else None),
+                              'p50' : percentile(latencies, 50),
+                              'p90' : percentile(latencies, 90),
+                              'p99' : percentile(latencies, 99),
+                              'max' : percentile(latencies, 100)}}
+    if name == 'list':
+        result['entries'] = total
+        result['entries_per_sec'] = round(total / elapsed, 1)
+    else:
+        result['bytes'] = total
+        result['mb_per_sec'] = round(total / elapsed / (1024 * 1024), 3)
+    return result
+
+
+def run_benchmarks(commands, options, work_dir):
+    '''
+        Runs the selected workloads at each concurrency level.
+        @param commands: The GCS_Command.
+        @param options: The command line options.
+        @param work_dir: The directory of the local files.
+        @return: The list of result dictionaries.
+        @raise RuntimeError: If the objects of the list workload cannot be
+        created.
+    '''
+    small_data = os.urandom(options.small_size)
+    large_path = os.path.join(work_dir, 'large.bin')
+    make_file(large_path, options.large_size)
+
+    def small_put(index):
+        commands._put_object_data(small_data, BUCKET_NAME, 'small/%06d' % index)
+        return len(small_data)
+
+    def small_get(index):
+        response, content = commands._get_object(BUCKET_NAME, 'small/%06d' % index)
+        return len(content)
+
+    def head(index):
+        response, metadata = commands._head_object(BUCKET_NAME, 'small/%06d' % index)
+        return 0
+
+    def large_put(index):
+        commands._put_object(large_path, BUCKET_NAME, 'large/%03d' % index, 'private')
+        return options.large_size
+
+    def large_get(index):
+        file_path = os.path.join(work_dir, 'download-%03d' % index)
+        commands._get_object_to_file(BUCKET_NAME, 'large/%03d' % index, file_path)
+        os.remove(file_path)
+        return options.large_size
+
+    def list_objects(index):
+        count = 0
+        for entry in commands.iter_objects(BUCKET_NAME, 'list/'):
+            count += 1
+        return count
+
+    functions = {'small_put' : (small_put, options.small_count),
+                 'small_get' : (small_get, options.small_count),
+                 'head' : (head, options.small_count),
+                 'large_put' : (large_put, options.large_count),
+                 'large_get' : (large_get, options.large_count),
+                 'list' : (list_objects, options.list_runs)}
+
+    selected = [name for name in WORKLOADS if name in options.workloads]
+    if 'list' in selected:
+        # The listed objects are created once, outside the measurements. 
+        # The pool is drained before a failure is reported, so no upload 
+        # is still running when the server stops.
+        pool = GCS_Worker_Pool(16, retries=0)
+        errors = []
+        for item, result, error, attempts in pool.imap_unordered(
+                lambda index: commands._put_object_data('', BUCKET_NAME, 'list/%06d' % index),
+                range(options.list_count)):
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise RuntimeError('%d of %d uploads of the list objects failed, the first with: %s'
+                               % (len(errors), options.list_count, errors[0]))
+
+    results = []
+    for concurrency in options.concurrency:
+        for name in selected:
+            func, count = functions[name]
+            result = run_workload(name, func, range(count), concurrency)
+            results.append(result)
+            print >> sys.stderr, '%-10s concurrency %3d: %s' % (
+                        name, concurrency,
+                        ', '.join(['%s %s' % (key, result[key]) for key in
+                                   ('ops_per_sec', 'mb_per_sec', 'entries_per_sec',
+                                    'cpu_ms_per_request', 'errors') if key in result]))
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--concurrency', default='1,4,16',
+                      help='Comma separated concurrency levels.')
+    parser.add_option('--workloads', default=','.join(WORKLOADS),
+                      help='Comma separated workloads among %s.' % ', '.join(WORKLOADS))
+    parser.add_option('--small_count', type='int', default=500,
+                      help='Number of small objects per run.')
+    parser.add_option('--small_size', type='int', default=4 * 1024,
+                      help='Bytes of each small object.')
+    parser.add_option('--large_count', type='int', default=4,
+                      help='Number of large objects per run.')
+    parser.add_option('--large_size', type='int', default=32 * 1024 * 1024,
+                      help='Bytes of each large object.')
+    parser.add_option('--list_count', type='int', default=5000,
+                      help='Number of objects in the listed prefix.')
+    parser.add_option('--list_runs', type='int', default=4,
+                      help='Number of complete listings per run.')
+    parser.add_option('--latency_ms', type='float', default=0,
+                      help='Latency the server adds to each response.')
+    parser.add_option('--bandwidth_mbps', type='float', default=None,
+                      help='Bandwidth limit of the server per body.')
+    parser.add_option('--output', default='-',
+                      help='JSON file of the results, or - for stdout.')
+    options, arguments = parser.parse_args()
+    options.concurrency = [int(level) for level in options.concurrency.split(',')]
+    options.workloads = options.workloads.split(',')
+    unknown = set(options.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error('Unknown workloads: %s' % ', '.join(sorted(unknown)))
+
+    started = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    try:
+        process, url = start_server(options)
+        work_dir = tempfile.mkdtemp(prefix='gcs-benchmark-')
+        try:
+            commands = create_client(url)
+            results = run_benchmarks(commands, options, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            process.terminate()
+            process.wait()
+    except RuntimeError, e:
+        print >> sys.stderr, 'Benchmark error: %s' % e
+        sys.exit(1)
+
+    report = {'python' : sys.version.split()[0],
+              'started' : started,
+              'settings' : {'small_size' : options.small_size,
+                            'large_size' : options.large_size,
+                            'list_count' : options.list_count,
+                            'latency_ms' : options.latency_ms,
+                            'bandwidth_mbps' : options.bandwidth_mbps,
+                            'resumable_threshold' : config.RESUMABLE_THRESHOLD,
+                            'composite_upload_threshold' : config.COMPOSITE_UPLOAD_THRESHOLD,
+                            'verify_checksums' : config.VERIFY_CHECKSUMS,
+                            'flow_rate_per_host' : commands.flow_controller.rate},
+              'results' : results}
+    output = json.dumps(report, sort_keys=True, indent=2)
+    if options.output == '-':
+        print output
+    else:
+        output_file = open(options.output, 'w')
+        try:
+            output_file.write(output + '\n')
+        finally:
+            output_file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+'''
+    Microbenchmarks of the XML request bodies built and the XML response
+    bodies parsed by the application, at 1, 100, 1000 and 10000 entries.
+    @note: Each benchmark is calibrated so that one run lasts at least
+    --min_time seconds, then runs --warmups times unmeasured and --runs
+    times measured, with the garbage collector disabled as in timeit. The
+    time per call is reported as mean, standard deviation, median and
+    minimum in microseconds.
+    Memory is measured by a separate call of each benchmark, with the
+    garbage collector disabled. The objects tracked by the collector that
+    the call allocates and does not free are counted from the collector's
+    allocation counter: the parsed records and their lists, and the
+    reference cycles left to the collector (such as the minidom trees of
+    the pretty printer). The objects the result keeps alive are counted
+    after a collection. The built bodies are strings, which are not
+    tracked. When the tracemalloc module is available (Python 3, or the
+    pytracemalloc package on Python 2), the number of memory blocks the
+    result keeps alive, their size and the peak memory of the call are
+    reported too. The peak includes the temporary trees of the builders.
+    The response bodies have the layout of the XML API responses.
+    Usage: python benchmarks/xml_benchmark.py [--sizes 1,100,1000,10000]
+    [--benchmarks parse_listing,build_cors] [--output results.json]
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import gc
+import json
+import math
+import optparse
+import os
+import sys
+import timeit
+import xml.etree.ElementTree as xml
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# The directory that contains main.py.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from gcs.command_utilities import GCS_Command_Utility
+from gcs.xml_responses import GCS_List_Parser
+from gcs.xml_responses import parse_acl, parse_bucket_list, parse_cors, parse_error
+
+
+# The namespace of the listing responses.
+XML_NAMESPACE = 'http://doc.s3.amazonaws.com/2006-03-01'
+
+# The declaration of the response bodies.
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+
+def make_listing(entries):
+    '''
+        @return: A ListBucketResult body with entries Contents elements.
+    '''
+    contents = ''.join(['<Contents><Key>photos/2014/03/image-%06d.jpg</Key>'
+                        '<Generation>1394791800%06d</Generation>'
+                        '<MetaGeneration>1</MetaGeneration>'
+                        '<LastModified>2014-03-14T10:30:00.000Z</LastModified>'
+                        '<ETag>"5d41402abc4b2a76b9719d911017c592"</ETag>'
+                        '<Size>%d</Size><StorageClass>STANDARD</StorageClass>'
+                        '<Owner><ID>00b4903a97</ID></Owner></Contents>'
+                        % (index, index, 1000 + index) for index in range(entries)])
+    return ('%s<ListBucketResult xmlns="%s"><Name>bucket</Name><Prefix>photos/</Prefix>'
+            '<Marker></Marker><IsTruncated>false</IsTruncated>%s</ListBucketResult>'
+            % (XML_DECLARATION, XML_NAMESPACE, contents))
+
+
+def make_bucket_list(entries):
+    '''
+        @return: A ListAllMyBucketsResult body with entries buckets.
+    '''
+    buckets = ''.join(['<Bucket><Name>bucket-%06d</Name>'
+                       '<CreationDate>2014-03-14T10:30:00.000Z</CreationDate></Bucket>'
+                       % index for index in range(entries)])
+    return ('%s<ListAllMyBucketsResult xmlns="%s"><Owner><ID>00b4903a97</ID></Owner>'
+            '<Buckets>%s</Buckets></ListAllMyBucketsResult>'
+            % (XML_DECLARATION, XML_NAMESPACE, buckets))
+
+
+def make_acl(entries):
+    '''
+        @return: An AccessControlList body with entries e-mail entries.
+    '''
+    acl_entries = ''.join(['<Entry><Scope type="UserByEmail">'
+                           '<EmailAddress>user-%06d@example.com</EmailAddress></Scope>'
+                           '<Permission>READ</Permission></Entry>' % index
+                           for index in range(entries)])
+    return ('%s<AccessControlList><Owner><ID>00b4903a97</ID></Owner>'
+            '<Entries>%s</Entries></AccessControlList>' % (XML_DECLARATION, acl_entries))
+
+
+def make_cors(entries):
+    '''
+        @return: A CorsConfig body with entries Cors elements.
+    '''
+    cors = ''.join(['<Cors><Origins><Origin>https://site-%06d.example.com</Origin></Origins>'
+                    '<Methods><Method>GET</Method><Method>HEAD</Method></Methods>'
+                    '<ResponseHeaders><ResponseHeader>Content-Type</ResponseHeader>'
+                    '</ResponseHeaders><MaxAgeSec>1800</MaxAgeSec></Cors>' % index
+                    for index in range(entries)])
+    return '%s<CorsConfig>%s</CorsConfig>' % (XML_DECLARATION, cors)
+
+
+def get_benchmarks(utility, entries):
+    '''
+        Creates the benchmarks of one size.
+        @param utility: The GCS_Command_Utility whose builders are measured.
+        @param entries: The number of entries of the bodies.
+        @return: List of (name, function, body size) tuples. The body size
+        is the length of the parsed body, or of one built body.
+    '''
+    origins = ['https://site-%06d.example.com' % index for index in range(entries)]
+    methods = ['GET', 'HEAD', 'PUT', 'POST', 'DELETE'][:max(1, min(entries, 5))]
+    response_headers = ['x-header-%06d' % index for index in range(entries)]
+    component_names = ['upload/part-%06d' % index for index in range(entries)]
+
+    listing = make_listing(entries)
+    bucket_list = make_bucket_list(entries)
+    acl = make_acl(entries)
+    cors = make_cors(entries)
+    error = ('%s<Error><Code>NoSuchKey</Code><Message>The specified key does not '
+             'exist.</Message></Error>' % XML_DECLARATION)
+
+    # A tree for _xml_tostring alone.
+    tree = xml.Element('ComposeRequest')
+    for name in component_names:
+        component_elem = xml.SubElement(tree, 'Component')
+        xml.SubElement(component_elem, 'Name').text = name
+
+    def parse_listing():
+        return list(GCS_List_Parser(listing))
+
+    benchmarks = [
+        ('build_cors', lambda: utility._get_cors_body(origins, methods, response_headers, 1800)),
+        ('build_compose', lambda: utility._get_compose_body(component_names)),
+        ('xml_tostring', lambda: utility._xml_tostring(tree)),
+        ('parse_listing', parse_listing),
+        ('parse_bucket_list', lambda: list(parse_bucket_list(bucket_list))),
+        ('parse_acl', lambda: parse_acl(acl)),
+        ('parse_cors', lambda: parse_cors(cors)),
+        ('prettify_listing', lambda: utility._prettify_xml(listing))]
+    if entries == 1:
+        # These bodies have one entry whatever the size.
+        benchmarks += [
+            ('build_location', lambda: utility._get_location_xml('EU')),
+            ('build_acl_email', lambda: utility._get_acls_email_body(
+                                            'READ', 'UserByEmail', 'user@example.com')),
+            ('parse_error', lambda: parse_error(error))]
+
+    sizes = {'build_cors' : None, 'build_compose' : None, 'xml_tostring' : None,
+             'build_location' : None, 'build_acl_email' : None,
+             'parse_listing' : len(listing), 'parse_bucket_list' : len(bucket_list),
+             'parse_acl' : len(acl), 'parse_cors' : len(cors),
+             'prettify_listing' : len(listing), 'parse_error' : len(error)}
+    results = []
+    for name, func in benchmarks:
+        body_size = sizes[name]
+        if body_size is None:
+            body_size = len(func())
+        results.append((name, func, body_size))
+    return results
+
+
+def calibrate(func, min_time):
+    '''
+        @param func: The function to measure.
+        @param min_time: The minimum seconds of one run.
+        @return: The number of calls of each run.
+    '''
+    loops = 1
+    while True:
+        elapsed = time_loops(func, loops)
+        if elapsed >= min_time:
+            return loops
+        loops *= 2 if elapsed < min_time / 10.0 else int(math.ceil(min_time / max(elapsed, 1e-9) * 1.2))
+
+
+def time_loops(func, loops):
+    '''
+        @param func: The function to measure.
+        @param loops: The number of calls.
+        @return: The seconds of the calls, with the garbage collector disabled.
+    '''
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        timer = timeit.default_timer
+        start = timer()
+        for loop in xrange(loops):
+            func()
+        return timer() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def measure_memory(func):
+    '''
+        Measures the memory of one call.
+        @param func: The function to measure.
+        @return: Dictionary of the objects the call allocates and does not
+        free, the objects its result keeps alive and, with tracemalloc, the
+        blocks and bytes its result keeps alive and the peak bytes of the call.
+        @note: The collector is disabled during the call. CPython counts the
+        GC-tracked objects allocated since the last collection, less those 
+        freed, so allocated_objects holds the result and the cycles the call
+        leaves to the collector. The retained figures are taken after a 
+        collection, while the result is alive.
+    '''
+    gc.collect()
+    gc.disable()
+    try:
+        if tracemalloc is not None:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        objects_before = len(gc.get_objects())
+        count_before = gc.get_count()[0]
+        result = func()
+        memory = {'allocated_objects' : gc.get_count()[0] - count_before}
+        if tracemalloc is not None:
+            current, peak = tracemalloc.get_traced_memory()
+        gc.collect()
+        memory['retained_objects'] = len(gc.get_objects()) - objects_before
+        if tracemalloc is not None:
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            differences = after.compare_to(before, 'filename')
+            memory['retained_blocks'] = sum([stat.count_diff for stat in differences])
+            memory['retained_bytes'] = sum([stat.size_diff for stat in differences])
+            memory['peak_bytes'] = peak
+        del result
+    finally:
+        gc.enable()
+    return memory
+
+
+def run_benchmark(name, func, entries, body_size, options):
+    '''
+        Measures one benchmark.
+        @return: The result dictionary.
+    '''
+    loops = calibrate(func, options.min_time)
+    for warmup in range(options.warmups):
+        time_loops(func, loops)
+    samples = sorted([time_loops(func, loops) / loops for run in range(options.runs)])
+
+    mean = sum(samples) / len(samples)
+    stdev = 0.0
+    if len(samples) > 1:
+        stdev = math.sqrt(sum([(sample - mean) ** 2 for sample in samples]) / (len(samples) - 1))
+    median = samples[len(samples) // 2]
+    if len(samples) % 2 == 0:
+        median = (samples[len(samples) // 2 - 1] + median) / 2
+
+    result = {'benchmark' : name,
+              'entries' : entries,
+              'body_bytes' : body_size,
+              'loops' : loops,
+              'runs' : options.runs,
+              'warmups' : options.warmups,
+              'mean_us' : round(mean * 1e6, 3),
+              'stdev_us' : round(stdev * 1e6, 3),
+              'median_us' : round(median * 1e6, 3),
+              'min_us' : round(samples[0] * 1e6, 3),
+              'us_per_entry' : round(median * 1e6 / entries, 3)}
+    result.update(measure_memory(func))
+    return result
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--sizes', default='1,100,1000,10000',
+                      help='Comma separated numbers of entries.')
+    parser.add_option('--benchmarks', default=None,
+                      help='Comma separated benchmark names. Default: all.')
+    parser.add_option('--runs', type='int', default=10, help='Measured runs.')
+    parser.add_option('--warmups', type='int', default=2, help='Unmeasured runs.')
+    parser.add_option('--min_time', type='float', default=0.1,
+                      help='Minimum seconds of one run.')
+    parser.add_option('--output', default='-',
+                      help='JSON file of the results, or - for stdout.')
+    options, arguments = parser.parse_args()
+    selected = None
+    if options.benchmarks:
+        selected = set(options.benchmarks.split(','))
+
+    utility = GCS_Command_Utility()
+    results = []
+    for entries in [int(size) for size in options.sizes.split(',')]:
+        for name, func, body_size in get_benchmarks(utility, entries):
+            if selected is not None and name not in selected:
+                continue
+            result = run_benchmark(name, func, entries, body_size, options)
+            results.append(result)
+            print >> sys.stderr, ('%-18s %6d entries: median %12.3f us  +- %.3f  '
+                                  '(%d objects allocated, %d retained)') % (
+                        name, entries, result['median_us'], result['stdev_us'],
+                        result['allocated_objects'], result['retained_objects'])
+
+    report = {'python' : sys.version.split()[0],
+              'tracemalloc' : tracemalloc is not None,
+              'results' : results}
+    output = json.dumps(report, sort_keys=True, indent=2)
+    if options.output == '-':
+        print output
+    else:
+        output_file = open(options.output, 'w')
+        try:
+            output_file.write(output + '\n')
+        finally:
+            output_file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+'''
+    Contains the GCS_Async_Client class which performs Google Cloud Storage
+    operations without blocking the caller, and the GCS_Future class which
+    holds the outcome of an operation in progress.
+    @note: Each operation returns a GCS_Future at once. The request runs on
+    a worker thread, and all the workers share the connection pool stored
+    in config.app_data. A semaphore bounds the number of requests in
+    progress, so thousands of operations can be queued at once while only
+    max_concurrency connections are open.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import logging
+import Queue
+import sys
+import threading
+
+# Local imports
+import config
+
+
+# Marks the end of the tasks.
+_DONE = object()
+
+
+class GCS_Future(object):
+    '''
+        Holds the result or the error of an operation in progress.
+        @note: The callbacks added with add_done_callback are called on the
+        worker thread that completed the operation, once its semaphore slot
+        is released, or right away if the operation already completed. The
+        errors raised by a callback are logged, not propagated.
+    '''
+
+    def __init__(self):
+        '''
+            Initializes GCS_Future.
+        '''
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._error = None
+        self._traceback = None
+
+
+    def done(self):
+        '''
+            @return: True if the operation completed; otherwise, False.
+        '''
+        return self._event.is_set()
+
+
+    def result(self, timeout=None):
+        '''
+            Waits for the operation to complete.
+            @param timeout: The maximum seconds to wait or None.
+            @return: The result of the operation.
+            @raise err: The error raised by the operation, such as GCS_Error.
+            @raise RuntimeError: If the timeout expires.
+        '''
+        error = self.exception(timeout)
+        if error is not None:
+            raise error, None, self._traceback
+        return self._result
+
+
+    def exception(self, timeout=None):
+        '''
+            Waits for the operation to complete.
+            @param timeout: The maximum seconds to wait or None.
+            @return: The error raised by the operation or None.
+            @raise RuntimeError: If the timeout expires.
+        '''
+        if not self._event.wait(timeout):
+            raise RuntimeError('The operation did not complete in %s seconds.' % timeout)
+        return self._error
+
+
+    def add_done_callback(self, callback):
+        '''
+            Calls a function when the operation completes.
+            @param callback: The function. It receives the future.
+        '''
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+
+    def _call(self, callback):
+        '''
+            Calls a callback and logs its error, so a failing callback 
+            neither stops the other callbacks nor the worker thread.
+            @param callback: The function. It receives the future.
+        '''
+        try:
+            callback(self)
+        except Exception:
+            logging.exception('The callback %r of an operation failed.', callback)
+
+
+    def _complete(self, result=None, error=None, traceback=None):
+        '''
+            Stores the outcome of the operation and calls the callbacks.
+            @param result: The result of the operation.
+            @param error: The error raised by the operation or None.
+            @param traceback: The traceback of the error.
+        '''
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._traceback = traceback
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+
+def gather(futures, return_exceptions=False):
+    '''
+        Waits for several operations to complete.
+        @param futures: The GCS_Future objects.
+        @param return_exceptions: If True, the error of a failed operation
+        takes the place of its result; otherwise, the first error is raised.
+        @return: The list of the results, in the order of the futures.
+    '''
+    results = []
+    for future in futures:
+        if return_exceptions:
+            error = future.exception()
+            results.append(future._result if error is None else error)
+        else:
+            results.append(future.result())
+    return results
+
+
+class GCS_Async_Client(object):
+    '''
+        Exposes the bucket and object operations as non-blocking calls.
+        Attributes:
+            commands: The object that performs the operations (GCS_Command).
+            max_concurrency: The maximum number of worker threads.
+            semaphore: The semaphore that bounds the requests in progress.
+        @note: Pass the same semaphore to several clients to share one
+        concurrency limit. The worker threads are started on demand and
+        stopped by close. A worker thread that dies is replaced while 
+        operations are queued.
+    '''
+
+    def __init__(self, commands, max_concurrency=config.ASYNC_CONCURRENCY,
+                 semaphore=None):
+        '''
+            Initializes GCS_Async_Client.
+            @param commands: The object that performs the operations.
+            @param max_concurrency: The maximum number of requests in progress.
+            @param semaphore: A shared semaphore or None to create one.
+        '''
+        self.commands = commands
+        self.max_concurrency = max(1, max_concurrency)
+        self.semaphore = semaphore or threading.BoundedSemaphore(self.max_concurrency)
+
+        # Keep enough idle connections for every request in progress, 
+        # otherwise the connections are closed and reopened at each burst.
+        pool = config.app_data.get('connection_pool')
+        if pool is not None:
+            pool.max_idle_per_host = max(pool.max_idle_per_host, self.max_concurrency)
+
+        self._tasks = Queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._idle = 0
+        self._closed = False
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def _start_worker(self):
+        '''
+            Starts a worker thread. The caller holds _lock.
+        '''
+        worker = threading.Thread(target=self._work)
+        worker.daemon = True
+        self._workers.append(worker)
+        self._idle += 1
+        worker.start()
+
+
+    def _work(self):
+        '''
+            Performs the queued operations until the client is closed.
+            @note: The worker is removed from _workers when it stops, and
+            replaced if it died while operations are queued.
+        '''
+        stopped = False
+        try:
+            while True:
+                task = self._tasks.get()
+                with self._lock:
+                    self._idle -= 1
+                if task is _DONE:
+                    stopped = True
+                    return
+                self._perform(*task)
+                with self._lock:
+                    self._idle += 1
+        finally:
+            with self._lock:
+                self._workers.remove(threading.current_thread())
+                if not stopped and not self._tasks.empty():
+                    self._start_worker()
+
+
+    def _perform(self, future, func, args, kwargs):
+        '''
+            Performs an operation and completes its future.
+            @note: The callbacks of the future run after the semaphore is 
+            released, so a slow callback does not hold a request slot. An 
+            error that is not an Exception (such as KeyboardInterrupt) 
+            completes the future and stops the worker thread.
+        '''
+        self.semaphore.acquire()
+        try:
+            try:
+                result = func(*args, **kwargs)
+            except:
+                error, traceback = sys.exc_info()[1:]
+            else:
+                error, traceback = None, None
+        finally:
+            self.semaphore.release()
+
+        future._complete(result if error is None else None, error, traceback)
+        if error is not None and not isinstance(error, Exception):
+            raise error, None, traceback
+
+
+    def submit(self, func, *args, **kwargs):
+        '''
+            Queues a function call.
+            @param func: The function to call on a worker thread.
+            @return: The GCS_Future of the call.
+            @raise RuntimeError: If the client is closed.
+        '''
+        future = GCS_Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('The client is closed.')
+            # Start a worker unless an idle one can take the call.
+            if (self._tasks.qsize() >= self._idle and 
+                    len(self._workers) < self.max_concurrency):
+                self._start_worker()
+            self._tasks.put((future, func, args, kwargs))
+        return future
+
+
+    def close(self, wait=True):
+        '''
+            Stops the worker threads once the queued operations completed.
+            @param wait: If True, waits for the worker threads to stop.
+        '''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for worker in self._workers:
+                self._tasks.put(_DONE)
+        if wait:
+            # A replaced worker joins the list, so it is read again; a 
+            # callback that closes the client does not wait for itself.
+            while True:
+                with self._lock:
+                    workers = [worker for worker in self._workers
+                               if worker is not threading.current_thread()]
+                if not workers:
+                    break
+                for worker in workers:
+                    worker.join()
+
+
+    # Bucket operations.
+
+    def list_buckets(self):
+        '''
+            @return: A future of the list of GCS_Bucket_Metadata records.
+        '''
+        return self.submit(lambda: list(self.commands.iter_buckets()))
+
+
+    def list_objects(self, bucket_name, prefix=None, delimiter=None):
+        '''
+            @return: A future of the list of the listing entries.
+            @note: All the listing pages are read by one worker.
+        '''
+        return self.submit(lambda: list(self.commands.iter_objects(
+                                            bucket_name, prefix, delimiter)))
+
+
+    def get_bucket_cors(self, bucket_name):
+        '''
+            @return: A future of the list of GCS_Cors records.
+        '''
+        return self.submit(self.commands._fetch_bucket_cors, bucket_name)
+
+
+    def set_bucket_cors(self, bucket_name, origins, methods, response_headers,
+                        max_age_secs):
+        '''
+            @return: A future of the response dictionary and string content.
+        '''
+        return self.submit(self.commands._put_bucket_cors, bucket_name, origins,
+                           methods, response_headers, max_age_secs)
+
+
+    def get_bucket_location(self, bucket_name):
+        '''
+            @return: A future of the location string.
+        '''
+        return self.submit(self.commands._fetch_bucket_location, bucket_name)
+
+
+    # Object operations.
+
+    def get_object(self, bucket_name, object_name):
+        '''
+            @return: A future of the string content of the object.
+        '''
+        return self.submit(lambda: self.commands._get_object(bucket_name, object_name)[1])
+
+
+    def get_object_to_file(self, bucket_name, object_name, file_path):
+        '''
+            @return: A future of the response dictionary and the digests.
+        '''
+        return self.submit(self.commands._get_object_to_file,
+                           bucket_name, object_name, file_path)
+
+
+    def put_object(self, data, bucket_name, object_name, permission='private',
+                   content_type=None):
+        '''
+            @return: A future of the response dictionary and string content.
+        '''
+        return self.submit(self.commands._put_object_data, data, bucket_name,
+                           object_name, permission, content_type)
+
+
+    def put_file(self, file_path, bucket_name, object_name, permission='private'):
+        '''
+            @return: A future of the response dictionary and string content.
+        '''
+        return self.submit(self.commands._put_object, file_path, bucket_name,
+                           object_name, permission)
+
+
+    def head_object(self, bucket_name, object_name):
+        '''
+            @return: A future of the GCS_Object_Metadata of the object.
+        '''
+        return self.submit(lambda: self.commands._head_object(bucket_name, object_name)[1])
+
+
+    def delete_object(self, bucket_name, object_name):
+        '''
+            @return: A future of the response dictionary and string content.
+        '''
+        return self.submit(self.commands._delete_object, bucket_name, object_name)
+
+
+    def copy_object(self, bucket_name, object_name, target_bucket_name,
+                    target_object_name, permission='private'):
+        '''
+            @return: A future of the response dictionary and string content.
+        '''
+        return self.submit(self.commands._copy_object, bucket_name, object_name,
+                           target_bucket_name, target_object_name, permission)
+
+
+    def get_object_acl(self, bucket_name, object_name):
+        '''
+            @return: A future of the GCS_Acl of the object.
+        '''
+        return self.submit(self.commands._fetch_object_acl, bucket_name, object_name)
+
+
+    def set_object_email_acl(self, bucket_name, object_name, permission, scope, email):
+        '''
+            @return: A future of the response dictionary and string content.
+        '''
+        return self.submit(self.commands._put_object_email_acl, bucket_name,
+                           object_name, permission, scope, email)
@@ -2,6 +2,9 @@
     Contains the GCS_Authentication class that generates an 
     authenticated HTTP client object. 
     The class uses the user's credentials.
+    @note: oauth2client and httplib2 are imported when the application 
+    authenticates, that is at the first API request, so they do not slow 
+    down the startup.
     @version: 1.0
 '''
 
@@ -9,18 +12,10 @@ __author__ = 'mielem@gmail.com'
 
 import os
 
-from apiclient.discovery import build as discovery_build
-
-from oauth2client.client import flow_from_clientsecrets
-from oauth2client.file import Storage as CredentialStorage
-from oauth2client.tools import run as run_oauth2
-
-from oauth2client.clientsecrets import InvalidClientSecretsError
-
-import httplib2
-
 # Local imports
 import config
+from connection_pool import GCS_Connection_Pool
+from token_manager import GCS_Token_Manager
 
 
 # CLIENT_SECRETS is name of a file containing the OAuth 2.0 information for this
@@ -32,6 +27,9 @@ CLIENT_SECRETS_FILE = os.path.join(os.path.dirname(__file__), 'client_secrets.js
 # File to store authentication credentials after acquiring them.
 CREDENTIALS_FILE = os.path.join(os.path.dirname(__file__), 'stored_credentials.json')
 
+# File to share the current access token among the processes.
+TOKEN_CACHE_FILE = os.path.join(os.path.dirname(__file__), 'stored_token.json')
+
 # Helpful message to display if the CLIENT_SECRETS_FILE is missing.
 MISSING_CLIENT_SECRETS_MESSAGE = """
 WARNING: Please configure OAuth 2.0
@@ -52,6 +50,24 @@ class GCS_Authentication():
      @note: It uses OAuth2.
     '''
     
+    def _create_connection_pool(self, debug_level):
+        '''
+            Creates the pool of keep-alive connections used by the API requests.
+            @param debug_level: The level of debugging message to use (0 to 4).
+            @note: The previous pool, if any, is closed because its 
+            connections may use a different debug level.
+        '''
+        if config.app_data['connection_pool'] is not None:
+            config.app_data['connection_pool'].clear()
+        
+        config.app_data['connection_pool'] = GCS_Connection_Pool(
+                                max_idle_per_host=config.POOL_MAX_IDLE_PER_HOST,
+                                idle_timeout=config.POOL_IDLE_TIMEOUT_SECS,
+                                max_lifetime=config.POOL_MAX_LIFETIME_SECS,
+                                debug_level=debug_level or 0,
+                                chunk_size=config.TRANSFER_CHUNK_SIZE)
+    
+    
     def _create_http_auth_client(self, force_auth, debug_level):
         '''
             Creates an authenticated HTTP request object. 
@@ -60,13 +76,21 @@ class GCS_Authentication():
             @return: 
                 config.app_data['http_client'] = http_client
                 config.app_data['auth_http_client'] = auth_http
+                config.app_data['credentials'] = credentials
+                config.app_data['token_manager'] = token_manager
             @note: In order for this function to work you need to populate the 
             client_secrets.json file.
             The credentials are stored in a local file and reused without going through 
             the OAuth2 flow again, unless you force the authentication to be executed.
             This might be required to change the authentication scope.
-            
+            The access token is refreshed in the background by a 
+            GCS_Token_Manager, which shares it with the other processes 
+            through TOKEN_CACHE_FILE.
         '''
+        from oauth2client.client import flow_from_clientsecrets
+        from oauth2client.file import Storage as CredentialStorage
+        from oauth2client.tools import run as run_oauth2
+        import httplib2
     
         # Authenticate the application.
     
@@ -97,8 +121,17 @@ class GCS_Authentication():
             httplib2.debuglevel=debug_level
 
         auth_http = credentials.authorize(http_client)
+        
+        # Refresh the access token ahead of its expiry. The previous token
+        # manager, if any, refreshes the token of a different scope.
+        if config.app_data['token_manager'] is not None:
+            config.app_data['token_manager'].stop()
+        token_manager = GCS_Token_Manager(credentials, http_client, TOKEN_CACHE_FILE)
+        token_manager.start()
     
         # Update global application information.
         config.app_data['http_client'] = http_client
         config.app_data['auth_http_client'] = auth_http
+        config.app_data['credentials'] = credentials
+        config.app_data['token_manager'] = token_manager
     
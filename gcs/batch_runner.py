@@ -0,0 +1,207 @@
+'''
+    Contains the GCS_Batch_Runner class which performs Google Cloud Storage
+    operations read from a JSONL job stream, without user interaction.
+    @note: Each input line is a JSON object with an op item and the
+    operation arguments, for example:
+        {"id": "1", "op": "upload", "src": "data/a.csv", "dst": "gs://bucket/a.csv"}
+        {"op": "download", "src": "gs://bucket/a.csv", "dst": "/tmp/a.csv"}
+        {"op": "copy", "src": "gs://bucket/a.csv", "dst": "gs://other/a.csv"}
+        {"op": "delete", "src": "gs://bucket/a.csv"}
+        {"op": "set-acl", "src": "gs://bucket/a.csv", "email": "me@example.com",
+         "permission": "READ", "scope": "UserByEmail"}
+        {"op": "head", "src": "gs://bucket/a.csv"}
+    For each job a JSON result line is written with the job id (the line
+    number if the job has no id), the status, the latency and the bytes.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import json
+import os
+import time
+
+# Local imports
+import config
+from command_utilities import GCS_Error as err
+from worker_pool import GCS_Worker_Pool
+
+
+class GCS_Batch_Runner(object):
+    '''
+        Runs the jobs of a JSONL stream concurrently and writes a JSONL
+        result stream.
+        Attributes:
+            commands: The object that performs the operations (GCS_Command).
+            max_in_flight: The maximum number of operations in progress.
+            retries: How many times a failed operation is repeated.
+    '''
+
+    def __init__(self, commands, max_in_flight=config.TRANSFER_CONCURRENCY,
+                 retries=config.TRANSFER_RETRIES):
+        '''
+            Initializes GCS_Batch_Runner.
+            @param commands: The object that performs the operations.
+            @param max_in_flight: The maximum number of operations in progress.
+            @param retries: How many times a failed operation is repeated.
+        '''
+        self.commands = commands
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+
+        self.operations = {'upload' : self._upload,
+                           'download' : self._download,
+                           'copy' : self._copy,
+                           'delete' : self._delete,
+                           'set-acl' : self._set_acl,
+                           'head' : self._head}
+
+
+    def _upload(self, job):
+        '''
+            Uploads the local file src into the object dst.
+            @return: The number of bytes and the extra result items.
+        '''
+        bucket_name, object_name = self.commands._split_object_path(job['dst'])
+        self.commands._put_object(job['src'], bucket_name, object_name,
+                                  job.get('acl', 'private'))
+        return os.path.getsize(job['src']), {}
+
+
+    def _download(self, job):
+        '''
+            Downloads the object src into the local file dst.
+            @return: The number of bytes and the extra result items.
+        '''
+        bucket_name, object_name = self.commands._split_object_path(job['src'])
+        self.commands._get_object_to_file(bucket_name, object_name,
+                                          os.path.abspath(job['dst']))
+        return os.path.getsize(job['dst']), {}
+
+
+    def _copy(self, job):
+        '''
+            Copies the object src into the object dst.
+            @return: The number of bytes and the extra result items.
+        '''
+        bucket_name, object_name = self.commands._split_object_path(job['src'])
+        target_bucket_name, target_object_name = \
+                self.commands._split_object_path(job['dst'])
+        self.commands._copy_object(bucket_name, object_name,
+                                   target_bucket_name, target_object_name or object_name,
+                                   job.get('acl', 'private'))
+        return 0, {}
+
+
+    def _delete(self, job):
+        '''
+            Deletes the object src.
+            @return: The number of bytes and the extra result items.
+        '''
+        bucket_name, object_name = self.commands._split_object_path(job['src'])
+        self.commands._delete_object(bucket_name, object_name)
+        return 0, {}
+
+
+    def _set_acl(self, job):
+        '''
+            Grants the permission on the object src to the e-mail.
+            @return: The number of bytes and the extra result items.
+        '''
+        bucket_name, object_name = self.commands._split_object_path(job['src'])
+        self.commands._put_object_email_acl(bucket_name, object_name,
+                                            job.get('permission', 'READ'),
+                                            job.get('scope', 'UserByEmail'),
+                                            job['email'])
+        return 0, {}
+
+
+    def _head(self, job):
+        '''
+            Gets the metadata of the object src.
+            @return: The number of bytes and the extra result items.
+        '''
+        bucket_name, object_name = self.commands._split_object_path(job['src'])
+        response, metadata = self.commands._head_object(bucket_name, object_name)
+        return 0, {'size' : metadata.size,
+                   'etag' : metadata.etag,
+                   'generation' : metadata.generation,
+                   'last_modified' : metadata.last_modified}
+
+
+    def _read_jobs(self, job_file):
+        '''
+            Reads the jobs of the JSONL stream.
+            @param job_file: The file object of the job stream.
+            @return: A generator of job dictionaries. A line that cannot be
+            decoded produces a job with an error item.
+        '''
+        line_number = 0
+        for line in job_file:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError('A job must be a JSON object.')
+            except ValueError, e:
+                job = {'error' : 'Invalid job: %s' % e}
+            job.setdefault('id', line_number)
+            yield job
+
+
+    def _run_job(self, job):
+        '''
+            Performs one job.
+            @param job: The job dictionary.
+            @return: The number of bytes and the extra result items.
+            @note: The start of the first attempt and the end of the last one
+            are recorded in the job, to compute the latency.
+        '''
+        job.setdefault('_start', time.time())
+        try:
+            if 'error' in job:
+                raise ValueError(job['error'])
+            if job.get('op') not in self.operations:
+                raise ValueError('Unknown operation: %s' % job.get('op'))
+            return self.operations[job['op']](job)
+        finally:
+            job['_end'] = time.time()
+
+
+    def run(self, job_file, result_file):
+        '''
+            Performs the jobs and writes their results.
+            @param job_file: The file object of the JSONL job stream.
+            @param result_file: The file object of the JSONL result stream.
+            @return: The number of jobs that failed.
+            @note: The results are written in completion order, as soon as
+            each job completes.
+        '''
+        failed = 0
+        pool = GCS_Worker_Pool(self.max_in_flight, self.retries)
+        for job, result, error, attempts in pool.imap_unordered(
+                                                self._run_job, self._read_jobs(job_file)):
+            record = {'id' : job['id'],
+                      'op' : job.get('op'),
+                      'attempts' : attempts,
+                      'latency_ms' : round((job['_end'] - job['_start']) * 1000.0, 3)}
+            if error is None:
+                nbytes, extra = result
+                record['status'] = 'ok'
+                record['bytes'] = nbytes
+                record.update(extra)
+            else:
+                failed += 1
+                record['status'] = 'error'
+                record['bytes'] = 0
+                record['error'] = str(error)
+                if isinstance(error, err):
+                    record['http_status'] = error.status
+
+            result_file.write(json.dumps(record, sort_keys=True) + '\n')
+            result_file.flush()
+
+        return failed
@@ -6,13 +6,16 @@
 
 __author__ = 'mielem@gmail.com'
 
+import time
+import urllib
+
 import config 
 from command_utilities import GCS_Command_Utility
 from command_utilities import GCS_Error as err
+from xml_responses import GCS_List_Parser, GCS_Prefix_Entry
+from xml_responses import parse_bucket_list, parse_cors, parse_location
 
 
-GCS_END_POINT = 'storage.googleapis.com'
-
 BUCKET_ACLS = ('private', 'public-read', 
                'public-read-write', 'authenticated-read',
                'bucket-owner-read', 'bucket-owner-full-control')
@@ -24,6 +27,9 @@ DEFAULT_X_ORIGINS = '*'
 DEFAULT_RESPONSE_HEADER = 'GCS-Demo'
 DEFAULT_MAX_AGE_SECS = 1800
 
+# The format of the listing modification times.
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 
 class GCS_Bucket(GCS_Command_Utility):
     '''
@@ -45,7 +51,7 @@ class GCS_Bucket(GCS_Command_Utility):
         '''
     
         try:
-            url = GCS_END_POINT
+            url = config.GCS_END_POINT
             response, content = self._api_request(url)
         except err:   
             raise
@@ -54,29 +60,109 @@ class GCS_Bucket(GCS_Command_Utility):
         self._display_response(response, content)
         
     
+    def iter_buckets(self):
+        '''
+            Lists the buckets contained in a project.
+            @return: A generator of GCS_Bucket_Metadata records.
+            @raise err: The GCS_Error exception if the API request failed.
+        '''
+        response, stream = self._api_stream_request(config.GCS_END_POINT)
+        try:
+            for entry in parse_bucket_list(stream):
+                yield entry
+        finally:
+            stream.close()
+        
+    
     def list_objects(self):
         '''
             Lists the objects contained in a bucket.
             User input:
                 bucket_name: The name of the bucket that contains the objects.
+                prefix: Lists only the objects whose names start with the prefix.
+                delimiter: Groups the names that contain the delimiter after 
+                the prefix.
             @raise err: The GCS_Error exception if the API request failed.
-            @note: Performs a GET request. 
+            @note: Performs a GET request for each page of the listing. 
         '''
  
         bucket_name = raw_input("Bucket name: ")
+        prefix = raw_input("Prefix. Enter for all the objects: ")
+        delimiter = raw_input("Delimiter (such as /). Enter for none: ")
         print 'List objects contained in the bucket "%s".' % bucket_name
        
+        count = 0
         try:
-             # Assign URL in the format: [bucket_name].storage.googleapis.com
-            url = '%s.%s/' % (bucket_name, GCS_END_POINT)
-            # Assign HTTP verb.
-            method = 'GET'
-            # Perform API call.
-            response, content = self._api_request(url, method)
+            for entry in self.iter_objects(bucket_name, prefix, delimiter):
+                if isinstance(entry, GCS_Prefix_Entry):
+                    print '%s' % entry.prefix
+                else:
+                    print '%12d  %s  %s' % (entry.size, 
+                                            time.strftime(TIME_FORMAT, 
+                                                          time.gmtime(entry.last_modified or 0)),
+                                            entry.key)
+                count += 1
         except err:  
             raise
-           
-        self._display_response(response, content)
+        
+        print '%d entries.' % count
+    
+    
+    def iter_objects(self, bucket_name, prefix=None, delimiter=None, 
+                     max_keys=config.LIST_PAGE_SIZE, marker=None):
+        '''
+            Lists the objects contained in a bucket, following the pages 
+            of the listing.
+            @param bucket_name: The name of the bucket that contains the objects.
+            @param prefix: Lists only the objects whose names start with the prefix.
+            @param delimiter: Groups the names that contain the delimiter after
+            the prefix into a single common prefix entry.
+            @param max_keys: The maximum number of entries of each page.
+            @param marker: Lists only the objects whose names follow the marker.
+            @return: A generator of GCS_Object_Metadata records and, when a 
+            delimiter is used, GCS_Prefix_Entry records.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a GET request for each page. Each page is read 
+            and parsed completely before its entries are yielded, so a slow 
+            consumer does not hold a connection open. A page whose read 
+            fails is requested again from the same marker, according to 
+            retry_policy.
+        '''
+        while True:
+            query = {}
+            if prefix:
+                query['prefix'] = prefix
+            if delimiter:
+                query['delimiter'] = delimiter
+            if max_keys:
+                query['max-keys'] = max_keys
+            if marker:
+                query['marker'] = marker
+            
+            # Assign URL in the format: [bucket_name].storage.googleapis.com/?[query]
+            url = '%s.%s/' % (bucket_name, config.GCS_END_POINT)
+            if query:
+                url = '%s?%s' % (url, urllib.urlencode(sorted(query.items())))
+            
+            def read_page():
+                # Parse the page while it is read from the connection.
+                response, stream = self._api_stream_request(url, 'GET')
+                try:
+                    page = GCS_List_Parser(stream)
+                    return page, list(page)
+                finally:
+                    stream.close()
+            
+            page, entries = self.retry_policy.call(read_page, 'GET')
+            for entry in entries:
+                yield entry
+            
+            if not page.is_truncated:
+                break
+            
+            # NextMarker is only returned when a delimiter is used; 
+            # otherwise, the listing continues after the last key.
+            marker = page.next_marker or page.last_name
     
                 
     def get_bucket_cors(self):
@@ -94,19 +180,38 @@ class GCS_Bucket(GCS_Command_Utility):
         print 'Get bucket "%s" CORS.' % bucket_name
        
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.
-            # Also specify the cors query string parameter.
-            url = '%s.%s/?cors' % (bucket_name, GCS_END_POINT)
-            # Assign HTTP verb.
-            method = 'GET'
-            # Perform API call.
-            response, content = self._api_request(url, method)
+            response, content = self._get_bucket_cors(bucket_name)
         except err:  
             raise
            
         self._display_response(response, content)
     
 
+    def _get_bucket_cors(self, bucket_name):
+        '''
+            Gets the CORS document of a bucket.
+            @param bucket_name: The name of the bucket.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a GET request, unless the response is cached.
+        '''
+        # Define URL in the format: [bucket_name].storage.googleapis.com.
+        # Also specify the cors query string parameter.
+        url = '%s.%s/?cors' % (bucket_name, config.GCS_END_POINT)
+        return self._cached_api_request((bucket_name, None, 'cors'), url)
+    
+
+    def _fetch_bucket_cors(self, bucket_name):
+        '''
+            Gets the CORS of a bucket.
+            @param bucket_name: The name of the bucket.
+            @return: A list of GCS_Cors records.
+            @raise err: The GCS_Error exception if the API request failed.
+        '''
+        response, content = self._get_bucket_cors(bucket_name)
+        return parse_cors(content)
+    
+
     def set_bucket_cors(self):
         '''
             Sets a bucket Cross Domain Origins
@@ -128,36 +233,31 @@ class GCS_Bucket(GCS_Command_Utility):
         
         
         # Get cross origins 
-        xorigins = {}
         xorigins = raw_input("Cross origins. Enter for default value %s: " 
                              % DEFAULT_X_ORIGINS)
         
-        if not xorigins:
+        if not xorigins.strip():
             # Assign default value.
             xorigins = DEFAULT_X_ORIGINS
         
-        # Get cross origins 
-        methods = {}
+        origins = [origin.strip() for origin in xorigins.split(',')]
+        
+        # Get cross origins methods
         methods_selection = raw_input(
-                                "Cross origins methods. Separate methods with comma. Enter for default value %s: " 
-                                % config.DEFAULT_METHOD)
+                                "Cross origins methods. Separate methods with comma. "
+                                "Enter for default value %s: " % config.DEFAULT_METHOD)
      
-        if not methods_selection:
+        if not methods_selection.strip():
             # Assign default value.
             methods_selection = config.DEFAULT_METHOD
         
-        i = 0
-        for verb in methods_selection.split(','):
-            methods[i] = verb
-            i = i+1
-
+        methods = [verb.strip() for verb in methods_selection.split(',')]
         
         # Get response headers
-        response_headers = {}
         response_headers_selection = raw_input("Response headers. Enter for default value %s: " 
                                      % DEFAULT_RESPONSE_HEADER)
         
-        if not response_headers:
+        if not response_headers_selection.strip():
             # Assign default value.
             response_headers_selection = DEFAULT_RESPONSE_HEADER
             
@@ -166,30 +266,39 @@ class GCS_Bucket(GCS_Command_Utility):
         max_age_secs = raw_input("Max age in seconds. Enter for default value %s: " 
                                      % DEFAULT_MAX_AGE_SECS)
        
-       
         if not max_age_secs.strip():
-        # Assign default value.
+            # Assign default value.
             max_age_secs = DEFAULT_MAX_AGE_SECS
-            
-        # Get bucket location
-        body = None
-        body = self._get_cors_body(xorigins, methods, response_headers, max_age_secs)
-        
         
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.
-            url = '%s.%s/?cors' % (bucket_name, GCS_END_POINT)
-            # Assign HTTP verb.
-            method = 'PUT'
-            # Perform API call.
-            response, content = self._api_request(url, method,  body=body)
-           
+            response, content = self._put_bucket_cors(bucket_name, origins, methods,
+                                                      response_headers, int(max_age_secs))
         except err:
             raise
         
         self._display_response(response, content)
         
  
+    def _put_bucket_cors(self, bucket_name, origins, methods, response_headers, 
+                         max_age_secs=DEFAULT_MAX_AGE_SECS):
+        '''
+            Sets the CORS of a bucket.
+            @param bucket_name: The name of the bucket.
+            @param origins: List of string origins.
+            @param methods: List of string methods (GET, POST, etc).
+            @param response_headers: List of string response headers.
+            @param max_age_secs: Maximum age in seconds.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+        '''
+        body = self._get_cors_body(origins, methods, response_headers, max_age_secs)
+        url = '%s.%s/?cors' % (bucket_name, config.GCS_END_POINT)
+        try:
+            return self._api_request(url, 'PUT', body=body)
+        finally:
+            self.metadata_cache.invalidate(bucket_name)
+        
+ 
     def get_bucket_location(self):
         '''
             Gets a bucket location.
@@ -209,13 +318,7 @@ class GCS_Bucket(GCS_Command_Utility):
         print 'Get bucket "%s" location.' % bucket_name
        
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.
-            # Also specify the location query string parameter.
-            url = '%s.%s/?location' % (bucket_name, GCS_END_POINT)
-            # Assign HTTP verb.
-            method = 'GET'
-            # Perform API call.
-            response, content = self._api_request(url, method)
+            response, content = self._get_bucket_location(bucket_name)
  
         except err:  
             raise
@@ -223,6 +326,31 @@ class GCS_Bucket(GCS_Command_Utility):
         self._display_response(response, content)
                 
 
+    def _get_bucket_location(self, bucket_name):
+        '''
+            Gets the location document of a bucket.
+            @param bucket_name: The name of the bucket.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a GET request, unless the response is cached.
+        '''
+        # Define URL in the format: [bucket_name].storage.googleapis.com.
+        # Also specify the location query string parameter.
+        url = '%s.%s/?location' % (bucket_name, config.GCS_END_POINT)
+        return self._cached_api_request((bucket_name, None, 'location'), url)
+                
+
+    def _fetch_bucket_location(self, bucket_name):
+        '''
+            Gets the location of a bucket.
+            @param bucket_name: The name of the bucket.
+            @return: The location string, such as US or EU.
+            @raise err: The GCS_Error exception if the API request failed.
+        '''
+        response, content = self._get_bucket_location(bucket_name)
+        return parse_location(content)
+                
+
     def create_bucket(self):
         '''
             Creates a bucket and inserts it in a project. 
@@ -279,11 +407,13 @@ class GCS_Bucket(GCS_Command_Utility):
         body = self._get_location_xml(bucket_location)
         
         try:
-            url = '%s.%s' % (bucket_name, GCS_END_POINT)
+            url = '%s.%s' % (bucket_name, config.GCS_END_POINT)
             method = 'PUT'
             response, content = self._api_request(
                                     url, method,
                                     headers=headers, body=body)
+            # Drop what was cached about a former bucket with this name.
+            self.metadata_cache.invalidate_bucket(bucket_name)
             print 'Bucket %s created.' % bucket_name
         except err:
             raise
@@ -296,6 +426,7 @@ class GCS_Bucket(GCS_Command_Utility):
             Deletes the given bucket.
             User input:
                 bucket_name: The name of the bucket to delete.
+                empty: Whether to delete the objects in the bucket first.
             @raise error: The GCS_Error exception if the API request failed.
         '''
         
@@ -311,10 +442,19 @@ class GCS_Bucket(GCS_Command_Utility):
             delete = raw_input("Enter [yes | no]: ").strip()
         
         if delete == 'yes':
+            print "Delete all the objects in the bucket first?: "
+            empty = ''
+            while empty != 'yes' and empty != 'no':
+                empty = raw_input("Enter [yes | no]: ").strip()
+            
             try:
-                url = '%s.%s' % (bucket_name, GCS_END_POINT)
-                method = 'DELETE'
-                response, content = self._api_request(url, method)
+                if empty == 'yes':
+                    report, response, content = self.empty_and_delete_bucket(bucket_name)
+                    if response is None:
+                        print "Bucket %s not deleted." % bucket_name
+                        return
+                else:
+                    response, content = self._delete_bucket(bucket_name)
                 print "Bucket %s deleted." % bucket_name
             except err:
                 raise
@@ -322,4 +462,48 @@ class GCS_Bucket(GCS_Command_Utility):
             
         else:
             print "Bucket %s not deleted. Bye!" % bucket_name
-  
\ No newline at end of file
+    
+    
+    def _delete_bucket(self, bucket_name):
+        '''
+            Deletes an empty bucket.
+            @param bucket_name: The name of the bucket to delete.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a DELETE request.
+        '''
+        url = '%s.%s' % (bucket_name, config.GCS_END_POINT)
+        try:
+            return self._api_request(url, 'DELETE')
+        finally:
+            self.metadata_cache.invalidate_bucket(bucket_name)
+    
+    
+    def empty_and_delete_bucket(self, bucket_name, 
+                                concurrency=config.DELETE_CONCURRENCY,
+                                retries=config.TRANSFER_RETRIES, dry_run=False,
+                                max_rate=config.DELETE_MAX_RATE):
+        '''
+            Deletes all the objects in a bucket, then the bucket, without 
+            user interaction.
+            @param bucket_name: The name of the bucket to delete.
+            @param concurrency: The number of parallel DELETE requests.
+            @param retries: How many times a failed DELETE is repeated.
+            @param dry_run: If True, lists the objects that would be deleted 
+            and deletes nothing.
+            @param max_rate: The maximum number of DELETE requests per second.
+            @return: The GCS_Transfer_Report of the object deletions, and the 
+            response dictionary and string content of the bucket deletion. 
+            The response and content are None if the bucket was not deleted.
+            @raise err: The GCS_Error exception if the bucket deletion failed.
+            @note: The objects are deleted by delete_prefix of GCS_Object, 
+            which GCS_Command inherits. The bucket is kept if any object 
+            could not be deleted.
+        '''
+        report = self.delete_prefix('gs://%s' % bucket_name, concurrency, retries,
+                                    dry_run, max_rate)
+        if dry_run or report.failed:
+            return report, None, None
+        
+        response, content = self._delete_bucket(bucket_name)
+        return report, response, content
@@ -0,0 +1,385 @@
+'''
+    Contains the GCS_Crc32c class which computes CRC32C checksums, the
+    GCS_Digests class which computes the MD5 and CRC32C digests of the
+    data transferred, and the GCS_Hashing_File class which computes them
+    while a file is read for upload.
+    @note: The service reports the digests of an object in the x-goog-hash
+    header, as base64 values (crc32c=...,md5=...). Composite objects have a
+    CRC32C digest only. The digests are updated chunk by chunk while the
+    data streams, so verifying a transfer never reads a file twice.
+    CRC32C uses the crc32c or crcmod C extension when one is installed,
+    and a table-driven implementation otherwise. The table-driven one
+    runs at about 17 MB/s, so without an extension the downloads that can
+    only be checked with CRC32C (composite objects) are not verified,
+    unless config.VERIFY_PYTHON_CRC32C is set.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import base64
+import hashlib
+import logging
+import re
+import struct
+
+# Local imports
+import config
+
+
+def _make_crc32c_table():
+    '''
+        @return: The CRC32C (Castagnoli, reflected polynomial 0x82F63B78)
+        value of each byte.
+    '''
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0x82F63B78
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+_CRC32C_TABLE = _make_crc32c_table()
+
+
+def _crc32c_python(data, crc=0):
+    '''
+        Extends a CRC32C checksum with table lookups.
+        @param data: The string of the next bytes.
+        @param crc: The checksum of the previous bytes.
+        @return: The checksum of the previous bytes and data.
+    '''
+    table = _CRC32C_TABLE
+    crc ^= 0xFFFFFFFF
+    for byte in bytearray(data):
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+# The CRC32C function, with the same signature as _crc32c_python, and
+# whether it is a C extension.
+try:
+    import crc32c as _crc32c_module
+    _crc32c = _crc32c_module.crc32c
+    CRC32C_NATIVE = True
+except ImportError:
+    try:
+        import crcmod.crcmod
+        import crcmod.predefined
+        _crc32c = crcmod.predefined.mkPredefinedCrcFun('crc-32c')
+        CRC32C_NATIVE = bool(getattr(crcmod.crcmod, '_usingExtension', False))
+    except ImportError:
+        _crc32c = _crc32c_python
+        CRC32C_NATIVE = False
+
+if not CRC32C_NATIVE:
+    # The pure Python crcmod is not faster than the table above.
+    _crc32c = _crc32c_python
+
+
+# The algorithms of the x-goog-hash header.
+HASH_ALGORITHMS = ('crc32c', 'md5')
+
+# An ETag that holds the hexadecimal MD5 digest of a non-composite object.
+_MD5_ETAG = re.compile(r'^"?([0-9a-fA-F]{32})"?$')
+
+# Whether the downloads left unverified without a CRC32C extension were
+# reported.
+_crc32c_warned = False
+
+
+def _gf2_matrix_times(matrix, vector):
+    '''
+        @return: The product of a 32x32 matrix over GF(2) and a vector.
+    '''
+    total = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return total
+
+
+def _gf2_matrix_square(matrix):
+    '''
+        @return: The square of a 32x32 matrix over GF(2).
+    '''
+    return [_gf2_matrix_times(matrix, matrix[index]) for index in range(32)]
+
+
+def crc32c_combine(crc1, crc2, length2):
+    '''
+        Combines the checksums of two consecutive blocks of data, as
+        crc32_combine of zlib.
+        @param crc1: The CRC32C of the first block.
+        @param crc2: The CRC32C of the second block.
+        @param length2: The number of bytes of the second block.
+        @return: The CRC32C of the two blocks concatenated.
+        @note: The cost depends on log2(length2), not on the data, so the 
+        checksum of an object can be computed from those of its parts.
+    '''
+    if length2 <= 0:
+        return crc1
+    # The operator that appends one zero bit, then 2 and 4 zero bits.
+    odd = [0x82F63B78] + [1 << index for index in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    # Append length2 zero bytes to crc1, one bit of length2 at a time.
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+    return crc1 ^ crc2
+
+
+def decode_crc32c(value):
+    '''
+        @param value: The base64 crc32c value of an x-goog-hash header.
+        @return: The checksum as an integer.
+    '''
+    return struct.unpack('>I', base64.b64decode(value))[0]
+
+
+def can_verify_crc32c():
+    '''
+        Checks if the data can be verified with CRC32C at a useful speed.
+        @return: True if a C extension is installed or 
+        config.VERIFY_PYTHON_CRC32C is set; otherwise, False, after a 
+        warning the first time.
+    '''
+    global _crc32c_warned
+    if CRC32C_NATIVE or config.VERIFY_PYTHON_CRC32C:
+        return True
+    if not _crc32c_warned:
+        _crc32c_warned = True
+        logging.warning('Downloads with a CRC32C digest only (composite objects) are not '
+                        'verified: install crc32c or crcmod, or set VERIFY_PYTHON_CRC32C.')
+    return False
+
+
+class GCS_Crc32c(object):
+    '''
+        Computes a CRC32C checksum incrementally, with the interface of the
+        hashlib objects.
+    '''
+
+    def __init__(self, data=''):
+        '''
+            Initializes GCS_Crc32c.
+            @param data: The first bytes.
+        '''
+        self._crc = 0
+        if data:
+            self.update(data)
+
+    @property
+    def value(self):
+        '''
+            @return: The checksum as an integer.
+        '''
+        return self._crc
+
+    def update(self, data):
+        '''
+            @param data: The string of the next bytes.
+        '''
+        self._crc = _crc32c(data, self._crc)
+
+    def digest(self):
+        '''
+            @return: The 4 byte big-endian checksum.
+        '''
+        return struct.pack('>I', self._crc)
+
+    def hexdigest(self):
+        '''
+            @return: The checksum as hexadecimal string.
+        '''
+        return '%08x' % self._crc
+
+
+def get_default_algorithms():
+    '''
+        @return: The algorithms computed on upload. MD5 is always computed,
+        since hashlib is fast; CRC32C only when a C extension is installed.
+    '''
+    if CRC32C_NATIVE:
+        return HASH_ALGORITHMS
+    return ('md5',)
+
+
+def parse_hash_header(response):
+    '''
+        Reads the digests reported by the service.
+        @param response: The response dictionary.
+        @return: Dictionary of the algorithm names and base64 digests.
+        @note: The ETag of a non-composite object is its MD5 digest, so it
+        is used when there is no x-goog-hash header.
+    '''
+    hashes = {}
+    # Repeated x-goog-hash headers are joined with commas.
+    for item in (response.get('x-goog-hash') or '').split(','):
+        name, separator, value = item.strip().partition('=')
+        if separator and name in HASH_ALGORITHMS:
+            hashes[name] = value
+
+    match = _MD5_ETAG.match(response.get('etag') or '')
+    if 'md5' not in hashes and 'crc32c' not in hashes and match:
+        hashes['md5'] = base64.b64encode(match.group(1).decode('hex'))
+    return hashes
+
+
+class GCS_Digests(object):
+    '''
+        Computes the digests of transferred data.
+        Attributes:
+            algorithms: The names of the algorithms computed.
+    '''
+
+    def __init__(self, algorithms=HASH_ALGORITHMS):
+        '''
+            Initializes GCS_Digests.
+            @param algorithms: The names of the algorithms to compute,
+            md5 and/or crc32c.
+        '''
+        self.algorithms = tuple(algorithms)
+        self._hashes = []
+        for name in self.algorithms:
+            if name == 'crc32c':
+                self._hashes.append((name, GCS_Crc32c()))
+            else:
+                self._hashes.append((name, hashlib.new(name)))
+
+    @classmethod
+    def for_response(cls, response):
+        '''
+            Creates the digests to verify a download against.
+            @param response: The response dictionary of the download.
+            @return: A GCS_Digests of one algorithm reported by the service
+            (MD5 if possible, since it is faster), or None if the response
+            cannot be verified. A CRC32C digest alone is used only if 
+            can_verify_crc32c.
+            @note: An object stored compressed and served decompressed
+            does not match the digests of the stored data.
+        '''
+        stored_encoding = response.get('x-goog-stored-content-encoding')
+        if (stored_encoding and stored_encoding != 'identity' and
+                response.get('content-encoding') != stored_encoding):
+            return None
+        hashes = parse_hash_header(response)
+        if 'md5' in hashes:
+            return cls(('md5',))
+        if 'crc32c' in hashes and can_verify_crc32c():
+            return cls(('crc32c',))
+        return None
+
+    def update(self, data):
+        '''
+            @param data: The string of the next bytes.
+        '''
+        for name, digest in self._hashes:
+            digest.update(data)
+
+    def b64digests(self):
+        '''
+            @return: Dictionary of the algorithm names and base64 digests.
+        '''
+        return dict([(name, base64.b64encode(digest.digest()))
+                     for name, digest in self._hashes])
+
+    def get_hash_header(self):
+        '''
+            @return: The x-goog-hash header value, such as
+            crc32c=n03x6A==,md5=XrY7u+Ae7tCTyyK7j1rNww==.
+        '''
+        return ','.join(['%s=%s' % item for item in sorted(self.b64digests().items())])
+
+    def find_mismatch(self, response):
+        '''
+            Compares the digests with the ones reported by the service.
+            @param response: The response dictionary.
+            @return: A message describing the mismatch, or None if the
+            digests match or none can be compared.
+        '''
+        expected = parse_hash_header(response)
+        for name, value in sorted(self.b64digests().items()):
+            if name in expected and expected[name] != value:
+                return '%s mismatch: local %s, service %s.' % (name, value, expected[name])
+        return None
+
+
+class GCS_Hashing_File(object):
+    '''
+        Wraps a file opened for reading and updates a GCS_Digests with its
+        bytes, each byte once and in order.
+        Attributes:
+            digests: The GCS_Digests of the bytes from start to hashed_offset.
+            hashed_offset: The position up to which the bytes are hashed.
+        @note: The bytes read again, after a seek back for a repeated
+        request, are not hashed twice. The reads must not skip bytes
+        beyond hashed_offset.
+    '''
+
+    def __init__(self, file, digests, start=0):
+        '''
+            Initializes GCS_Hashing_File.
+            @param file: The file object opened in binary mode.
+            @param digests: The GCS_Digests to update.
+            @param start: The position of the first byte to hash.
+        '''
+        self.digests = digests
+        self.hashed_offset = start
+        self._file = file
+        self._position = file.tell()
+
+    def read(self, size=-1):
+        '''
+            Reads from the file and hashes the bytes not yet hashed.
+            @param size: The maximum number of bytes to read.
+            @return: The string read.
+            @raise ValueError: If the read skipped bytes not yet hashed.
+        '''
+        data = self._file.read(size)
+        end = self._position + len(data)
+        if end > self.hashed_offset:
+            if self._position > self.hashed_offset:
+                raise ValueError('Bytes %d-%d were not hashed.' % (
+                                    self.hashed_offset, self._position - 1))
+            self.digests.update(data[self.hashed_offset - self._position:])
+            self.hashed_offset = end
+        self._position = end
+        return data
+
+    def seek(self, position, whence=0):
+        '''
+            Moves to a position, as file.seek.
+        '''
+        self._file.seek(position, whence)
+        self._position = self._file.tell()
+
+    def tell(self):
+        '''
+            @return: The current position.
+        '''
+        return self._position
+
+    def fileno(self):
+        '''
+            @return: The descriptor of the file, to get its size.
+        '''
+        return self._file.fileno()
@@ -4,14 +4,41 @@
     Also it contains the GCS_Error class to handle HTTP request errors.
 '''
 import config
+import os
 import re
-import httplib2
-import xml.dom.minidom as md
+import socket
+import threading
+import time
 import xml.etree.ElementTree as xml
+from xml.parsers.expat import ExpatError
+
+from connection_pool import get_body_position
+from flow_control import GCS_Flow_Controller
+from content_cache import GCS_Content_Cache
+from metadata_cache import GCS_Metadata_Cache
+from metrics import metrics
+from retry_policy import GCS_Retry_Policy
+from xml_responses import parse_error
 
 # Define constants.
 XML_API_DEFAULT_VERSION = '2'
-HTTP_ERROR_LEVEL = '300'
+HTTP_ERROR_LEVEL = 300
+NOT_FOUND = 404
+UNAUTHORIZED = 401
+
+
+def _make_response(response):
+    '''
+        Converts an httplib response to the response dictionary returned 
+        by the commands.
+        @param response: The httplib response.
+        @return: The httplib2.Response, with the lowercase header names.
+        @note: httplib2 is imported at the first response, so it does not
+        slow down the startup.
+    '''
+    import httplib2
+    return httplib2.Response(response)
+
   
 class GCS_Command_Utility(object):
     '''
@@ -20,21 +47,221 @@ class GCS_Command_Utility(object):
         with the user.
     '''
   
-    def _api_request(self, url, method=None, headers=None, body=None):
+    # The retry policy of the API requests.
+    retry_policy = GCS_Retry_Policy()
+    # The rate and concurrency budgets of the bucket hosts.
+    flow_controller = GCS_Flow_Controller()
+    # The recent HEAD, ACL, CORS and location responses.
+    metadata_cache = GCS_Metadata_Cache()
+    # The copies of the downloaded objects on the local disk.
+    content_cache = GCS_Content_Cache()
+    # Serializes the authentication of the first concurrent requests.
+    _auth_lock = threading.Lock()
+  
+    def _api_request(self, url, method=None, headers=None, body=None, 
+                     ok_statuses=(), retry_safe=None):
         '''
             Sends an authorized HTTP request to Google Cloud Storage 
             using XML API.
             @param url: The API URL endpoint.
             @param method: The HTTP request method (GET, POST, etc).
             @param headers: Any additional headers to send.
-            @param body: The request body.
+            @param body: The request body. It can be a string, a file-like 
+            object or an iterator of strings. File-like objects and iterators 
+            are sent in chunks of config.TRANSFER_CHUNK_SIZE bytes.
+            @param ok_statuses: The HTTP statuses above HTTP_ERROR_LEVEL that 
+            must not raise an error (for example 308 for resumable uploads).
+            @param retry_safe: True to repeat a non idempotent request on 
+            transient errors, False to never repeat it, None to repeat 
+            idempotent requests only.
         
             @return: The response dictionary and string content.
             @raise exception: GCS_Error if the API request did not succeed.
+            @note: Transient errors are retried according to retry_policy.
+            Each attempt waits for the budget of the host in flow_controller.
+        '''
+        if not method: 
+            method = config.DEFAULT_METHOD
+        
+        self._ensure_authenticated()
+        headers = self._get_request_headers(method, headers, body)
+        absolute_url = self._get_absolute_url(url)
+
+        def attempt():
+            slot = self.flow_controller.acquire(absolute_url)
+            status = None
+            try:
+                response, content = self._send_request(
+                                        absolute_url, method, headers, body)
+                status = response.status
+            except socket.gaierror, se:
+                raise GCS_Error(NOT_FOUND, 'Server not found.')
+            finally:
+                self.flow_controller.release(slot, status)
+
+            if response.status >= HTTP_ERROR_LEVEL and response.status not in ok_statuses:
+                raise self._get_error(response, content)
+            
+            return response, content
+        
+        return self._call_with_retries(attempt, method, body, retry_safe)
+
+    def _api_stream_request(self, url, method=None, headers=None, body=None,
+                            ok_statuses=(), retry_safe=None):
+        '''
+            Sends an authorized HTTP request to Google Cloud Storage 
+            using XML API, without reading the response body.
+            @param url: The API URL endpoint.
+            @param method: The HTTP request method (GET, POST, etc).
+            @param headers: Any additional headers to send.
+            @param body: The request body, as in _api_request.
+            @param ok_statuses: The HTTP statuses above HTTP_ERROR_LEVEL that 
+            must not raise an error.
+            @param retry_safe: As in _api_request.
+        
+            @return: The response dictionary and the GCS_Response_Stream 
+            to read the body from. The caller must close the stream.
+            @raise exception: GCS_Error if the API request did not succeed.
+            @note: Only the request is retried. An error while the body is
+            read is raised to the caller. The host budget of flow_controller
+            is held until the response headers are received.
         '''
         if not method: 
             method = config.DEFAULT_METHOD
         
+        self._ensure_authenticated()
+        headers = self._get_request_headers(method, headers, body)
+        absolute_url = self._get_absolute_url(url)
+
+        def attempt():
+            slot = self.flow_controller.acquire(absolute_url)
+            status = None
+            try:
+                stream = self._open_request(absolute_url, method, headers, body)
+                status = stream.response.status
+            except socket.gaierror, se:
+                raise GCS_Error(NOT_FOUND, 'Server not found.')
+            finally:
+                self.flow_controller.release(slot, status)
+            
+            response = _make_response(stream.response)
+            if response.status >= HTTP_ERROR_LEVEL and response.status not in ok_statuses:
+                # Read the (short) error body so the connection can be reused.
+                try:
+                    content = stream.read()
+                finally:
+                    stream.close()
+                raise self._get_error(response, content)
+            
+            return response, stream
+        
+        return self._call_with_retries(attempt, method, body, retry_safe)
+
+    def _ensure_authenticated(self):
+        '''
+            Authenticates the application before its first API request.
+            @note: _authenticate is provided by GCS_Command. The credentials 
+            may also be set in config.app_data beforehand, in which case
+            _authenticate is not needed.
+        '''
+        if (config.app_data['credentials'] is not None and 
+                config.app_data['project_id'] is not None):
+            return
+        with self._auth_lock:
+            if (config.app_data['credentials'] is None or 
+                    config.app_data['project_id'] is None):
+                self._authenticate()
+
+    def _call_with_retries(self, attempt, method, body, retry_safe):
+        '''
+            Sends a request according to retry_policy.
+            @param attempt: The function that sends the request once.
+            @param method: The HTTP request method.
+            @param body: The request body.
+            @param retry_safe: As in _api_request.
+            @return: The result of attempt.
+            @note: A string body can always be sent again, and a file-like
+            body is rewound to its initial position. An iterator body cannot
+            be sent again, so the request is not retried.
+        '''
+        body_position = get_body_position(body)
+        replayable = (body is None or isinstance(body, basestring) or 
+                      body_position is not None)
+        
+        def rewind():
+            if body_position is not None:
+                body.seek(body_position)
+        
+        return self.retry_policy.call(attempt, method, replayable, retry_safe, rewind)
+
+    def _cached_api_request(self, cache_key, url, method='GET'):
+        '''
+            Sends a metadata request, unless its response is in metadata_cache.
+            @param cache_key: The (bucket, object, subresource) tuple. The 
+            object is None for a bucket subresource.
+            @param url: The API URL endpoint.
+            @param method: The HTTP request method (GET or HEAD).
+            @return: The response dictionary and string content.
+            @raise exception: GCS_Error if the API request did not succeed.
+            @note: Only successful responses are cached. The write operations
+            invalidate the entries of the objects and buckets they change.
+        '''
+        found, value = self.metadata_cache.get(cache_key)
+        if found:
+            return value
+        
+        value = self._api_request(url, method)
+        self.metadata_cache.put(cache_key, value)
+        return value
+
+    def _get_error(self, response, content):
+        '''
+            Creates the exception for a failed API request.
+            @param response: The response dictionary.
+            @param content: The response body.
+            @return: A GCS_Error with the error code and message returned 
+            by the service, or with the HTTP reason if the body is not an 
+            XML API error.
+        '''
+        details = parse_error(content)
+        if details is None:
+            error = GCS_Error(response.status, response.reason)
+        else:
+            error = GCS_Error(response.status, details.message or response.reason, 
+                              details.code)
+        error.retry_after = response.get('retry-after')
+        return error
+
+    def _get_absolute_url(self, url):
+        '''
+            Adds the scheme to an API URL endpoint.
+            @param url: The API URL endpoint, such as 
+            [bucket_name].storage.googleapis.com/[object_name], or an 
+            absolute URL returned by the service (for example a resumable 
+            upload session URI).
+            @return: The absolute URL.
+            @note: When config.GCS_PATH_STYLE is set, the bucket name moves
+            from the host to the path, as in 
+            storage.googleapis.com/[bucket_name]/[object_name].
+        '''
+        if url.startswith('http://') or url.startswith('https://'):
+            return url
+        
+        if config.GCS_PATH_STYLE:
+            host, separator, path = url.partition('/')
+            suffix = '.' + config.GCS_END_POINT
+            if host.endswith(suffix):
+                url = '%s/%s/%s' % (config.GCS_END_POINT, host[:-len(suffix)], path)
+        return '%s://%s' % (config.GCS_URL_SCHEME, url)
+
+    def _get_request_headers(self, method, headers, body):
+        '''
+            Assigns the default and the body length headers.
+            @param method: The HTTP request method (GET, POST, etc).
+            @param headers: The headers passed by the caller or None.
+            @param body: The request body.
+            @return: The headers dictionary.
+        '''
         if not headers: 
             headers = {}
             headers['x-goog-project-id'] = config.app_data['project_id']
@@ -44,23 +271,132 @@ class GCS_Command_Utility(object):
 
         if method == 'POST' or method == 'PUT' or body:
             if body:
-                headers['Content-Length'] = '%d' % (len(body))
+                body_length = self._get_body_length(body)
+                if body_length is not None:
+                    headers['Content-Length'] = '%d' % body_length
+                elif 'Content-Length' not in headers or headers['Content-Length'] == '0':
+                    # The size is unknown: send the body in chunks.
+                    headers.pop('Content-Length', None)
+                    headers['Transfer-Encoding'] = 'chunked'
+        
+        return headers
+
+    def _send_request(self, url, method, headers, body):
+        '''
+            Sends an HTTP request through the shared connection pool and 
+            reads the whole response.
+            @param url: The absolute request URL.
+            @param method: The HTTP request method (GET, POST, etc).
+            @param headers: The request headers.
+            @param body: The request body.
+            @return: The httplib2.Response and string content.
+        '''
+        stream = self._open_request(url, method, headers, body)
+        try:
+            content = stream.read()
+        finally:
+            stream.close()
+        
+        return _make_response(stream.response), content
 
+    def _open_request(self, url, method, headers, body):
+        '''
+            Sends an HTTP request through the shared connection pool and 
+            authorizes it with the user's credentials.
+            @param url: The absolute request URL.
+            @param method: The HTTP request method (GET, POST, etc).
+            @param headers: The request headers.
+            @param body: The request body.
+            @return: The GCS_Response_Stream of the response.
+            @note: The access token is refreshed when it expired, or when the 
+            service rejects it, and the request is then sent again once. 
+            A file-like body is rewound before it is sent again. When a
+            token manager is set, it refreshes the token ahead of its expiry.
+        '''
+        credentials = config.app_data['credentials']
+        token_manager = config.app_data.get('token_manager')
+        connection_pool = config.app_data['connection_pool']
+        
+        # Headers without a value (for example an unknown Content-Encoding)
+        # are not sent.
+        request_headers = {}
+        for key, value in headers.items():
+            if value is not None:
+                request_headers[key] = value
+        
+        if token_manager is not None:
+            token_manager.apply(request_headers)
+        else:
+            if credentials.access_token is None or credentials.access_token_expired:
+                credentials.refresh(config.app_data['http_client'])
+            credentials.apply(request_headers)
+        
+        body_position = get_body_position(body)
+        stream = self._open_measured(connection_pool, url, method, request_headers, body)
+        
+        replayable = (body is None or isinstance(body, basestring) or 
+                      body_position is not None)
+        
+        if stream.response.status == UNAUTHORIZED and replayable:
+            stream.read()
+            stream.close()
+            if body_position is not None:
+                body.seek(body_position)
+            if token_manager is not None:
+                # Another thread or process may have replaced the token 
+                # already: it is refreshed only if it is still the same.
+                rejected_token = request_headers['Authorization'].split(' ', 1)[-1]
+                token_manager.refresh(rejected_token)
+                token_manager.apply(request_headers)
+            else:
+                credentials.refresh(config.app_data['http_client'])
+                credentials.apply(request_headers)
+            stream = self._open_measured(connection_pool, url, method, request_headers, body)
+        
+        return stream
 
+    def _open_measured(self, connection_pool, url, method, headers, body):
+        '''
+            Sends an HTTP request through the connection pool and records 
+            it in the metrics.
+            @param connection_pool: The GCS_Connection_Pool.
+            @param url: The absolute request URL.
+            @param method: The HTTP request method.
+            @param headers: The request headers.
+            @param body: The request body.
+            @return: The GCS_Response_Stream of the response. The request is
+            recorded when the stream is closed.
+        '''
+        start_time = time.time()
         try:
-            auth_client = config.app_data['auth_http_client']
-            
-            response, content = auth_client.request(
-                                    'http://' + url, method=method, 
-                                    headers=headers, body=body)
-            
-        except httplib2.ServerNotFoundError, se:
-            raise GCS_Error(NOT_FOUND, 'Server not found.')
+            stream = connection_pool.open(url, method, headers, body)
+        except Exception:
+            metrics.record_failure(method, url, time.time() - start_time)
+            raise
+        stream.on_close = metrics.record_stream
+        return stream
 
-        if response.status >= HTTP_ERROR_LEVEL:
-            raise GCS_Error(response.status, response.reason)
+    def _get_body_length(self, body):
+        '''
+            Gets the number of bytes of a request body.
+            @param body: A string, a sized object, a file object or an iterator.
+            @return: The number of bytes left to send, or None if the size 
+            cannot be known in advance (iterators).
+            @note: The size of a file is taken from os.fstat, so the file
+            content is never loaded in memory.
+        '''
+        if hasattr(body, '__len__'):
+            return len(body)
+        
+        if hasattr(body, 'fileno'):
+            try:
+                size = os.fstat(body.fileno()).st_size
+            except (AttributeError, IOError, OSError):
+                # Not a real file (for example a socket wrapper).
+                return None
+            return size - body.tell()
         
-        return response, content
+        return None
 
     def _prettify_xml(self, xml_string):
         '''
@@ -68,12 +404,17 @@ class GCS_Command_Utility(object):
             @param xml_string: The XML string to make pretty.
             @return: The pretty string.
         '''
+        # minidom is only needed to display responses.
+        import xml.dom.minidom as md
         parsed = md.parseString(xml_string)
         return parsed.toprettyxml(indent="\t")
     
     def _display_response(self, response, content=None):
         '''
             Displays the response header and body.
+            @note: This is only used to show a response to the user. 
+            The programmatic paths parse the bodies with the xml_responses
+            functions and never pretty-print them.
         '''
         # Response is a dictionary of a key value pairs.
         print "<---------- Response header ------------->"
@@ -82,9 +423,30 @@ class GCS_Command_Utility(object):
         
         if content:
             print "<---------- Response body ------------->"
-            body = self._prettify_xml(content)
+            try:
+                body = self._prettify_xml(content)
+            except ExpatError:
+                # Not an XML body.
+                body = content
             print body
      
+    def _split_object_path(self, bucket_object):
+        '''
+            Splits an object path into bucket name and object name.
+            @param bucket_object: The object path in the format 
+            gs://bucketname/objectname. The object name can be empty or 
+            a prefix, as in gs://bucketname/prefix/.
+            @return: The bucket name and object name tuple.
+            @raise ValueError: If the path does not start with gs://.
+        '''
+        if not bucket_object.startswith('gs://'):
+            raise ValueError('Object paths must be in the format gs://bucketname/objectname.')
+        
+        tmpstr = bucket_object[len('gs://'):].split('/', 1)
+        if len(tmpstr) == 1:
+            return tmpstr[0], ''
+        return tmpstr[0], tmpstr[1]
+    
     def _verify_bucket_name(self, bucket_name):
         '''
             Check if a bucket name is correct.
@@ -160,6 +522,23 @@ class GCS_Command_Utility(object):
         return self._xml_tostring(acls_config_elem)        
   
                    
+    def _get_compose_body(self, component_names):
+        '''
+            Create the XML document for the compose request.
+            @param component_names: List of the names of the objects to 
+            concatenate, in order.
+            @return: The string XML representation of the compose body.
+        '''
+        compose_elem = xml.Element('ComposeRequest')
+        
+        for component_name in component_names:
+            component_elem = xml.SubElement(compose_elem, 'Component')
+            name_elem = xml.SubElement(component_elem, 'Name')
+            name_elem.text = component_name
+        
+        return self._xml_tostring(compose_elem)
+  
+                   
     def _get_cors_body(self, origins, methods, response_headers, max_age_secs):
         '''
             Create the XML document for the CORS request.
@@ -202,6 +581,84 @@ class GCS_Command_Utility(object):
         return self._xml_tostring(cors_config_elem)
 
       
+class GCS_File_Slice(object):
+    '''
+        Exposes a byte range of an open file as a request body.
+        The slice can be read in chunks and rewound, so it is sent 
+        without loading the range in memory.
+        Attributes:
+            offset: The position of the range in the file.
+            length: The number of bytes of the range.
+    '''
+
+    def __init__(self, file, offset, length):
+        '''
+            Initializes GCS_File_Slice.
+            @param file: The file object opened in binary mode.
+            @param offset: The position of the range in the file.
+            @param length: The number of bytes of the range.
+        '''
+        self.offset = offset
+        self.length = length
+        self._file = file
+        self._position = 0
+
+    def __len__(self):
+        '''
+            @return: The number of bytes of the range.
+        '''
+        return self.length
+
+    def read(self, size=-1):
+        '''
+            Reads from the current position, without crossing the end 
+            of the range.
+            @param size: The maximum number of bytes to read. A negative
+            value reads up to the end of the range.
+            @return: The string read. It is empty at the end of the range.
+        '''
+        remaining = self.length - self._position
+        if size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return ''
+        
+        self._file.seek(self.offset + self._position)
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def seek(self, position):
+        '''
+            Moves to a position relative to the start of the range.
+            @param position: The new position.
+        '''
+        self._position = position
+
+    def tell(self):
+        '''
+            @return: The position relative to the start of the range.
+        '''
+        return self._position
+
+      
+def set_endpoint(endpoint_url):
+    '''
+        Sends the API requests to another endpoint than the service, such 
+        as a local test server.
+        @param endpoint_url: The endpoint URL, such as http://127.0.0.1:8080.
+        @raise ValueError: If the URL has no http or https scheme.
+        @note: The buckets are addressed in the path, so the endpoint does 
+        not need a host per bucket.
+    '''
+    scheme, separator, host = endpoint_url.rstrip('/').partition('://')
+    if scheme not in ('http', 'https') or not host:
+        raise ValueError('The endpoint must be an http or https URL.')
+    config.GCS_URL_SCHEME = scheme
+    config.GCS_END_POINT = host
+    config.GCS_PATH_STYLE = True
+
+
 class GCS_Error(Exception):
     '''
         Handle exception raised when API call does not return an 
@@ -209,22 +666,32 @@ class GCS_Error(Exception):
         Attributes:
             status: The string status of the HTTP response.
             message: A string message explaining the error.
+            code: The XML API error code or None.
+            retry_after: The Retry-After header of the response or None.
+            attempts: The number of requests sent before the error.
       '''
 
-    def __init__(self, status, message):
+    def __init__(self, status, message, code=None):
         '''
             Initializes GCS_Error with status and message.
             @param status: HTTP response status.
             @param message: Message explaining the error.
+            @param code: The XML API error code (such as NoSuchKey) or None.
         '''
         self.status = status
         self.message = message
+        self.code = code
+        self.retry_after = None
+        self.attempts = 1
 
     def __str__(self):
         '''
-            Displays the error as <status>: <error message>.
+            Displays the error as <status>: <error message>, or 
+            <status> <code>: <error message> if the code is known.
             @return: The string representation of the error.
         '''
+        if self.code:
+            return '%s %s: %s' % (repr(self.status), self.code, repr(self.message))
         return '%s: %s' % (repr(self.status), repr(self.message))
     
   
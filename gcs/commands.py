@@ -14,6 +14,7 @@ import os
 from gcs.authentication import GCS_Authentication
 from gcs.bucket_commands import GCS_Bucket
 from gcs.object_commands import GCS_Object
+from gcs.metrics import metrics
 import config
 
 
@@ -40,24 +41,43 @@ class GCS_Command(GCS_Authentication, GCS_Bucket, GCS_Object):
         '''
             Defines and initializes the class attributes.
             In particular:
-            1) Obtains and stores the project ID.
-            2) Authenticates the application 
-            
+            1) Sets the default authorization scope.
+            2) Creates the connection pool.
+            @note: The project ID is obtained and the application is 
+            authenticated at the first API request (see _authenticate), 
+            so a command that sends no request never waits for them.
         '''
+        self.debug_level = debug_level
+        
         # Set default authorization scope.
         config.app_data['scope'] = config.scope_choices['RO_SCOPE']
         
-        # Obtain and store the project ID.
-        self.get_gcs_project_id()
+        self._create_connection_pool(debug_level)
+       
+
+    def _authenticate(self):
+        '''
+            Obtains the project ID and authenticates the application, 
+            unless it was already done.
+            @note: Called by _ensure_authenticated before the first API request.
+        '''
+        if config.app_data['project_id'] is None:
+            # Obtain and store the project ID.
+            self.get_gcs_project_id()
         
-        # Authenticate the application.
-        self._create_http_auth_client(False, debug_level)
+        if config.app_data['credentials'] is None:
+            # Authenticate the application.
+            self._create_http_auth_client(False, self.debug_level)
        
 
-    def get_gcs_project_id(self):
+    def get_gcs_project_id(self, prompt=True):
         '''
             Obtains the Google Cloud Storage project ID from the user 
             and stores it in a local file.
+            @param prompt: Whether the user is asked for a project ID that
+            is not stored. False when the standard input carries data, such
+            as a batch job stream.
+            @raise IOError: If the project ID is not stored and prompt is False.
             @note: If the project ID is already stored, the function 
             just retrieves it.
         '''
@@ -69,10 +89,13 @@ class GCS_Command(GCS_Authentication, GCS_Bucket, GCS_Object):
             project_file = open(PROJECT_FILE, 'r')
             project_id = project_file.read()
         except IOError:
+            if not prompt:
+                raise IOError('No project ID stored in %s. Run the application '
+                              'interactively once to enter it.' % PROJECT_FILE)
             # Store project ID.
-            project_file = open(PROJECT_FILE, 'w')
             project_id = raw_input(
                             'Enter your project id (found in the API console): ')
+            project_file = open(PROJECT_FILE, 'w')
             project_file.write(project_id)
             project_file.close()
       
@@ -99,6 +122,8 @@ class GCS_Command(GCS_Authentication, GCS_Bucket, GCS_Object):
             
       
         # Create authenticated request to access Google Cloud Storage.
+        if config.app_data['project_id'] is None:
+            self.get_gcs_project_id()
         self._create_http_auth_client(True, None)
     
      
@@ -110,5 +135,31 @@ class GCS_Command(GCS_Authentication, GCS_Bucket, GCS_Object):
         print "<---------- Application data ------------->"
         for key, value in config.app_data.items():
             print key, ":", value
-        
-        
+
+
+    def get_metrics(self):
+        '''
+            Displays the request metrics.
+            User input:
+                format: json or prometheus.
+        '''
+        metrics_format = raw_input("Format [json | prometheus]. Enter for json: ").strip()
+        print self.dump_metrics(metrics_format or 'json')
+
+
+    @classmethod
+    def dump_metrics(cls, metrics_format='json'):
+        '''
+            Gets the request metrics, including the budget of each host and
+            the cache stats.
+            @param metrics_format: json or prometheus.
+            @return: The metrics string.
+            @note: A class method, since the flow controller and the caches
+            are shared by all the instances.
+        '''
+        hosts = cls.flow_controller.snapshot()
+        caches = {'metadata' : cls.metadata_cache.stats(),
+                  'content' : cls.content_cache.stats()}
+        if metrics_format == 'prometheus':
+            return metrics.to_prometheus(hosts, caches)
+        return metrics.to_json(hosts, caches)
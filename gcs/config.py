@@ -21,8 +21,134 @@ app_data = {
                 'project_id' : None,
                 'scope' : None,
                 'http_client' : None,
-                'auth_http_client' : None
+                'auth_http_client' : None,
+                'credentials' : None,
+                'token_manager' : None,
+                'connection_pool' : None
 }
 
 # Define the default HTTP verb.
-DEFAULT_METHOD = 'GET'
\ No newline at end of file
+DEFAULT_METHOD = 'GET'
+
+# Define the service endpoint.
+# The host, with an optional :port, of the XML API. Buckets are addressed 
+# as [bucket_name].GCS_END_POINT, unless GCS_PATH_STYLE is set.
+GCS_END_POINT = 'storage.googleapis.com'
+# The URL scheme of the requests (http or https).
+GCS_URL_SCHEME = 'http'
+# Whether buckets are addressed in the path, as GCS_END_POINT/[bucket_name]/,
+# for endpoints without a host per bucket, such as a local test server.
+GCS_PATH_STYLE = False
+
+# Define the access token settings.
+# Seconds before the expiry at which the access token is refreshed in the
+# background. A random part of the margin is added, up to half of it.
+TOKEN_REFRESH_MARGIN_SECS = 300
+# Seconds a refresh waits for the lock of the token cache shared with the
+# other processes, before it refreshes the token without the lock.
+TOKEN_LOCK_TIMEOUT_SECS = 30
+# Seconds the exit waits for the background refresh thread to stop.
+TOKEN_STOP_TIMEOUT_SECS = 5
+
+# Define the connection pool settings.
+# Maximum number of idle connections kept for each host. The connections
+# in use are not limited by the pool, but by the requests in progress.
+POOL_MAX_IDLE_PER_HOST = 10
+# Seconds an idle connection is kept before it is closed.
+POOL_IDLE_TIMEOUT_SECS = 60
+# Seconds after which a connection is no longer reused.
+POOL_MAX_LIFETIME_SECS = 600
+# Size of the chunks in which request and response bodies are streamed.
+TRANSFER_CHUNK_SIZE = 256 * 1024
+
+# Define the API request retry settings.
+# Maximum number of times a request is sent, the first one included.
+RETRY_MAX_ATTEMPTS = 5
+# Cap of the first backoff delay in seconds. The cap doubles at every 
+# repetition and the delay is chosen at random below it.
+RETRY_BASE_DELAY_SECS = 0.5
+# Maximum cap of a backoff delay in seconds.
+RETRY_MAX_DELAY_SECS = 30
+# Maximum seconds a request may last, repetitions included.
+RETRY_DEADLINE_SECS = 300
+
+# Define the request pacing settings. Each bucket host has its own budget.
+# Requests per second sent to a host. None for no limit, so reads are not 
+# slowed down; the concurrency limit below still backs off on 429 and 503.
+# Set with --rate_per_host.
+FLOW_RATE_PER_HOST = None
+# Requests sent at once to a host after an idle period.
+FLOW_BURST_PER_HOST = 100
+# Initial, lowest and highest number of requests in progress per host. 
+# The limit grows while requests succeed and shrinks on 429 and 503.
+FLOW_INITIAL_CONCURRENCY = 16
+FLOW_MIN_CONCURRENCY = 1
+FLOW_MAX_CONCURRENCY = 256
+# Factor the limit is multiplied by when the service throttles requests.
+FLOW_DECREASE_FACTOR = 0.5
+
+# Define the metadata cache settings (HEAD, ACL, CORS and location).
+# Maximum number of cached responses. 0 disables the cache.
+METADATA_CACHE_SIZE = 10000
+# Seconds a cached response is used before it is requested again.
+METADATA_CACHE_TTL_SECS = 60
+
+# Define the downloaded object cache settings.
+# Maximum total bytes of the object copies kept on disk. 0 disables the 
+# cache. A cached copy is served only after the service confirms, with a 
+# 304 response, that the object did not change. The copy is written while
+# the object is downloaded, which costs one more write of the data. One 
+# process at a time uses the cache directory (see content_cache).
+CONTENT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Define the integrity check settings.
+# Whether the MD5 or CRC32C digests of the uploaded and downloaded data are
+# compared with the ones reported by the service.
+VERIFY_CHECKSUMS = True
+# Whether the downloads with a CRC32C digest only (composite objects) are
+# verified when no crc32c or crcmod C extension is installed. The Python
+# CRC32C runs at about 17 MB/s, slower than the downloads.
+VERIFY_PYTHON_CRC32C = False
+
+# Define the bulk transfer settings.
+# Number of operations performed in parallel.
+TRANSFER_CONCURRENCY = 8
+# How many times a failed operation is repeated.
+TRANSFER_RETRIES = 3
+# Seconds before the first repetition. The delay doubles at every repetition.
+TRANSFER_RETRY_DELAY_SECS = 1
+
+# Define the sliced download settings.
+# Objects of this size or larger are downloaded in parallel slices.
+SLICED_DOWNLOAD_THRESHOLD = 64 * 1024 * 1024
+# Number of bytes of each slice.
+SLICED_DOWNLOAD_SLICE_SIZE = 16 * 1024 * 1024
+
+# Define the resumable upload settings.
+# Files of this size or larger are uploaded with the resumable protocol.
+RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+# Number of bytes sent with each request. It must be a multiple of 256 KB.
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Define the parallel composite upload settings.
+# Files of this size or larger are uploaded as components composed into 
+# the final object.
+COMPOSITE_UPLOAD_THRESHOLD = 150 * 1024 * 1024
+# Number of bytes of each component.
+COMPOSITE_COMPONENT_SIZE = 50 * 1024 * 1024
+# Number of components uploaded in parallel.
+COMPOSITE_CONCURRENCY = 4
+
+# Define the bulk delete settings.
+# Number of DELETE requests performed in parallel.
+DELETE_CONCURRENCY = 32
+# Maximum number of DELETE requests per second. None for no limit.
+DELETE_MAX_RATE = None
+
+# Define the bucket listing settings.
+# Maximum number of entries returned by each listing request.
+LIST_PAGE_SIZE = 1000
+
+# Define the asynchronous client settings.
+# Maximum number of requests of a GCS_Async_Client in progress at once.
+ASYNC_CONCURRENCY = 64
@@ -0,0 +1,457 @@
+'''
+    Contains the GCS_Connection_Pool class which keeps persistent
+    (keep-alive) HTTP connections to Google Cloud Storage.
+    @note: Every bucket is addressed through its own virtual host
+    ([bucket_name].storage.googleapis.com), so the connections are pooled
+    per host. The pool is safe to share across threads.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import httplib
+import socket
+import threading
+import time
+import urlparse
+
+# Local imports
+from retry_policy import IDEMPOTENT_METHODS
+
+
+# Define the pool defaults.
+DEFAULT_MAX_IDLE_PER_HOST = 10
+DEFAULT_IDLE_TIMEOUT_SECS = 60
+DEFAULT_MAX_LIFETIME_SECS = 600
+DEFAULT_SOCKET_TIMEOUT_SECS = 60
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+CONNECTION_CLASSES = {'http' : httplib.HTTPConnection,
+                      'https' : httplib.HTTPSConnection}
+
+
+def get_body_position(body):
+    '''
+        Gets the current position of a file-like request body.
+        @param body: The request body.
+        @return: The position or None if the body cannot be rewound.
+    '''
+    if hasattr(body, 'seek') and hasattr(body, 'tell'):
+        return body.tell()
+    return None
+
+
+def send_request(connection, method, path, headers, body, chunk_size):
+    '''
+        Sends an HTTP request on an httplib connection.
+        @param connection: The httplib connection.
+        @param method: The HTTP request method.
+        @param path: The request path and query string.
+        @param headers: The request headers.
+        @param body: The request body. It can be None, a string, a file-like 
+        object with a read method or an iterator of strings.
+        @param chunk_size: The size of the chunks read from a file-like body.
+        @return: The number of body bytes sent.
+        @note: A file-like or iterator body is sent chunk by chunk, so it is
+        never entirely loaded in memory. When the Transfer-Encoding header is 
+        chunked, each chunk is framed as required by HTTP/1.1.
+    '''
+    if body is None or isinstance(body, basestring):
+        connection.request(method, path, body, headers)
+        return len(body or '')
+
+    connection.putrequest(method, path)
+    for key, value in headers.items():
+        connection.putheader(key, value)
+    connection.endheaders()
+
+    if hasattr(body, 'read'):
+        chunks = iter(lambda: body.read(chunk_size), '')
+    else:
+        chunks = body
+
+    chunked = headers.get('Transfer-Encoding') == 'chunked'
+    sent = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if chunked:
+            connection.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+        else:
+            connection.send(chunk)
+        sent += len(chunk)
+
+    if chunked:
+        connection.send('0\r\n\r\n')
+    return sent
+
+
+class GCS_Pooled_Connection(object):
+    '''
+        Wraps an httplib connection with the information the pool
+        needs to decide whether the connection can be reused.
+        Attributes:
+            key: The (scheme, host) tuple the connection belongs to.
+            connection: The httplib connection object.
+            created: The time the connection was opened.
+            last_used: The time the connection was last returned to the pool.
+            reused: True if the connection was taken from the idle list.
+    '''
+
+    def __init__(self, key, connection):
+        '''
+            Initializes GCS_Pooled_Connection.
+            @param key: The (scheme, host) tuple the connection belongs to.
+            @param connection: The httplib connection object.
+        '''
+        self.key = key
+        self.connection = connection
+        self.created = time.time()
+        self.last_used = self.created
+        self.reused = False
+
+
+class GCS_Connection_Pool(object):
+    '''
+        Keeps a bounded list of idle connections for each host.
+        A connection is handed out to one request at a time and returned
+        to the pool once its response has been completely read.
+        Attributes:
+            max_idle_per_host: The maximum number of idle connections kept
+            per host. It does not limit the open connections: a request 
+            that finds no idle connection opens a new one, so the number 
+            of open connections is the number of requests in progress, 
+            which the flow controller (GCS_Flow_Controller) and the worker
+            pools bound.
+            idle_timeout: Seconds an idle connection is kept before it is closed.
+            max_lifetime: Seconds after which a connection is never reused.
+            stats: Dictionary with the opened, reused and closed counters.
+    '''
+
+    def __init__(self, max_idle_per_host=DEFAULT_MAX_IDLE_PER_HOST,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT_SECS,
+                 max_lifetime=DEFAULT_MAX_LIFETIME_SECS,
+                 socket_timeout=DEFAULT_SOCKET_TIMEOUT_SECS,
+                 debug_level=0, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+            Initializes GCS_Connection_Pool.
+            @param max_idle_per_host: The maximum number of idle connections
+            kept per host.
+            @param idle_timeout: Seconds an idle connection is kept.
+            @param max_lifetime: Seconds after which a connection is retired.
+            @param socket_timeout: The socket timeout of new connections.
+            @param debug_level: The httplib debug level of new connections.
+            @param chunk_size: The size of the chunks sent from file-like bodies.
+        '''
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.socket_timeout = socket_timeout
+        self.debug_level = debug_level
+        self.chunk_size = chunk_size
+
+        self.stats = {'opened' : 0,
+                      'reused' : 0,
+                      'closed' : 0,
+                      'expired' : 0}
+
+        self._idle = {}
+        self._lock = threading.Lock()
+
+
+    def __str__(self):
+        '''
+            Displays the pool counters.
+            @return: The string representation of the pool.
+        '''
+        with self._lock:
+            idle = sum([len(conns) for conns in self._idle.values()])
+            return 'GCS_Connection_Pool(hosts=%d, idle=%d, %s)' % (
+                        len(self._idle), idle,
+                        ', '.join(['%s=%d' % item for item in sorted(self.stats.items())]))
+
+
+    def _is_expired(self, pooled, now):
+        '''
+            Checks if a connection exceeded its idle time or its lifetime.
+            @param pooled: The GCS_Pooled_Connection to check.
+            @param now: The current time.
+            @return: True if the connection must not be reused; otherwise, False.
+        '''
+        if now - pooled.last_used > self.idle_timeout:
+            return True
+        return now - pooled.created > self.max_lifetime
+
+
+    def _close(self, pooled):
+        '''
+            Closes the connection socket.
+            @param pooled: The GCS_Pooled_Connection to close.
+        '''
+        try:
+            pooled.connection.close()
+        except socket.error:
+            pass
+        with self._lock:
+            self.stats['closed'] += 1
+
+
+    def acquire(self, scheme, host):
+        '''
+            Gets a connection to the given host.
+            @param scheme: The URL scheme (http or https).
+            @param host: The host, optionally followed by :port.
+            @return: A GCS_Pooled_Connection. An idle connection is reused
+            when available; otherwise, a new one is created.
+        '''
+        key = (scheme, host)
+        now = time.time()
+        expired = []
+        pooled = None
+
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate = idle.pop()
+                if self._is_expired(candidate, now):
+                    self.stats['expired'] += 1
+                    expired.append(candidate)
+                else:
+                    self.stats['reused'] += 1
+                    pooled = candidate
+                    pooled.reused = True
+                    break
+            if pooled is None:
+                self.stats['opened'] += 1
+
+        # Close the expired connections outside the lock.
+        for candidate in expired:
+            self._close(candidate)
+
+        if pooled is None:
+            connection = CONNECTION_CLASSES[scheme](host, timeout=self.socket_timeout)
+            connection.set_debuglevel(self.debug_level)
+            pooled = GCS_Pooled_Connection(key, connection)
+
+        return pooled
+
+
+    def release(self, pooled, reusable=True):
+        '''
+            Returns a connection to the pool.
+            @param pooled: The GCS_Pooled_Connection to return.
+            @param reusable: False if the connection cannot be used for
+            another request (for example, the server asked to close it).
+            @note: The connection is closed if the host idle list is full.
+        '''
+        now = time.time()
+        pooled.last_used = now
+
+        if reusable and now - pooled.created <= self.max_lifetime:
+            with self._lock:
+                idle = self._idle.setdefault(pooled.key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(pooled)
+                    return
+
+        self._close(pooled)
+
+
+    def request(self, url, method, headers, body):
+        '''
+            Sends an HTTP request using a pooled connection and reads
+            the whole response.
+            @param url: The absolute request URL.
+            @param method: The HTTP request method.
+            @param headers: The request headers.
+            @param body: The request body. It can be None, a string, a 
+            file-like object or an iterator of strings.
+            @return: The httplib response and its string content.
+            @note: An idempotent request that fails on a reused connection is
+            sent again on a new connection, because the server may have closed
+            the idle connection in the meantime.
+        '''
+        stream = self.open(url, method, headers, body)
+        try:
+            content = stream.read()
+        finally:
+            stream.close()
+
+        return stream.response, content
+
+
+    def open(self, url, method, headers, body):
+        '''
+            Sends an HTTP request using a pooled connection and returns
+            the response without reading its body.
+            @param url: The absolute request URL.
+            @param method: The HTTP request method.
+            @param headers: The request headers.
+            @param body: The request body. It can be None, a string, a 
+            file-like object or an iterator of strings.
+            @return: A GCS_Response_Stream. The caller must close it to 
+            return the connection to the pool.
+            @note: A request on a stale connection is only sent again if its
+            method is idempotent and its body is a string or can be rewound.
+            The server may have processed a POST before the connection broke,
+            so the error is raised to the retry policy instead.
+        '''
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+
+        position = get_body_position(body)
+        replayable = (method in IDEMPOTENT_METHODS and
+                      (body is None or isinstance(body, basestring) or position is not None))
+
+        while True:
+            start_time = time.time()
+            pooled = self.acquire(parts.scheme, parts.netloc)
+            try:
+                if pooled.connection.sock is None:
+                    pooled.connection.connect()
+                    # Headers and body are sent separately; disable Nagle's
+                    # algorithm so the body is not delayed.
+                    pooled.connection.sock.setsockopt(
+                        socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                bytes_sent = send_request(pooled.connection, method, path, headers,
+                                          body, self.chunk_size)
+                response = pooled.connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                self.release(pooled, False)
+                if pooled.reused and replayable:
+                    # Stale keep-alive connection. Try with another one.
+                    if position is not None:
+                        body.seek(position)
+                    continue
+                raise
+
+            stream = GCS_Response_Stream(self, pooled, response)
+            stream.method = method
+            stream.url = url
+            stream.start_time = start_time
+            stream.ttfb = time.time() - start_time
+            stream.bytes_sent = bytes_sent
+            return stream
+
+
+    def clear(self):
+        '''
+            Closes all the idle connections.
+        '''
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for conns in idle.values():
+            for pooled in conns:
+                self._close(pooled)
+
+
+class GCS_Response_Stream(object):
+    '''
+        Reads the body of a response received on a pooled connection.
+        Attributes:
+            response: The httplib response.
+            method: The HTTP request method.
+            url: The absolute request URL.
+            start_time: The time the request started.
+            ttfb: The seconds until the response headers were received.
+            total_time: The seconds until the stream was closed.
+            bytes_sent: The number of request body bytes sent.
+            bytes_received: The number of response body bytes read.
+            on_close: The function called with the stream when it is
+            closed, or None.
+        @note: The connection goes back to the pool when the stream is 
+        closed. It is reused only if the body was read completely.
+    '''
+
+    def __init__(self, pool, pooled, response):
+        '''
+            Initializes GCS_Response_Stream.
+            @param pool: The GCS_Connection_Pool that owns the connection.
+            @param pooled: The GCS_Pooled_Connection the response arrived on.
+            @param response: The httplib response.
+        '''
+        self.response = response
+        self.method = None
+        self.url = None
+        self.start_time = time.time()
+        self.ttfb = 0.0
+        self.total_time = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.on_close = None
+        self._pool = pool
+        self._pooled = pooled
+
+
+    def read(self, size=None):
+        '''
+            Reads the response body.
+            @param size: The maximum number of bytes to read. None reads
+            the whole body.
+            @return: The string read. It is empty at the end of the body.
+            @raise httplib.IncompleteRead: If the connection was closed 
+            before the end of the body.
+        '''
+        if size is None:
+            data = self.response.read()
+        else:
+            data = self.response.read(size)
+            if not data and size:
+                self._check_complete()
+        self.bytes_received += len(data)
+        return data
+
+
+    def iter_chunks(self, chunk_size=None):
+        '''
+            Reads the response body in chunks.
+            @param chunk_size: The maximum size of each chunk. The default
+            is the pool chunk size.
+            @return: A generator of strings.
+            @raise httplib.IncompleteRead: As in read.
+        '''
+        chunk_size = chunk_size or self._pool.chunk_size
+        while True:
+            chunk = self.response.read(chunk_size)
+            if not chunk:
+                self._check_complete()
+                break
+            self.bytes_received += len(chunk)
+            yield chunk
+
+
+    def _check_complete(self):
+        '''
+            Checks that the body ended at its Content-Length.
+            @raise httplib.IncompleteRead: If the connection was closed 
+            before the end of the body.
+            @note: httplib returns a short body, without an error, when the
+            connection is closed early and the body is read in parts.
+        '''
+        if self.response.length:
+            raise httplib.IncompleteRead('', self.response.length)
+
+
+    def close(self):
+        '''
+            Returns the connection to the pool.
+        '''
+        if self._pooled is None:
+            return
+
+        pooled = self._pooled
+        self._pooled = None
+
+        # httplib closes the response once its body has been entirely read.
+        complete = self.response.isclosed()
+        if not complete:
+            self.response.close()
+        self._pool.release(pooled, complete and not self.response.will_close)
+
+        self.total_time = time.time() - self.start_time
+        if self.on_close is not None:
+            self.on_close(self)
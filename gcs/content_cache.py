@@ -0,0 +1,409 @@
+'''
+    Contains the GCS_Content_Cache class which keeps copies of downloaded
+    objects on the local disk, with the ETag and generation they had.
+    @note: A cached object is not used as it is: the download sends its
+    ETag and generation as preconditions, and the service answers 304 Not
+    Modified if the object did not change. Only then is the local copy
+    served, so a repeated download costs one round trip and no body
+    transfer. The least recently used copies are evicted when the total
+    size exceeds the limit. A copy is written while the object is
+    downloaded, so storing it costs one more write and no more read.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Local imports
+import config
+
+
+# The directory that contains the cached objects.
+CONTENT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'object_cache')
+
+
+class GCS_Content_Cache(object):
+    '''
+        Size-bounded LRU cache of object copies on the local disk.
+        Attributes:
+            cache_dir: The directory that contains the cached objects. Each
+            object has a .data file and a .json file with its bucket, name,
+            ETag, generation and size.
+            max_bytes: The maximum total size of the cached objects.
+            hits: The number of downloads served from the cache.
+            misses: The number of downloads that transferred the object.
+            evictions: The number of copies evicted because the cache was full.
+            invalidations: The number of copies removed because the object
+            no longer exists.
+            bytes_saved: The number of bytes served from the cache.
+        @note: The index is read from cache_dir at first use, so the copies
+        survive the process. The methods are safe to call from concurrent
+        worker threads. The index is kept in memory, so one process at a 
+        time uses a cache_dir: it holds an exclusive lock on the .lock file
+        of cache_dir, and in the other processes the cache stays empty, 
+        with a warning. Without fcntl (Windows) nothing prevents two 
+        processes from sharing cache_dir; they must use different ones.
+    '''
+
+    def __init__(self, cache_dir=CONTENT_CACHE_DIR,
+                 max_bytes=config.CONTENT_CACHE_MAX_BYTES):
+        '''
+            Initializes GCS_Content_Cache.
+            @param cache_dir: The directory that contains the cached objects.
+            @param max_bytes: The maximum total size. 0 disables the cache.
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes_saved = 0
+        self._entries = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._dir_lock_file = None
+        self._locked_out = False
+
+
+    def _get_key(self, bucket_name, object_name):
+        '''
+            @return: The file name, without extension, of an object copy.
+        '''
+        key = '%s\n%s' % (bucket_name, object_name)
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.sha1(key).hexdigest()
+
+
+    def _lock_dir(self):
+        '''
+            Takes the exclusive lock of cache_dir for the process lifetime.
+            @return: True if the lock is held or not supported; False if 
+            another process holds it.
+        '''
+        if fcntl is None:
+            return True
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Created by another process in the meantime.
+                if not os.path.isdir(self.cache_dir):
+                    raise
+        lock_file = open(os.path.join(self.cache_dir, '.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lock_file.close()
+            logging.warning('The object cache %s is used by another process; '
+                            'it is disabled in this one.', self.cache_dir)
+            return False
+        self._dir_lock_file = lock_file
+        return True
+
+
+    def _load(self):
+        '''
+            Reads the index of the cached objects. The lock must be held.
+            @note: The copies are ordered by the modification time of their
+            data file, which is updated on each hit. Incomplete copies are
+            removed. The index stays empty if the cache is disabled or 
+            cache_dir is locked by another process.
+        '''
+        if self._entries is not None:
+            return
+
+        entries = []
+        if self.max_bytes > 0 and not self._lock_dir():
+            self._locked_out = True
+        elif self.max_bytes > 0 and os.path.isdir(self.cache_dir):
+            for file_name in os.listdir(self.cache_dir):
+                key, extension = os.path.splitext(file_name)
+                if extension != '.json':
+                    continue
+                try:
+                    entry_file = open(os.path.join(self.cache_dir, file_name), 'r')
+                    try:
+                        entry = json.load(entry_file)
+                    finally:
+                        entry_file.close()
+                    data_stat = os.stat(os.path.join(self.cache_dir, key + '.data'))
+                except (IOError, OSError, ValueError):
+                    self._remove_files(key)
+                    continue
+                if data_stat.st_size != entry.get('size'):
+                    self._remove_files(key)
+                    continue
+                entries.append((data_stat.st_mtime, key, entry))
+
+        entries.sort()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        for mtime, key, entry in entries:
+            self._entries[key] = entry
+            self._bytes += entry['size']
+
+
+    def _remove_files(self, key):
+        '''
+            Removes the files of an object copy.
+            @param key: The file name without extension.
+        '''
+        for extension in ('.json', '.data'):
+            try:
+                os.remove(os.path.join(self.cache_dir, key + extension))
+            except OSError:
+                pass
+
+
+    def open_entry(self, bucket_name, object_name):
+        '''
+            Looks up the copy of an object.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name.
+            @return: The entry dictionary, with the etag, generation and size,
+            and the data file opened for reading, or (None, None).
+            @note: The caller must close the file. An open file can still be
+            read if the copy is evicted meanwhile.
+        '''
+        if self.max_bytes <= 0:
+            return None, None
+
+        key = self._get_key(bucket_name, object_name)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            try:
+                data_file = open(os.path.join(self.cache_dir, key + '.data'), 'rb')
+            except IOError:
+                del self._entries[key]
+                self._bytes -= entry['size']
+                self._remove_files(key)
+                return None, None
+        return entry, data_file
+
+
+    def record_hit(self, bucket_name, object_name):
+        '''
+            Records that the copy of an object was served, and marks it as
+            the most recently used.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name.
+        '''
+        key = self._get_key(bucket_name, object_name)
+        with self._lock:
+            self.hits += 1
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self._entries[key] = entry
+            self.bytes_saved += entry['size']
+            try:
+                os.utime(os.path.join(self.cache_dir, key + '.data'), None)
+            except OSError:
+                pass
+
+
+    def start_store(self, bucket_name, object_name, size, etag):
+        '''
+            Starts a copy of an object that is being downloaded.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name.
+            @param size: The size of the object, or None if unknown.
+            @param etag: The ETag of the object.
+            @return: The GCS_Cache_Writer of the copy, or None if the object
+            is not stored.
+            @note: Objects larger than max_bytes, or without an ETag, are
+            not stored. The data is written to a temporary file in cache_dir
+            and renamed by commit, so a crash never leaves a truncated copy.
+        '''
+        with self._lock:
+            self.misses += 1
+            if self.max_bytes <= 0 or (size or 0) > self.max_bytes or not etag:
+                return None
+            self._load()
+            if self._locked_out:
+                return None
+
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Created by another download in the meantime.
+                if not os.path.isdir(self.cache_dir):
+                    raise
+
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        return GCS_Cache_Writer(self, bucket_name, object_name, etag,
+                                os.fdopen(temp_fd, 'wb'), temp_path)
+
+
+    def _commit(self, bucket_name, object_name, temp_path, entry):
+        '''
+            Adds a completed copy to the index, in place of the previous one.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name.
+            @param temp_path: The path of the data written.
+            @param entry: The entry dictionary of the copy.
+        '''
+        key = self._get_key(bucket_name, object_name)
+        with self._lock:
+            self._load()
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous['size']
+
+            data_path = os.path.join(self.cache_dir, key + '.data')
+            # On Windows rename fails if the destination exists.
+            if os.name == 'nt' and os.path.exists(data_path):
+                os.remove(data_path)
+            os.rename(temp_path, data_path)
+
+            entry_file = open(os.path.join(self.cache_dir, key + '.json'), 'w')
+            try:
+                json.dump(entry, entry_file)
+            finally:
+                entry_file.close()
+
+            self._entries[key] = entry
+            self._bytes += entry['size']
+            while self._bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted['size']
+                self._remove_files(evicted_key)
+                self.evictions += 1
+
+
+    def invalidate(self, bucket_name, object_name):
+        '''
+            Removes the copy of an object.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name.
+        '''
+        key = self._get_key(bucket_name, object_name)
+        with self._lock:
+            self._load()
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self._bytes -= entry['size']
+            self._remove_files(key)
+            self.invalidations += 1
+
+
+    def clear(self):
+        '''
+            Removes all the copies.
+        '''
+        with self._lock:
+            self._load()
+            for key in self._entries:
+                self._remove_files(key)
+            self._entries.clear()
+            self._bytes = 0
+
+
+    def stats(self):
+        '''
+            @return: Dictionary of the entries, bytes, hits, misses, hit
+            ratio, evictions, invalidations and bytes saved.
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries' : len(self._entries or ()),
+                    'bytes' : self._bytes,
+                    'hits' : self.hits,
+                    'misses' : self.misses,
+                    'hit_ratio' : round(float(self.hits) / lookups, 4) if lookups else None,
+                    'evictions' : self.evictions,
+                    'invalidations' : self.invalidations,
+                    'bytes_saved' : self.bytes_saved}
+
+
+class GCS_Cache_Writer(object):
+    '''
+        Writes the copy of an object while it is downloaded.
+        Attributes:
+            size: The number of bytes written.
+        @note: Call commit once the download is complete and verified, or
+        discard otherwise. A copy that grows beyond the max_bytes of the
+        cache is discarded.
+    '''
+
+    def __init__(self, cache, bucket_name, object_name, etag, temp_file, temp_path):
+        '''
+            Initializes GCS_Cache_Writer.
+            @param cache: The GCS_Content_Cache.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name.
+            @param etag: The ETag of the object.
+            @param temp_file: The temporary file opened for writing.
+            @param temp_path: The path of the temporary file.
+        '''
+        self.size = 0
+        self._cache = cache
+        self._bucket_name = bucket_name
+        self._object_name = object_name
+        self._etag = etag
+        self._temp_file = temp_file
+        self._temp_path = temp_path
+
+
+    def write(self, data):
+        '''
+            @param data: The string of the next bytes.
+        '''
+        if self._temp_file is None:
+            return
+        self.size += len(data)
+        if self.size > self._cache.max_bytes:
+            self.discard()
+            return
+        self._temp_file.write(data)
+
+
+    def commit(self, generation):
+        '''
+            Stores the copy in the cache.
+            @param generation: The generation of the object or None.
+        '''
+        if self._temp_file is None:
+            return
+        try:
+            self._temp_file.close()
+            self._temp_file = None
+            entry = {'bucket_name' : self._bucket_name,
+                     'object_name' : self._object_name,
+                     'etag' : self._etag,
+                     'generation' : generation,
+                     'size' : self.size}
+            self._cache._commit(self._bucket_name, self._object_name, 
+                                self._temp_path, entry)
+        finally:
+            self.discard()
+
+
+    def discard(self):
+        '''
+            Removes the copy written so far.
+        '''
+        if self._temp_file is not None:
+            self._temp_file.close()
+            self._temp_file = None
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
@@ -0,0 +1,955 @@
+'''
+    Contains the GCS_Fake_Server class, a local stand-in for the Google
+    Cloud Storage XML API, used to test and benchmark the application
+    without the service.
+    @note: The server implements the subset of the XML API the application
+    uses: the bucket list, bucket creation and deletion, object listing
+    with prefix, delimiter and pagination, the cors, location and acl
+    sub-resources, object upload, download (with Range and the ETag and
+    generation preconditions), HEAD, deletion, copy, compose, and the
+    resumable upload protocol. The buckets are addressed in the path (see
+    set_endpoint in command_utilities). The data is kept in memory.
+    The latency, the bandwidth and the rate of 503, 429 and reset
+    responses can be set, to test the retry and flow control paths.
+    The objects have an MD5 digest, and a CRC32C digest too when a crc32c
+    or crcmod C extension is installed (or --crc32c is set). Composite
+    objects have a CRC32C digest only, as on the service.
+    Usage: python gcs/fake_server.py --port 8080 [--latency_ms 20]
+    [--bandwidth_mbps 100] [--error_rate 0.01]
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import base64
+import BaseHTTPServer
+import binascii
+import bisect
+import hashlib
+import optparse
+import os
+import random
+import SocketServer
+import struct
+import threading
+import time
+import urllib
+import urlparse
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+
+# Local imports
+from checksums import CRC32C_NATIVE, GCS_Crc32c, crc32c_combine
+
+try:
+    import xml.etree.cElementTree as xml
+except ImportError:
+    import xml.etree.ElementTree as xml
+
+
+# The namespace of the listing responses.
+XML_NAMESPACE = 'http://doc.s3.amazonaws.com/2006-03-01'
+
+# The owner of the buckets and objects.
+OWNER_ID = '00b4903a97fake'
+
+# The maximum number of entries of a listing page.
+MAX_LIST_KEYS = 1000
+
+# The size of the chunks in which the bodies are sent and received.
+CHUNK_SIZE = 64 * 1024
+
+# The status of an incomplete resumable upload.
+RESUME_INCOMPLETE = 308
+
+
+class _Fake_Error(Exception):
+    '''
+        An XML API error response.
+    '''
+
+    def __init__(self, status, code, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class _Fake_Object(object):
+    '''
+        Holds an object and its metadata.
+    '''
+
+    __slots__ = ('data', 'md5', 'crc32c', 'component_count', 'generation',
+                 'metageneration', 'last_modified', 'content_type',
+                 'content_encoding', 'acl')
+
+    def __init__(self, data, generation, content_type=None, content_encoding=None,
+                 crc32c=False):
+        self.data = data
+        self.md5 = hashlib.md5(data).digest()
+        self.crc32c = GCS_Crc32c(data).value if crc32c else None
+        # The number of components of a composite object, or None.
+        self.component_count = None
+        self.generation = generation
+        self.metageneration = 1
+        self.last_modified = time.time()
+        self.content_type = content_type or 'application/octet-stream'
+        self.content_encoding = content_encoding
+        self.acl = None
+
+    def get_etag(self):
+        if self.md5 is None:
+            return '"%08x-%d"' % (self.crc32c, self.component_count)
+        return '"%s"' % binascii.hexlify(self.md5)
+
+    def get_crc32c(self):
+        if self.crc32c is None:
+            self.crc32c = GCS_Crc32c(self.data).value
+        return self.crc32c
+
+    def copy_digests(self, source):
+        self.md5 = source.md5
+        self.crc32c = source.crc32c
+        self.component_count = source.component_count
+
+
+class _Fake_Bucket(object):
+    '''
+        Holds a bucket, its objects and the sorted object names.
+    '''
+
+    def __init__(self, location):
+        self.location = location
+        self.creation_date = time.time()
+        self.cors = None
+        self.objects = {}
+        self.names = []
+
+    def put(self, name, fake_object):
+        if name not in self.objects:
+            bisect.insort(self.names, name)
+        self.objects[name] = fake_object
+
+    def delete(self, name):
+        del self.objects[name]
+        del self.names[bisect.bisect_left(self.names, name)]
+
+
+def _iso_time(seconds):
+    '''
+        @return: The XML API timestamp, such as 2014-03-14T10:30:00.000Z.
+    '''
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(seconds))
+
+
+def _error_body(code, message):
+    '''
+        @return: The XML API error body.
+    '''
+    return ('<?xml version="1.0" encoding="UTF-8"?><Error><Code>%s</Code>'
+            '<Message>%s</Message></Error>' % (code, escape(message)))
+
+
+def _parse_range(value, size):
+    '''
+        Parses a Range header.
+        @param value: The header, such as bytes=0-99, bytes=100- or bytes=-100.
+        @param size: The object size.
+        @return: The first and last byte positions, or None if the header
+        is not a single byte range.
+        @raise _Fake_Error: If the range is not satisfiable.
+    '''
+    unit, separator, byte_range = value.partition('=')
+    if unit.strip() != 'bytes' or ',' in byte_range:
+        return None
+    first, separator, last = byte_range.strip().partition('-')
+    try:
+        if not first:
+            first, last = max(0, size - int(last)), size - 1
+        else:
+            first = int(first)
+            last = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if first > last or first >= size:
+        raise _Fake_Error(416, 'InvalidRange', 'The requested range cannot be satisfied.')
+    return first, last
+
+
+class GCS_Fake_Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+        Handles the requests of a GCS_Fake_Server, one connection per
+        thread, with HTTP/1.1 keep-alive.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    # The status line and the headers are written one by one: without
+    # TCP_NODELAY each small response waits for the delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_HEAD(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+
+    def _handle(self):
+        '''
+            Reads the request, applies the injected faults and dispatches
+            the request to its operation.
+        '''
+        server = self.server
+        start = time.time()
+        body = self._read_body()
+
+        fault = server.draw_fault()
+        if fault == 'reset':
+            # Close the connection without a response.
+            self.close_connection = True
+            return
+        if server.latency_secs or server.latency_jitter_secs:
+            time.sleep(server.latency_secs +
+                       random.uniform(0, server.latency_jitter_secs))
+
+        try:
+            if fault == 503:
+                raise _Fake_Error(503, 'BackendError', 'Injected backend error.')
+            if fault == 429:
+                raise _Fake_Error(429, 'SlowDown', 'Injected rate limit.')
+            status, headers, content = self._dispatch(body)
+        except _Fake_Error, e:
+            status, headers, content = (e.status, {'Content-Type' : 'application/xml'},
+                                        _error_body(e.code, e.message))
+            if e.status in (429, 503):
+                headers['Retry-After'] = '0'
+
+        self._send(status, headers, content)
+        server.record(self.command, status, len(body),
+                      0 if self.command == 'HEAD' else len(content),
+                      time.time() - start)
+
+
+    def _read_body(self):
+        '''
+            @return: The request body, of Content-Length bytes or chunked.
+        '''
+        chunks = []
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                length = int(self.rfile.readline().split(';')[0].strip(), 16)
+                if length == 0:
+                    # The trailers end with an empty line.
+                    while self.rfile.readline().strip():
+                        pass
+                    break
+                chunks.append(self._read_throttled(length))
+                self.rfile.readline()
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                chunks.append(self._read_throttled(length))
+        return ''.join(chunks)
+
+
+    def _read_throttled(self, length):
+        '''
+            Reads bytes of the request body, at most at the bandwidth limit.
+            @param length: The number of bytes to read.
+            @return: The bytes read.
+        '''
+        chunks = []
+        start = time.time()
+        received = 0
+        while received < length:
+            chunk = self.rfile.read(min(CHUNK_SIZE, length - received))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+            self.server.throttle(start, received)
+        return ''.join(chunks)
+
+
+    def _send(self, status, headers, content):
+        '''
+            Sends a response. The body is sent at most at the bandwidth limit,
+            and not sent in response to a HEAD request.
+            @param status: The HTTP status.
+            @param headers: The response headers.
+            @param content: The response body, or the object data for HEAD.
+        '''
+        self.send_response(status)
+        headers.setdefault('Content-Length', '%d' % len(content))
+        for name, value in sorted(headers.items()):
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        start = time.time()
+        for offset in range(0, len(content), CHUNK_SIZE):
+            chunk = content[offset:offset + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            self.server.throttle(start, offset + len(chunk))
+
+
+    def _dispatch(self, body):
+        '''
+            Performs the operation the request addresses.
+            @param body: The request body.
+            @return: The status, the headers dictionary and the body.
+            @raise _Fake_Error: If the request failed.
+        '''
+        parts = urlparse.urlsplit(self.path)
+        query = urlparse.parse_qs(parts.query, keep_blank_values=True)
+        bucket_name, separator, object_name = parts.path[1:].partition('/')
+        bucket_name = urllib.unquote(bucket_name)
+        object_name = urllib.unquote(object_name)
+        method = self.command
+
+        if not bucket_name:
+            if method == 'GET':
+                return self._list_buckets()
+        elif not object_name:
+            if 'cors' in query:
+                if method == 'GET':
+                    return self._get_cors(bucket_name)
+                if method == 'PUT':
+                    return self._put_cors(bucket_name, body)
+            elif 'location' in query:
+                if method == 'GET':
+                    return self._get_location(bucket_name)
+            elif method == 'GET':
+                return self._list_objects(bucket_name, query)
+            elif method == 'PUT':
+                return self._create_bucket(bucket_name, body)
+            elif method == 'DELETE':
+                return self._delete_bucket(bucket_name)
+        elif 'upload_id' in query:
+            if method == 'PUT':
+                return self._put_resumable(query['upload_id'][0], body)
+        elif 'acl' in query:
+            if method == 'GET':
+                return self._get_acl(bucket_name, object_name)
+            if method == 'PUT':
+                return self._put_acl(bucket_name, object_name, body)
+        elif 'compose' in query:
+            if method in ('PUT', 'POST'):
+                return self._compose(bucket_name, object_name, body)
+        elif method in ('GET', 'HEAD'):
+            return self._get_object(bucket_name, object_name)
+        elif method == 'PUT':
+            if self.headers.get('x-goog-copy-source'):
+                return self._copy_object(bucket_name, object_name)
+            return self._put_object(bucket_name, object_name, body)
+        elif method == 'POST':
+            if self.headers.get('x-goog-resumable') == 'start':
+                return self._start_resumable(bucket_name, object_name)
+        elif method == 'DELETE':
+            return self._delete_object(bucket_name, object_name)
+
+        raise _Fake_Error(400, 'NotImplemented',
+                          'The fake server does not implement %s %s.' % (method, self.path))
+
+
+    def _get_bucket(self, bucket_name):
+        '''
+            @return: The _Fake_Bucket. The server lock must be held.
+            @raise _Fake_Error: If the bucket does not exist.
+        '''
+        bucket = self.server.buckets.get(bucket_name)
+        if bucket is None:
+            raise _Fake_Error(404, 'NoSuchBucket', 'The bucket %s does not exist.' % bucket_name)
+        return bucket
+
+
+    def _get_fake_object(self, bucket_name, object_name):
+        '''
+            @return: The _Fake_Object. The server lock must be held.
+            @raise _Fake_Error: If the bucket or the object does not exist.
+        '''
+        fake_object = self._get_bucket(bucket_name).objects.get(object_name)
+        if fake_object is None:
+            raise _Fake_Error(404, 'NoSuchKey', 'The key %s does not exist.' % object_name)
+        return fake_object
+
+
+    def _object_headers(self, fake_object):
+        '''
+            @return: The metadata headers of an object.
+        '''
+        hashes = []
+        if fake_object.crc32c is not None:
+            crc32c = struct.pack('>I', fake_object.crc32c)
+            hashes.append('crc32c=%s' % base64.b64encode(crc32c))
+        if fake_object.md5 is not None:
+            hashes.append('md5=%s' % base64.b64encode(fake_object.md5))
+        headers = {'ETag' : fake_object.get_etag(),
+                   'Last-Modified' : formatdate(fake_object.last_modified, usegmt=True),
+                   'Content-Type' : fake_object.content_type,
+                   'x-goog-generation' : '%d' % fake_object.generation,
+                   'x-goog-metageneration' : '%d' % fake_object.metageneration,
+                   'x-goog-hash' : ','.join(hashes),
+                   'x-goog-stored-content-length' : '%d' % len(fake_object.data),
+                   'x-goog-storage-class' : 'STANDARD'}
+        if fake_object.content_encoding:
+            headers['Content-Encoding'] = fake_object.content_encoding
+            headers['x-goog-stored-content-encoding'] = fake_object.content_encoding
+        return headers
+
+
+    def _check_digests(self, data):
+        '''
+            Compares the data with the Content-MD5 and x-goog-hash md5 sent.
+            @param data: The received object data.
+            @raise _Fake_Error: If a digest differs.
+        '''
+        md5 = base64.b64encode(hashlib.md5(data).digest())
+        expected = [self.headers.get('Content-MD5')]
+        for item in (self.headers.get('x-goog-hash') or '').split(','):
+            name, separator, value = item.strip().partition('=')
+            if name == 'md5':
+                expected.append(value)
+        for value in expected:
+            if value and value != md5:
+                raise _Fake_Error(400, 'BadDigest',
+                                  'The MD5 you specified did not match what we received.')
+
+
+    def _store_object(self, bucket_name, object_name, data):
+        '''
+            Creates or replaces an object with the headers of the request.
+            @return: The new _Fake_Object. The server lock must be held.
+        '''
+        bucket = self._get_bucket(bucket_name)
+        fake_object = _Fake_Object(data, self.server.next_generation(),
+                                   self.headers.get('Content-Type'),
+                                   self.headers.get('Content-Encoding'),
+                                   self.server.report_crc32c)
+        bucket.put(object_name, fake_object)
+        return fake_object
+
+
+    def _list_buckets(self):
+        entries = []
+        with self.server.lock:
+            for name, bucket in sorted(self.server.buckets.items()):
+                entries.append('<Bucket><Name>%s</Name><CreationDate>%s</CreationDate></Bucket>'
+                               % (escape(name), _iso_time(bucket.creation_date)))
+        content = ('<?xml version="1.0" encoding="UTF-8"?>'
+                   '<ListAllMyBucketsResult xmlns="%s"><Owner><ID>%s</ID></Owner>'
+                   '<Buckets>%s</Buckets></ListAllMyBucketsResult>'
+                   % (XML_NAMESPACE, OWNER_ID, ''.join(entries)))
+        return 200, {'Content-Type' : 'application/xml'}, content
+
+
+    def _create_bucket(self, bucket_name, body):
+        location = 'US'
+        if body:
+            try:
+                for elem in xml.fromstring(body).iter():
+                    if elem.tag.rsplit('}', 1)[-1] == 'LocationConstraint' and elem.text:
+                        location = elem.text
+            except SyntaxError:
+                raise _Fake_Error(400, 'MalformedBucketConfiguration',
+                                  'The XML you provided was not well-formed.')
+        with self.server.lock:
+            if bucket_name in self.server.buckets:
+                raise _Fake_Error(409, 'BucketAlreadyOwnedByYou',
+                                  'Your previous request to create the named bucket succeeded.')
+            self.server.buckets[bucket_name] = _Fake_Bucket(location)
+        return 200, {}, ''
+
+
+    def _delete_bucket(self, bucket_name):
+        with self.server.lock:
+            bucket = self._get_bucket(bucket_name)
+            if bucket.objects:
+                raise _Fake_Error(409, 'BucketNotEmpty',
+                                  'The bucket you tried to delete is not empty.')
+            del self.server.buckets[bucket_name]
+        return 204, {}, ''
+
+
+    def _get_cors(self, bucket_name):
+        with self.server.lock:
+            cors = self._get_bucket(bucket_name).cors
+        content = cors or '<?xml version="1.0" encoding="UTF-8"?><CorsConfig/>'
+        return 200, {'Content-Type' : 'application/xml'}, content
+
+
+    def _put_cors(self, bucket_name, body):
+        with self.server.lock:
+            self._get_bucket(bucket_name).cors = body
+        return 200, {}, ''
+
+
+    def _get_location(self, bucket_name):
+        with self.server.lock:
+            location = self._get_bucket(bucket_name).location
+        content = ('<?xml version="1.0" encoding="UTF-8"?>'
+                   '<LocationConstraint>%s</LocationConstraint>' % escape(location))
+        return 200, {'Content-Type' : 'application/xml'}, content
+
+
+    def _list_objects(self, bucket_name, query):
+        '''
+            Lists a page of the objects of a bucket.
+            @note: The names that contain the delimiter after the prefix
+            are grouped into common prefixes, which count as one entry.
+            NextMarker is returned when the page is truncated.
+        '''
+        prefix = query.get('prefix', [''])[0]
+        delimiter = query.get('delimiter', [''])[0]
+        marker = query.get('marker', [''])[0]
+        try:
+            max_keys = min(int(query.get('max-keys', [MAX_LIST_KEYS])[0]), MAX_LIST_KEYS)
+        except ValueError:
+            raise _Fake_Error(400, 'InvalidArgument', 'Invalid max-keys.')
+
+        entries = []
+        count = 0
+        last_name = None
+        is_truncated = False
+        with self.server.lock:
+            bucket = self._get_bucket(bucket_name)
+            names = bucket.names
+            index = bisect.bisect_left(names, prefix)
+            if marker:
+                index = max(index, bisect.bisect_right(names, marker))
+            while index < len(names):
+                name = names[index]
+                if not name.startswith(prefix):
+                    break
+                common_prefix = None
+                if delimiter:
+                    position = name.find(delimiter, len(prefix))
+                    if position >= 0:
+                        common_prefix = name[:position + len(delimiter)]
+                if common_prefix is not None and common_prefix <= marker:
+                    # The marker is this common prefix: skip its names.
+                    index = bisect.bisect_left(names, common_prefix + '\xff')
+                    continue
+                if count == max_keys:
+                    is_truncated = True
+                    break
+
+                if common_prefix is not None:
+                    entries.append('<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>'
+                                   % escape(common_prefix))
+                    last_name = common_prefix
+                    # Skip the other names of the common prefix.
+                    index = bisect.bisect_left(names, common_prefix + '\xff')
+                else:
+                    fake_object = bucket.objects[name]
+                    entries.append('<Contents><Key>%s</Key><Generation>%d</Generation>'
+                                   '<MetaGeneration>%d</MetaGeneration>'
+                                   '<LastModified>%s</LastModified><ETag>%s</ETag>'
+                                   '<Size>%d</Size><StorageClass>STANDARD</StorageClass>'
+                                   '<Owner><ID>%s</ID></Owner></Contents>'
+                                   % (escape(name), fake_object.generation,
+                                      fake_object.metageneration,
+                                      _iso_time(fake_object.last_modified),
+                                      escape(fake_object.get_etag()),
+                                      len(fake_object.data), OWNER_ID))
+                    last_name = name
+                    index += 1
+                count += 1
+
+        next_marker = ''
+        if is_truncated:
+            next_marker = '<NextMarker>%s</NextMarker>' % escape(last_name)
+        content = ('<?xml version="1.0" encoding="UTF-8"?>'
+                   '<ListBucketResult xmlns="%s"><Name>%s</Name><Prefix>%s</Prefix>'
+                   '<Marker>%s</Marker>%s<IsTruncated>%s</IsTruncated>%s</ListBucketResult>'
+                   % (XML_NAMESPACE, escape(bucket_name), escape(prefix), escape(marker),
+                      next_marker, is_truncated and 'true' or 'false', ''.join(entries)))
+        return 200, {'Content-Type' : 'application/xml'}, content
+
+
+    def _get_object(self, bucket_name, object_name):
+        '''
+            Downloads an object, or a range of it, or answers HEAD.
+            @note: If-None-Match and x-goog-if-generation-not-match answer
+            304 when they fail; x-goog-if-generation-match answers 412.
+        '''
+        with self.server.lock:
+            fake_object = self._get_fake_object(bucket_name, object_name)
+        headers = self._object_headers(fake_object)
+
+        generation_match = self.headers.get('x-goog-if-generation-match')
+        if generation_match and int(generation_match) != fake_object.generation:
+            raise _Fake_Error(412, 'PreconditionFailed',
+                              'At least one of the pre-conditions you specified did not hold.')
+        generation_not_match = self.headers.get('x-goog-if-generation-not-match')
+        if (self.headers.get('If-None-Match') == headers['ETag'] or
+                generation_not_match and int(generation_not_match) == fake_object.generation):
+            return 304, headers, ''
+
+        data = fake_object.data
+        byte_range = None
+        if self.headers.get('Range'):
+            byte_range = _parse_range(self.headers.get('Range'), len(data))
+        if byte_range is None:
+            return 200, headers, data
+
+        first, last = byte_range
+        headers['Content-Range'] = 'bytes %d-%d/%d' % (first, last, len(data))
+        return 206, headers, data[first:last + 1]
+
+
+    def _put_object(self, bucket_name, object_name, body):
+        self._check_digests(body)
+        with self.server.lock:
+            fake_object = self._store_object(bucket_name, object_name, body)
+        return 200, self._object_headers(fake_object), ''
+
+
+    def _copy_object(self, bucket_name, object_name):
+        source = urllib.unquote(self.headers.get('x-goog-copy-source')).lstrip('/')
+        source_bucket, separator, source_name = source.partition('/')
+        with self.server.lock:
+            source_object = self._get_fake_object(source_bucket, source_name)
+            bucket = self._get_bucket(bucket_name)
+            fake_object = _Fake_Object(source_object.data, self.server.next_generation(),
+                                       source_object.content_type,
+                                       source_object.content_encoding)
+            fake_object.copy_digests(source_object)
+            bucket.put(object_name, fake_object)
+        content = ('<?xml version="1.0" encoding="UTF-8"?><CopyObjectResult>'
+                   '<LastModified>%s</LastModified><ETag>%s</ETag></CopyObjectResult>'
+                   % (_iso_time(fake_object.last_modified), escape(fake_object.get_etag())))
+        headers = self._object_headers(fake_object)
+        headers['Content-Type'] = 'application/xml'
+        return 200, headers, content
+
+
+    def _compose(self, bucket_name, object_name, body):
+        try:
+            names = [elem.text for elem in xml.fromstring(body).iter()
+                     if elem.tag.rsplit('}', 1)[-1] == 'Name']
+        except SyntaxError:
+            raise _Fake_Error(400, 'MalformedXML', 'The XML you provided was not well-formed.')
+        if not names or len(names) > 32:
+            raise _Fake_Error(400, 'InvalidArgument', 'A compose request needs 1 to 32 components.')
+        with self.server.lock:
+            components = [self._get_fake_object(bucket_name, name) for name in names]
+            crc = components[0].get_crc32c()
+            for component in components[1:]:
+                crc = crc32c_combine(crc, component.get_crc32c(), len(component.data))
+            fake_object = self._store_object(bucket_name, object_name,
+                                             ''.join([component.data for component in components]))
+            # A composite object has a CRC32C digest only.
+            fake_object.md5 = None
+            fake_object.crc32c = crc
+            fake_object.component_count = sum([component.component_count or 1
+                                               for component in components])
+        return 200, self._object_headers(fake_object), ''
+
+
+    def _delete_object(self, bucket_name, object_name):
+        with self.server.lock:
+            self._get_fake_object(bucket_name, object_name)
+            self.server.buckets[bucket_name].delete(object_name)
+        return 204, {}, ''
+
+
+    def _get_acl(self, bucket_name, object_name):
+        with self.server.lock:
+            acl = self._get_fake_object(bucket_name, object_name).acl
+        content = acl or ('<?xml version="1.0" encoding="UTF-8"?><AccessControlList>'
+                          '<Owner><ID>%s</ID></Owner><Entries><Entry>'
+                          '<Scope type="UserById"><ID>%s</ID></Scope>'
+                          '<Permission>FULL_CONTROL</Permission></Entry></Entries>'
+                          '</AccessControlList>' % (OWNER_ID, OWNER_ID))
+        return 200, {'Content-Type' : 'application/xml'}, content
+
+
+    def _put_acl(self, bucket_name, object_name, body):
+        with self.server.lock:
+            fake_object = self._get_fake_object(bucket_name, object_name)
+            fake_object.acl = body
+            fake_object.metageneration += 1
+        return 200, {}, ''
+
+
+    def _start_resumable(self, bucket_name, object_name):
+        with self.server.lock:
+            self._get_bucket(bucket_name)
+            upload_id = binascii.hexlify(os.urandom(16))
+            self.server.uploads[upload_id] = {'bucket_name' : bucket_name,
+                                              'object_name' : object_name,
+                                              'content_type' : self.headers.get('Content-Type'),
+                                              'chunks' : [],
+                                              'committed' : 0,
+                                              'object' : None}
+        location = 'http://%s/%s/%s?upload_id=%s' % (
+                        self.headers.get('Host') or '%s:%d' % self.server.server_address,
+                        urllib.quote(bucket_name), urllib.quote(object_name), upload_id)
+        return 201, {'Location' : location}, ''
+
+
+    def _put_resumable(self, upload_id, body):
+        '''
+            Receives a chunk of a resumable upload, or answers a query of
+            the committed offset (Content-Range bytes */size).
+            @note: A chunk that overlaps the committed bytes is accepted,
+            and only its new bytes are kept.
+        '''
+        content_range = self.headers.get('Content-Range') or ''
+        unit, separator, byte_range = content_range.partition(' ')
+        positions, separator, total = byte_range.partition('/')
+        if unit != 'bytes' or not separator:
+            raise _Fake_Error(400, 'InvalidArgument', 'Invalid Content-Range.')
+        total = None if total == '*' else int(total)
+
+        with self.server.lock:
+            upload = self.server.uploads.get(upload_id)
+            if upload is None:
+                raise _Fake_Error(404, 'NoSuchUpload', 'The upload session does not exist.')
+            if upload['object'] is not None:
+                return 200, self._object_headers(upload['object']), ''
+
+            if positions != '*':
+                first, separator, last = positions.partition('-')
+                first, last = int(first), int(last)
+                if first > upload['committed'] or last - first + 1 != len(body):
+                    raise _Fake_Error(400, 'InvalidArgument',
+                                      'The chunk does not follow the committed bytes.')
+                if last >= upload['committed']:
+                    upload['chunks'].append(body[upload['committed'] - first:])
+                    upload['committed'] = last + 1
+
+            if total is None or upload['committed'] < total:
+                headers = {}
+                if upload['committed']:
+                    headers['Range'] = 'bytes=0-%d' % (upload['committed'] - 1)
+                return RESUME_INCOMPLETE, headers, ''
+
+            data = ''.join(upload['chunks'])
+            upload['chunks'] = []
+            try:
+                self._check_digests(data)
+            except _Fake_Error:
+                del self.server.uploads[upload_id]
+                raise
+            fake_object = self._store_object(upload['bucket_name'], upload['object_name'], data)
+            if upload['content_type']:
+                fake_object.content_type = upload['content_type']
+            upload['object'] = fake_object
+        return 200, self._object_headers(fake_object), ''
+
+
+class GCS_Fake_Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+        Serves the XML API subset from memory.
+        Attributes:
+            url: The endpoint URL, such as http://127.0.0.1:8080, to pass
+            to set_endpoint.
+            latency_secs: The delay before each response.
+            latency_jitter_secs: The maximum random delay added to latency_secs.
+            bandwidth_bps: The bytes per second of each request and response
+            body, or None for no limit.
+            error_rate: The fraction of requests answered 503.
+            throttle_rate: The fraction of requests answered 429.
+            reset_rate: The fraction of requests whose connection is closed
+            without a response.
+            report_crc32c: Whether the objects have a CRC32C digest, in
+            addition to their MD5 digest. Composite objects always have one.
+            buckets: The dictionary of the bucket names and _Fake_Bucket.
+        @note: The attributes can be changed while the server runs.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency_secs=0, latency_jitter_secs=0,
+                 bandwidth_bps=None, error_rate=0, throttle_rate=0, reset_rate=0,
+                 seed=None, verbose=False, crc32c=None):
+        '''
+            Initializes GCS_Fake_Server and binds its socket.
+            @param host: The address to listen on.
+            @param port: The port to listen on. 0 chooses a free port.
+            @param seed: The seed of the injected faults, or None.
+            @param verbose: Whether each request is logged to stderr.
+            @param crc32c: Whether the objects have a CRC32C digest, or None
+            for only when a C extension computes it.
+            See the class attributes for the other parameters.
+        '''
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), GCS_Fake_Handler)
+        self.url = 'http://%s:%d' % self.server_address
+        self.latency_secs = latency_secs
+        self.latency_jitter_secs = latency_jitter_secs
+        self.bandwidth_bps = bandwidth_bps
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.reset_rate = reset_rate
+        self.verbose = verbose
+        self.report_crc32c = CRC32C_NATIVE if crc32c is None else crc32c
+        self.buckets = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._generation = int(time.time() * 1000000)
+        self._thread = None
+        self.reset_stats()
+
+
+    def next_generation(self):
+        '''
+            @return: A new object generation. The lock must be held.
+        '''
+        self._generation += 1
+        return self._generation
+
+
+    def draw_fault(self):
+        '''
+            Chooses the fault injected into a request.
+            @return: 503, 429, 'reset' or None.
+        '''
+        with self.lock:
+            draw = self._random.random()
+        if draw < self.error_rate:
+            return 503
+        draw -= self.error_rate
+        if draw < self.throttle_rate:
+            return 429
+        draw -= self.throttle_rate
+        if draw < self.reset_rate:
+            return 'reset'
+        return None
+
+
+    def throttle(self, start, nbytes):
+        '''
+            Waits until nbytes may have been transferred since start.
+        '''
+        if self.bandwidth_bps:
+            delay = start + float(nbytes) / self.bandwidth_bps - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+
+    def record(self, method, status, bytes_received, bytes_sent, elapsed):
+        '''
+            Counts a request in the server statistics.
+        '''
+        with self.lock:
+            self._stats['requests'] += 1
+            self._stats['bytes_received'] += bytes_received
+            self._stats['bytes_sent'] += bytes_sent
+            self._stats['busy_secs'] += elapsed
+            methods = self._stats['methods']
+            methods[method] = methods.get(method, 0) + 1
+            statuses = self._stats['statuses']
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+
+    def reset_stats(self):
+        '''
+            Discards the server statistics.
+        '''
+        with self.lock:
+            self._stats = {'requests' : 0, 'bytes_received' : 0, 'bytes_sent' : 0,
+                           'busy_secs' : 0.0, 'methods' : {}, 'statuses' : {}}
+
+
+    def stats(self):
+        '''
+            @return: Dictionary of the requests, bytes received and sent,
+            handling time, and the requests per method and status.
+        '''
+        with self.lock:
+            stats = dict(self._stats)
+            stats['methods'] = dict(stats['methods'])
+            stats['statuses'] = dict(stats['statuses'])
+            stats['busy_secs'] = round(stats['busy_secs'], 3)
+        return stats
+
+
+    def start(self):
+        '''
+            Serves the requests in a background thread.
+            @return: The server.
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+
+    def stop(self):
+        '''
+            Stops serving and closes the socket.
+        '''
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+
+def main():
+    parser = optparse.OptionParser(
+                usage='%prog [--port N] [--latency_ms N] [--bandwidth_mbps N] [--error_rate F]')
+    parser.add_option('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_option('--port', type='int', default=8080, help='Port to listen on.')
+    parser.add_option('--latency_ms', type='float', default=0,
+                      help='Delay before each response in milliseconds.')
+    parser.add_option('--jitter_ms', type='float', default=0,
+                      help='Maximum random delay added to the latency in milliseconds.')
+    parser.add_option('--bandwidth_mbps', type='float', default=None,
+                      help='Megabits per second of each body. Default: no limit.')
+    parser.add_option('--error_rate', type='float', default=0,
+                      help='Fraction of requests answered 503.')
+    parser.add_option('--throttle_rate', type='float', default=0,
+                      help='Fraction of requests answered 429.')
+    parser.add_option('--reset_rate', type='float', default=0,
+                      help='Fraction of connections closed without a response.')
+    parser.add_option('--bucket', action='append', default=[],
+                      help='Bucket to create at startup. Can be repeated.')
+    parser.add_option('--crc32c', action='store_true', default=None,
+                      help='Report the CRC32C digest of every object. Default: only when '
+                           'a crc32c or crcmod C extension is installed.')
+    parser.add_option('--verbose', action='store_true', default=False,
+                      help='Log each request.')
+    options, arguments = parser.parse_args()
+
+    bandwidth_bps = None
+    if options.bandwidth_mbps:
+        bandwidth_bps = options.bandwidth_mbps * 1000000 / 8
+    server = GCS_Fake_Server(options.host, options.port,
+                             options.latency_ms / 1000.0, options.jitter_ms / 1000.0,
+                             bandwidth_bps, options.error_rate, options.throttle_rate,
+                             options.reset_rate, verbose=options.verbose,
+                             crc32c=options.crc32c)
+    for bucket_name in options.bucket:
+        server.buckets[bucket_name] = _Fake_Bucket('US')
+
+    print 'Fake XML API listening on %s. Run main.py --endpoint %s' % (server.url, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+'''
+    Contains the classes which pace the API requests sent to each bucket
+    host: GCS_Token_Bucket limits the request rate, GCS_Adaptive_Limiter
+    limits the requests in progress, and GCS_Flow_Controller keeps one of
+    each per host.
+    @note: The limit of requests in progress follows an additive increase,
+    multiplicative decrease (AIMD) rule. It grows by one for every limit
+    requests that succeed, and is cut by a factor when the service answers
+    429 or 503. So the concurrency settles just below the point where the
+    service starts throttling.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import threading
+import time
+import urlparse
+
+# Local imports
+import config
+
+
+# HTTP status codes with which the service signals throttling.
+THROTTLE_STATUSES = (429, 503)
+
+
+class GCS_Token_Bucket(object):
+    '''
+        Limits the rate of the requests.
+        Attributes:
+            rate: The number of tokens added per second.
+            burst: The maximum number of tokens stored.
+        @note: A request that finds no token reserves one anyway, and waits
+        until it is due, so the waiting requests are served in order.
+    '''
+
+    def __init__(self, rate, burst):
+        '''
+            Initializes GCS_Token_Bucket.
+            @param rate: The number of requests allowed per second.
+            @param burst: The number of requests allowed at once after an
+            idle period.
+        '''
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._time = time.time()
+        self._lock = threading.Lock()
+
+
+    def acquire(self):
+        '''
+            Takes a token, waiting until one is available.
+            @return: The seconds waited.
+        '''
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._time) * self.rate)
+            self._time = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+    def set_rate(self, rate):
+        '''
+            Changes the rate. The tokens added until now count at the 
+            previous rate.
+            @param rate: The number of requests allowed per second.
+        '''
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._time) * self.rate)
+            self._time = now
+            self.rate = float(rate)
+
+
+class GCS_Adaptive_Limiter(object):
+    '''
+        Limits the number of requests in progress, adapting the limit to
+        the throttling signals of the service.
+        Attributes:
+            limit: The current limit. It is a float; its integer part is used.
+            minimum: The lowest limit.
+            maximum: The highest limit.
+            decrease_factor: The factor the limit is multiplied by when the
+            service throttles the requests.
+            in_flight: The number of requests in progress.
+            throttled: The number of throttled requests.
+        @note: The limit is cut at most once per window: the requests that
+        were already in progress when it was cut do not cut it again.
+    '''
+
+    def __init__(self, initial, minimum, maximum, decrease_factor):
+        '''
+            Initializes GCS_Adaptive_Limiter.
+            @param initial: The initial limit.
+            @param minimum: The lowest limit.
+            @param maximum: The highest limit.
+            @param decrease_factor: The factor applied on throttling.
+        '''
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.throttled = 0
+        self._sequence = 0
+        self._decrease_sequence = 0
+        self._condition = threading.Condition()
+
+
+    def acquire(self):
+        '''
+            Waits until the number of requests in progress is below the limit.
+            @return: The ticket to pass to release.
+        '''
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self._sequence += 1
+            return self._sequence
+
+
+    def release(self, ticket, status):
+        '''
+            Records the end of a request and adapts the limit.
+            @param ticket: The ticket returned by acquire.
+            @param status: The HTTP status of the response, or None if no
+            response was received.
+        '''
+        with self._condition:
+            self.in_flight -= 1
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                if ticket > self._decrease_sequence:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._decrease_sequence = self._sequence
+            elif status is not None and status < 500:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class GCS_Flow_Controller(object):
+    '''
+        Paces the requests with a separate rate and concurrency budget for
+        each host (each bucket has its own host name).
+        Attributes:
+            rate: The requests per second allowed per host, or None for no
+            rate limit. Setting it also changes the rate of the hosts 
+            already in use.
+            burst: The requests allowed at once per host after an idle period.
+            initial: The initial limit of requests in progress per host.
+            minimum: The lowest limit of requests in progress per host.
+            maximum: The highest limit of requests in progress per host.
+            decrease_factor: The factor applied to the limit on throttling.
+    '''
+
+    def __init__(self, rate=config.FLOW_RATE_PER_HOST,
+                 burst=config.FLOW_BURST_PER_HOST,
+                 initial=config.FLOW_INITIAL_CONCURRENCY,
+                 minimum=config.FLOW_MIN_CONCURRENCY,
+                 maximum=config.FLOW_MAX_CONCURRENCY,
+                 decrease_factor=config.FLOW_DECREASE_FACTOR):
+        '''
+            Initializes GCS_Flow_Controller.
+            @param rate: The requests per second allowed per host or None.
+            @param burst: The requests allowed at once per host.
+            @param initial: The initial limit of requests in progress.
+            @param minimum: The lowest limit of requests in progress.
+            @param maximum: The highest limit of requests in progress.
+            @param decrease_factor: The factor applied on throttling.
+        '''
+        self._rate = rate
+        self.burst = burst
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+
+    @property
+    def rate(self):
+        '''
+            @return: The requests per second allowed per host or None.
+        '''
+        return self._rate
+
+
+    @rate.setter
+    def rate(self, rate):
+        '''
+            Changes the rate limit of all the hosts.
+            @param rate: The requests per second allowed per host or None.
+        '''
+        with self._lock:
+            self._rate = rate
+            for host, (token_bucket, limiter) in self._hosts.items():
+                if not rate:
+                    token_bucket = None
+                elif token_bucket is None:
+                    token_bucket = GCS_Token_Bucket(rate, self.burst)
+                else:
+                    token_bucket.set_rate(rate)
+                self._hosts[host] = (token_bucket, limiter)
+
+
+    def _get_budget(self, host):
+        '''
+            Gets the rate limiter and the concurrency limiter of a host.
+            @param host: The host name.
+            @return: The (GCS_Token_Bucket or None, GCS_Adaptive_Limiter) tuple.
+        '''
+        with self._lock:
+            budget = self._hosts.get(host)
+            if budget is None:
+                token_bucket = None
+                if self._rate:
+                    token_bucket = GCS_Token_Bucket(self._rate, self.burst)
+                budget = (token_bucket,
+                          GCS_Adaptive_Limiter(self.initial, self.minimum,
+                                               self.maximum, self.decrease_factor))
+                self._hosts[host] = budget
+            return budget
+
+
+    def acquire(self, url):
+        '''
+            Waits until a request to the URL can be sent.
+            @param url: The absolute request URL.
+            @return: The slot to pass to release.
+        '''
+        token_bucket, limiter = self._get_budget(urlparse.urlsplit(url).netloc)
+        if token_bucket is not None:
+            token_bucket.acquire()
+        return limiter, limiter.acquire()
+
+
+    def release(self, slot, status):
+        '''
+            Records the end of a request.
+            @param slot: The slot returned by acquire.
+            @param status: The HTTP status of the response, or None if no
+            response was received.
+        '''
+        limiter, ticket = slot
+        limiter.release(ticket, status)
+
+
+    def snapshot(self):
+        '''
+            @return: Dictionary of the limit, requests in progress and
+            throttled requests of each host.
+        '''
+        with self._lock:
+            budgets = self._hosts.items()
+        hosts = {}
+        for host, (token_bucket, limiter) in budgets:
+            hosts[host] = {'limit' : int(limiter.limit),
+                           'in_flight' : limiter.in_flight,
+                           'throttled' : limiter.throttled}
+        return hosts
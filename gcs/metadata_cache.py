@@ -0,0 +1,177 @@
+'''
+    Contains the GCS_Metadata_Cache class which keeps the recent metadata
+    lookups (HEAD, ACL, CORS and location responses) in memory.
+    @note: The entries are keyed by (bucket, object, subresource). The
+    object is None for the bucket subresources. An entry expires after a
+    fixed time, and the least recently used entry is evicted when the
+    cache is full. The write operations invalidate the entries they make
+    stale.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import threading
+import time
+from collections import OrderedDict
+
+# Local imports
+import config
+
+
+class GCS_Metadata_Cache(object):
+    '''
+        Bounded LRU cache with a time to live per entry.
+        Attributes:
+            max_entries: The maximum number of entries.
+            ttl: The seconds an entry is valid.
+            hits: The number of lookups answered by the cache.
+            misses: The number of lookups not found or expired.
+            evictions: The number of entries evicted because the cache was full.
+            invalidations: The number of entries removed by write operations.
+        @note: The methods are safe to call from concurrent worker threads.
+    '''
+
+    def __init__(self, max_entries=config.METADATA_CACHE_SIZE,
+                 ttl=config.METADATA_CACHE_TTL_SECS):
+        '''
+            Initializes GCS_Metadata_Cache.
+            @param max_entries: The maximum number of entries. 0 disables
+            the cache.
+            @param ttl: The seconds an entry is valid.
+        '''
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        # The subresources cached for each bucket and object, so an 
+        # invalidation does not scan all the entries.
+        self._index = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        '''
+            Looks up an entry.
+            @param key: The (bucket, object, subresource) tuple.
+            @return: A (found, value) tuple.
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._remove_index(key)
+                self.misses += 1
+                return False, None
+            # Move the entry to the most recently used end.
+            self._entries[key] = entry
+            self.hits += 1
+            return True, entry[1]
+
+
+    def put(self, key, value):
+        '''
+            Stores an entry.
+            @param key: The (bucket, object, subresource) tuple.
+            @param value: The value to cache.
+        '''
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            bucket_name, object_name, subresource = key
+            self._index.setdefault(bucket_name, {}).setdefault(
+                                        object_name, set()).add(subresource)
+            while len(self._entries) > self.max_entries:
+                evicted_key, entry = self._entries.popitem(last=False)
+                self._remove_index(evicted_key)
+                self.evictions += 1
+
+
+    def _remove_index(self, key):
+        '''
+            Removes a key from the index. The lock must be held.
+            @param key: The (bucket, object, subresource) tuple.
+        '''
+        bucket_name, object_name, subresource = key
+        objects = self._index.get(bucket_name)
+        if objects is None:
+            return
+        subresources = objects.get(object_name)
+        if subresources is None:
+            return
+        subresources.discard(subresource)
+        if not subresources:
+            del objects[object_name]
+            if not objects:
+                del self._index[bucket_name]
+
+
+    def invalidate(self, bucket_name, object_name=None):
+        '''
+            Removes the entries of an object.
+            @param bucket_name: The bucket name.
+            @param object_name: The object name, or None for the entries
+            of the bucket subresources.
+        '''
+        with self._lock:
+            objects = self._index.get(bucket_name)
+            if not objects or object_name not in objects:
+                return
+            subresources = objects.pop(object_name)
+            if not objects:
+                del self._index[bucket_name]
+            self._remove_entries(bucket_name, {object_name : subresources})
+
+
+    def invalidate_bucket(self, bucket_name):
+        '''
+            Removes the entries of a bucket and of all its objects.
+            @param bucket_name: The bucket name.
+        '''
+        with self._lock:
+            objects = self._index.pop(bucket_name, None)
+            if objects:
+                self._remove_entries(bucket_name, objects)
+
+
+    def _remove_entries(self, bucket_name, objects):
+        '''
+            Removes the entries of some objects of a bucket. The lock must 
+            be held.
+            @param bucket_name: The bucket name.
+            @param objects: Dictionary of the object names and the sets of 
+            their cached subresources.
+        '''
+        for object_name, subresources in objects.items():
+            for subresource in subresources:
+                if self._entries.pop((bucket_name, object_name, subresource), None):
+                    self.invalidations += 1
+
+
+    def clear(self):
+        '''
+            Removes all the entries.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+
+    def stats(self):
+        '''
+            @return: Dictionary of the entries, hits, misses, hit ratio,
+            evictions and invalidations.
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries' : len(self._entries),
+                    'hits' : self.hits,
+                    'misses' : self.misses,
+                    'hit_ratio' : round(float(self.hits) / lookups, 4) if lookups else None,
+                    'evictions' : self.evictions,
+                    'invalidations' : self.invalidations}
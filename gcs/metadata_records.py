@@ -0,0 +1,166 @@
+'''
+    Contains the GCS_Object_Metadata and GCS_Bucket_Metadata classes which
+    hold the metadata of listing entries and HEAD responses.
+    @note: The classes use __slots__, integer timestamps and interned
+    strings for the values shared by many entries (key prefixes, storage
+    classes), so inventories of millions of objects fit in memory.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import calendar
+from email.utils import parsedate
+
+
+def parse_iso_timestamp(value):
+    '''
+        Converts an XML API timestamp to seconds since the epoch.
+        @param value: A timestamp such as 2014-03-14T10:30:00.000Z or None.
+        @return: The integer UTC timestamp or None.
+        @note: The fields are sliced instead of using strptime, which is
+        several times slower on large listings.
+    '''
+    if not value:
+        return None
+    return calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                            int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                            0, 0, 0))
+
+
+def parse_http_timestamp(value):
+    '''
+        Converts an HTTP date header to seconds since the epoch.
+        @param value: A date such as Fri, 14 Mar 2014 10:30:00 GMT or None.
+        @return: The integer UTC timestamp or None.
+    '''
+    if not value:
+        return None
+    date = parsedate(value)
+    if date is None:
+        return None
+    return calendar.timegm(date)
+
+
+def _intern(value):
+    '''
+        Interns a string, so equal values share one object.
+        @param value: A string or None.
+        @return: The interned string or None.
+    '''
+    if value is None:
+        return None
+    if isinstance(value, unicode):
+        # Only byte strings can be interned.
+        try:
+            value = value.encode('ascii')
+        except UnicodeEncodeError:
+            return value
+    return intern(value)
+
+
+class GCS_Object_Metadata(object):
+    '''
+        Holds the metadata of an object.
+        Attributes:
+            key: The object name.
+            size: The size in bytes.
+            etag: The entity tag.
+            generation: The object generation or None.
+            last_modified: The UTC modification time in seconds since the epoch.
+            storage_class: The storage class (such as STANDARD) or None.
+        @note: The key is stored as an interned prefix, up to the last /,
+        and the rest of the name. Objects in the same "directory" share
+        the prefix string.
+    '''
+
+    __slots__ = ('_prefix', '_name', 'size', 'etag', 'generation',
+                 'last_modified', 'storage_class')
+
+    def __init__(self, key, size, etag=None, generation=None,
+                 last_modified=None, storage_class=None):
+        '''
+            Initializes GCS_Object_Metadata.
+            @param key: The object name.
+            @param size: The size in bytes.
+            @param etag: The entity tag.
+            @param generation: The object generation.
+            @param last_modified: The UTC modification time in seconds.
+            @param storage_class: The storage class.
+        '''
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.generation = generation
+        self.last_modified = last_modified
+        self.storage_class = _intern(storage_class)
+
+    def _get_key(self):
+        '''
+            @return: The object name.
+        '''
+        return self._prefix + self._name
+
+    def _set_key(self, key):
+        '''
+            Splits the object name into interned prefix and name.
+            @param key: The object name.
+        '''
+        key = key or ''
+        index = key.rfind('/') + 1
+        self._prefix = _intern(key[:index])
+        self._name = key[index:]
+
+    key = property(_get_key, _set_key)
+
+    def __repr__(self):
+        '''
+            @return: The string representation of the metadata.
+        '''
+        return ('GCS_Object_Metadata(key=%r, size=%r, etag=%r, generation=%r, '
+                'last_modified=%r, storage_class=%r)' % (
+                    self.key, self.size, self.etag, self.generation,
+                    self.last_modified, self.storage_class))
+
+    @classmethod
+    def from_headers(cls, object_name, response):
+        '''
+            Creates the metadata from the headers of a HEAD or GET response.
+            @param object_name: The object name.
+            @param response: The response dictionary (lower case keys).
+            @return: A GCS_Object_Metadata.
+        '''
+        generation = response.get('x-goog-generation')
+        return cls(object_name,
+                   int(response.get('content-length') or 0),
+                   response.get('etag'),
+                   int(generation) if generation else None,
+                   parse_http_timestamp(response.get('last-modified')),
+                   response.get('x-goog-storage-class'))
+
+
+class GCS_Bucket_Metadata(object):
+    '''
+        Holds the metadata of a bucket.
+        Attributes:
+            name: The bucket name.
+            creation_date: The UTC creation time in seconds since the epoch.
+    '''
+
+    __slots__ = ('name', 'creation_date')
+
+    def __init__(self, name, creation_date=None):
+        '''
+            Initializes GCS_Bucket_Metadata.
+            @param name: The bucket name.
+            @param creation_date: The UTC creation time in seconds.
+        '''
+        self.name = name
+        self.creation_date = creation_date
+
+    def __repr__(self):
+        '''
+            @return: The string representation of the metadata.
+        '''
+        return 'GCS_Bucket_Metadata(name=%r, creation_date=%r)' % (
+                    self.name, self.creation_date)
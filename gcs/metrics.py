@@ -0,0 +1,368 @@
+'''
+    Contains the GCS_Metrics class which collects the counters and the
+    latency histograms of the API requests, and the GCS_Latency_Histogram
+    class which estimates the latency percentiles.
+    @note: Every HTTP request is recorded when its response stream is
+    closed, so the repetitions of a retried call are counted separately.
+    The metrics can be dumped as JSON or in the Prometheus text format.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import json
+import threading
+import time
+import urlparse
+
+# Local imports
+import config
+from retry_policy import retry_stats
+
+
+# Upper bounds of the latency buckets in seconds, from 10 microseconds (a
+# request to a local server takes well under 1 ms) to about 2 minutes. Each
+# bound is 25% above the previous one, so a percentile is estimated within
+# 25%.
+LATENCY_BUCKETS = tuple([0.00001 * (1.25 ** i) for i in range(74)])
+
+# Percentiles reported in the JSON dump.
+PERCENTILES = (50, 95, 99)
+
+# Query string parameters which select a sub-resource of a bucket or object.
+SUBRESOURCES = ('acl', 'cors', 'location', 'compose', 'upload_id', 'uploads',
+                'logging', 'versioning', 'lifecycle', 'website')
+
+def get_operation(url):
+    '''
+        Names the kind of resource a request addresses.
+        @param url: The absolute request URL.
+        @return: service, bucket or object, followed by the sub-resource
+        if any, for example object:acl or bucket:cors.
+    '''
+    parts = urlparse.urlsplit(url)
+    path = parts.path.lstrip('/')
+    if parts.netloc.split(':')[0] == config.GCS_END_POINT.split(':')[0]:
+        # Path style URL, such as a resumable upload session URI or any
+        # request when config.GCS_PATH_STYLE is set.
+        path = path.partition('/')[2] if path else None
+
+    if path is None:
+        operation = 'service'
+    elif path:
+        operation = 'object'
+    else:
+        operation = 'bucket'
+
+    for parameter in parts.query.split('&'):
+        name = parameter.partition('=')[0]
+        if name in SUBRESOURCES:
+            return '%s:%s' % (operation, name)
+    return operation
+
+
+class GCS_Latency_Histogram(object):
+    '''
+        Counts latencies in exponential buckets.
+        Attributes:
+            counts: The number of latencies of each bucket. The last one
+            counts the latencies above the highest bound.
+            count: The number of latencies.
+            sum: The sum of the latencies in seconds.
+            min: The lowest latency in seconds, or None.
+            max: The highest latency in seconds, or None.
+    '''
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        '''
+            Initializes GCS_Latency_Histogram.
+        '''
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+
+    def add(self, seconds):
+        '''
+            Records a latency.
+            @param seconds: The latency in seconds.
+        '''
+        low, high = 0, len(LATENCY_BUCKETS)
+        while low < high:
+            middle = (low + high) // 2
+            if seconds <= LATENCY_BUCKETS[middle]:
+                high = middle
+            else:
+                low = middle + 1
+        self.counts[low] += 1
+        self.count += 1
+        self.sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+
+    def percentile(self, percent):
+        '''
+            Estimates a percentile.
+            @param percent: The percentile, such as 99.
+            @return: The latency in seconds, interpolated within its bucket
+            and kept between the lowest and highest latency recorded, or 
+            None if no latency was recorded.
+        '''
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        value = self.max
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index < len(LATENCY_BUCKETS):
+                    lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                    upper = LATENCY_BUCKETS[index]
+                    value = lower + (upper - lower) * (rank - seen) / bucket_count
+                break
+            seen += bucket_count
+        return min(self.max, max(self.min, value))
+
+
+    def summary(self):
+        '''
+            @return: Dictionary of the count, and of the mean, the lowest,
+            the highest and the percentiles in milliseconds.
+        '''
+        summary = {'count' : self.count,
+                   'mean_ms' : round(self.sum * 1000.0 / self.count, 3) if self.count else None,
+                   'min_ms' : round(self.min * 1000.0, 3) if self.count else None,
+                   'max_ms' : round(self.max * 1000.0, 3) if self.count else None}
+        for percent in PERCENTILES:
+            value = self.percentile(percent)
+            summary['p%d_ms' % percent] = round(value * 1000.0, 3) if value is not None else None
+        return summary
+
+
+class _Operation_Metrics(object):
+    '''
+        Holds the metrics of one method and operation.
+    '''
+
+    __slots__ = ('requests', 'errors', 'bytes_sent', 'bytes_received', 'ttfb', 'total')
+
+    def __init__(self):
+        '''
+            Initializes _Operation_Metrics.
+        '''
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.ttfb = GCS_Latency_Histogram()
+        self.total = GCS_Latency_Histogram()
+
+
+class GCS_Metrics(object):
+    '''
+        Collects the metrics of the API requests.
+        Attributes:
+            start_time: The time the collection started.
+        @note: The methods are safe to call from concurrent worker threads.
+    '''
+
+    def __init__(self):
+        '''
+            Initializes GCS_Metrics.
+        '''
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        '''
+            Discards all the metrics.
+        '''
+        with self._lock:
+            self.start_time = time.time()
+            self._operations = {}
+            self._statuses = {}
+
+
+    def _get_operation(self, method, url):
+        '''
+            @return: The _Operation_Metrics of a request. The lock must be held.
+        '''
+        key = (method, get_operation(url))
+        operation = self._operations.get(key)
+        if operation is None:
+            operation = self._operations[key] = _Operation_Metrics()
+        return operation
+
+
+    def record_stream(self, stream):
+        '''
+            Records a request whose response stream was closed.
+            @param stream: The closed GCS_Response_Stream.
+        '''
+        status = stream.response.status
+        with self._lock:
+            operation = self._get_operation(stream.method, stream.url)
+            operation.requests += 1
+            if status >= 300:
+                operation.errors += 1
+            operation.bytes_sent += stream.bytes_sent
+            operation.bytes_received += stream.bytes_received
+            operation.ttfb.add(stream.ttfb)
+            operation.total.add(stream.total_time)
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+
+    def record_failure(self, method, url, elapsed):
+        '''
+            Records a request that received no response.
+            @param method: The HTTP request method.
+            @param url: The absolute request URL.
+            @param elapsed: The seconds until the request failed.
+        '''
+        with self._lock:
+            operation = self._get_operation(method, url)
+            operation.requests += 1
+            operation.errors += 1
+            operation.total.add(elapsed)
+            self._statuses['none'] = self._statuses.get('none', 0) + 1
+
+
+    def snapshot(self, hosts=None, caches=None):
+        '''
+            Gets the metrics.
+            @param hosts: The GCS_Flow_Controller snapshot to include, or None.
+            @param caches: Dictionary of the cache names and their stats to
+            include, or None.
+            @return: Dictionary of the metrics, ready for JSON.
+        '''
+        with self._lock:
+            operations = []
+            for (method, name), operation in sorted(self._operations.items()):
+                operations.append({'method' : method,
+                                   'operation' : name,
+                                   'requests' : operation.requests,
+                                   'errors' : operation.errors,
+                                   'bytes_sent' : operation.bytes_sent,
+                                   'bytes_received' : operation.bytes_received,
+                                   'ttfb' : operation.ttfb.summary(),
+                                   'total' : operation.total.summary()})
+            statuses = dict([(str(status), count)
+                             for status, count in self._statuses.items()])
+            elapsed = time.time() - self.start_time
+
+        snapshot = {'elapsed_secs' : round(elapsed, 3),
+                    'operations' : operations,
+                    'statuses' : statuses,
+                    'retries' : retry_stats.snapshot()}
+        if hosts is not None:
+            snapshot['hosts'] = hosts
+        if caches is not None:
+            snapshot['caches'] = caches
+        return snapshot
+
+
+    def to_json(self, hosts=None, caches=None):
+        '''
+            @param hosts: The GCS_Flow_Controller snapshot to include, or None.
+            @param caches: The cache stats to include, or None.
+            @return: The metrics as a JSON string.
+        '''
+        return json.dumps(self.snapshot(hosts, caches), sort_keys=True, indent=2)
+
+
+    def to_prometheus(self, hosts=None, caches=None):
+        '''
+            @param hosts: The GCS_Flow_Controller snapshot to include, or None.
+            @param caches: The cache stats to include, or None.
+            @return: The metrics in the Prometheus text exposition format.
+        '''
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        with self._lock:
+            operations = sorted(self._operations.items())
+            statuses = sorted(self._statuses.items())
+
+        counters = (('gcs_requests_total', 'requests', 'HTTP requests sent.'),
+                    ('gcs_request_errors_total', 'errors',
+                     'HTTP requests without a 2xx response.'),
+                    ('gcs_bytes_sent_total', 'bytes_sent', 'Request body bytes sent.'),
+                    ('gcs_bytes_received_total', 'bytes_received',
+                     'Response body bytes received.'))
+        for name, attribute, help_text in counters:
+            header(name, 'counter', help_text)
+            for (method, operation_name), operation in operations:
+                lines.append('%s{method="%s",operation="%s"} %d' % (
+                                name, method, operation_name, getattr(operation, attribute)))
+
+        header('gcs_responses_total', 'counter', 'HTTP responses by status code.')
+        for status, count in statuses:
+            lines.append('gcs_responses_total{status="%s"} %d' % (status, count))
+
+        histograms = (('gcs_request_ttfb_seconds', 'ttfb',
+                       'Time from the request start to the response headers.'),
+                      ('gcs_request_duration_seconds', 'total',
+                       'Time from the request start to the end of the response body.'))
+        for name, attribute, help_text in histograms:
+            header(name, 'histogram', help_text)
+            for (method, operation_name), operation in operations:
+                histogram = getattr(operation, attribute)
+                labels = 'method="%s",operation="%s"' % (method, operation_name)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%.6g"} %d' % (name, labels, bound, cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, histogram.count))
+                lines.append('%s_sum{%s} %.6f' % (name, labels, histogram.sum))
+                lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+
+        retries = retry_stats.snapshot()
+        retry_counters = (('gcs_api_calls_total', 'calls', 'API calls.'),
+                          ('gcs_retries_total', 'retries', 'Repeated requests.'),
+                          ('gcs_retry_backoff_seconds_total', 'backoff_secs',
+                           'Time spent waiting before repeated requests.'),
+                          ('gcs_retry_exhausted_total', 'exhausted',
+                           'API calls that failed after repeated requests.'))
+        for name, key, help_text in retry_counters:
+            header(name, 'counter', help_text)
+            lines.append('%s %s' % (name, retries[key]))
+
+        if hosts is not None:
+            header('gcs_host_concurrency_limit', 'gauge',
+                   'Current limit of requests in progress per host.')
+            for host, values in sorted(hosts.items()):
+                lines.append('gcs_host_concurrency_limit{host="%s"} %d' % (host, values['limit']))
+            header('gcs_host_throttled_total', 'counter', 'Throttled requests per host.')
+            for host, values in sorted(hosts.items()):
+                lines.append('gcs_host_throttled_total{host="%s"} %d' % (host, values['throttled']))
+
+        if caches is not None:
+            cache_metrics = (('gcs_cache_entries', 'gauge', 'entries', 'Cached entries.'),
+                             ('gcs_cache_hits_total', 'counter', 'hits', 'Cache lookups found.'),
+                             ('gcs_cache_misses_total', 'counter', 'misses',
+                              'Cache lookups not found or expired.'),
+                             ('gcs_cache_evictions_total', 'counter', 'evictions',
+                              'Entries evicted because the cache was full.'),
+                             ('gcs_cache_invalidations_total', 'counter', 'invalidations',
+                              'Entries removed by write operations.'))
+            for name, kind, key, help_text in cache_metrics:
+                header(name, kind, help_text)
+                for cache_name, stats in sorted(caches.items()):
+                    lines.append('%s{cache="%s"} %d' % (name, cache_name, stats[key]))
+
+        return '\n'.join(lines) + '\n'
+
+
+# The metrics of all the API requests of the process.
+metrics = GCS_Metrics()
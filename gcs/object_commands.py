@@ -6,20 +6,47 @@
 
 __author__ = 'mielem@gmail.com'
 
+import binascii
+import hashlib
+import logging
 import os
 import mimetypes
+import tempfile
+import time
+import urllib
 
 # Local imports
 import config 
+from checksums import CRC32C_NATIVE, GCS_Crc32c, GCS_Digests, GCS_Hashing_File
+from checksums import crc32c_combine, decode_crc32c, get_default_algorithms
+from checksums import parse_hash_header
 from command_utilities import GCS_Command_Utility
 from command_utilities import GCS_Error as err
+from command_utilities import GCS_File_Slice, NOT_FOUND
+from metadata_records import GCS_Object_Metadata
+from resumable_state import GCS_Resumable_State
+from worker_pool import GCS_Worker_Pool, GCS_Transfer_Report, is_retryable, throttle
+from xml_responses import parse_acl
 
 
-GCS_END_POINT = 'storage.googleapis.com'
 OBJECT_PERMISSIONS = ('READ', 'WRITE', 'FULL_CONTROL')
 
 OBJECT_ACL_SCOPES = ('UserByEmail', 'GroupByEmail')
 
+# Prefix of the temporary objects of the parallel composite uploads.
+COMPOSITE_TEMP_PREFIX = '.gcs-composite/'
+# Maximum number of components of a compose request.
+MAX_COMPOSE_COMPONENTS = 32
+
+# Define the HTTP statuses of the resumable upload protocol.
+RESUME_INCOMPLETE = 308
+GONE = 410
+
+# Define the HTTP status and the error code of corrupted data, as the 
+# service reports them.
+BAD_DIGEST = 400
+BAD_DIGEST_CODE = 'BadDigest'
+
 class GCS_Object(GCS_Command_Utility):
     '''
         Defines the functions to perform Google Cloud Storage object operations.
@@ -50,10 +77,6 @@ class GCS_Object(GCS_Command_Utility):
         # Evaluate the absolute file path.
         abs_file_path = os.path.join(os.environ['HOME'], file_path)
 
-        # Load file content.
-        file = open(abs_file_path, 'r')
-        file_contents = file.read()
-    
         # Get the path of the object to create.
         bucket_object = raw_input("Target object path (in the format gs://bucketname/objectname): ")
         tmpstr=bucket_object.split('/', 3)
@@ -69,7 +92,32 @@ class GCS_Object(GCS_Command_Utility):
             # Assign default value.
             permission = 'private'
     
+        # Issue the request.
+        try:
+            response, content = self._put_object(
+                                    abs_file_path, bucket_name, object_name, permission)
+        except err:
+            raise
+
+        # Display response
+        self._display_response(response, content)
+     
     
+    def _put_object(self, file_path, bucket_name, object_name, permission):
+        '''
+            Uploads a local file into an object.
+            @param file_path: The absolute path of the file to upload.
+            @param bucket_name: The name of the target bucket.
+            @param object_name: The name of the object to create.
+            @param permission: The access permission to associate with the object.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Files of config.COMPOSITE_UPLOAD_THRESHOLD bytes or larger
+            are uploaded as parallel components composed into the object. 
+            Files of config.RESUMABLE_THRESHOLD bytes or larger are uploaded 
+            with the resumable upload protocol.
+        '''
+        
         # Get the MIME type and encoding.
         guess_type, guess_encoding = mimetypes.guess_type(file_path)
       
@@ -78,19 +126,459 @@ class GCS_Object(GCS_Command_Utility):
                     'Content-Encoding' : guess_encoding,
                    'x-goog-acl' : permission}
         
-        # Issue the request.
+        file_size = os.path.getsize(file_path)
+        
         try:
-            url = '%s.%s/%s' % (bucket_name, GCS_END_POINT, object_name)
+            if file_size >= config.COMPOSITE_UPLOAD_THRESHOLD:
+                return self._put_object_composite(
+                            file_path, bucket_name, object_name, headers)
+            
+            if file_size >= config.RESUMABLE_THRESHOLD:
+                return self._put_object_resumable(
+                            file_path, bucket_name, object_name, headers)
+            
+            # Define URL in the format: [bucket_name].storage.googleapis.com/[object_name]
+            url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
             method = 'PUT'
+            
+            # Stream the file content. It is read in binary mode and sent in 
+            # chunks, so it is never entirely loaded in memory.
+            file = open(file_path, 'rb')
+            try:
+                digests = None
+                body = file
+                if config.VERIFY_CHECKSUMS:
+                    digests = GCS_Digests(get_default_algorithms())
+                    body = GCS_Hashing_File(file, digests)
+                response, content = self._api_request(url, method, headers=headers, 
+                                                      body=body)
+            finally:
+                file.close()
+            
+            self._verify_upload(digests, response, bucket_name, object_name)
+            return response, content
+        finally:
+            # The cached metadata of a replaced object is stale, even if 
+            # the upload failed midway.
+            self.metadata_cache.invalidate(bucket_name, object_name)
+    
+    
+    def _put_object_data(self, data, bucket_name, object_name, permission='private',
+                         content_type=None):
+        '''
+            Uploads a string into an object.
+            @param data: The string content of the object.
+            @param bucket_name: The name of the target bucket.
+            @param object_name: The name of the object to create.
+            @param permission: The access permission to associate with the object.
+            @param content_type: The MIME type of the object or None.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a single PUT request. Meant for small objects.
+            The Content-MD5 and x-goog-hash headers let the service reject
+            corrupted data.
+        '''
+        headers = {'Content-Type' : content_type,
+                   'x-goog-acl' : permission}
+        
+        if config.VERIFY_CHECKSUMS:
+            # The data is in memory, so the service can check it on arrival.
+            digests = GCS_Digests(get_default_algorithms())
+            digests.update(data)
+            headers['Content-MD5'] = digests.b64digests()['md5']
+            headers['x-goog-hash'] = digests.get_hash_header()
+        
+        # Define URL in the format: [bucket_name].storage.googleapis.com/[object_name]
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        try:
+            return self._api_request(url, 'PUT', headers=headers, body=data)
+        finally:
+            self.metadata_cache.invalidate(bucket_name, object_name)
+    
+    
+    def _put_object_resumable(self, file_path, bucket_name, object_name, headers,
+                              chunk_size=config.RESUMABLE_CHUNK_SIZE,
+                              retries=config.TRANSFER_RETRIES):
+        '''
+            Uploads a local file into an object using the resumable upload 
+            protocol.
+            @param file_path: The absolute path of the file to upload.
+            @param bucket_name: The name of the target bucket.
+            @param object_name: The name of the object to create.
+            @param headers: The object headers (Content-Type, x-goog-acl, etc).
+            @param chunk_size: The number of bytes sent with each PUT request.
+            It must be a multiple of 256 KB.
+            @param retries: How many times the upload resumes after a failure.
+            @return: The response dictionary and string content of the 
+            request that completed the upload.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: The session URI and the committed offset are saved in a 
+            local state file after every chunk. If the same file is uploaded 
+            again into the same object, for example after the process was 
+            restarted, the upload continues from the committed offset.
+            The digests are computed while the chunks are read, and sent 
+            with the last chunk in the x-goog-hash header, so the service 
+            rejects corrupted data. The last chunk is read in memory first.
+        '''
+        state = GCS_Resumable_State(file_path, bucket_name, object_name)
+        size = state.size
+        offset = None
+        
+        if state.load():
+            print 'Resume upload of "%s" from byte %d.' % (file_path, state.offset)
+            offset = self._query_resumable_offset(state.session_uri, size)
+        
+        if offset is None:
+            # No session, or the session expired: start a new one.
+            state.session_uri = self._start_resumable_upload(
+                                    bucket_name, object_name, headers)
+            offset = 0
+        
+        state.offset = offset
+        state.save()
+        
+        response, content = None, None
+        attempts = 0
+        
+        file = open(file_path, 'rb')
+        try:
+            digests = None
+            source = file
+            if config.VERIFY_CHECKSUMS:
+                digests = GCS_Digests(get_default_algorithms())
+                source = GCS_Hashing_File(file, digests)
+                # The bytes committed before a restart were read by the 
+                # previous process: hash them once more.
+                while source.hashed_offset < offset:
+                    source.read(min(config.TRANSFER_CHUNK_SIZE, 
+                                    offset - source.hashed_offset))
+            
+            while response is None or offset < size:
+                length = min(chunk_size, size - offset)
+                if length > 0:
+                    content_range = 'bytes %d-%d/%d' % (offset, offset + length - 1, size)
+                else:
+                    # Empty file, or all the bytes committed: finalize.
+                    content_range = 'bytes */%d' % size
+                
+                chunk_headers = {'Content-Range' : content_range,
+                                 'Content-Length' : '%d' % length}
+                body = GCS_File_Slice(source, offset, length)
+                if digests is not None and offset + length == size:
+                    # The last chunk: complete the digests before sending.
+                    body = body.read()
+                    chunk_headers['x-goog-hash'] = digests.get_hash_header()
+                
+                # A failed chunk is not sent again as it is: the upload 
+                # continues from the offset committed by the service.
+                try:
+                    response, content = self._api_request(
+                                            state.session_uri, 'PUT', 
+                                            headers=chunk_headers, 
+                                            body=body,
+                                            ok_statuses=(RESUME_INCOMPLETE,),
+                                            retry_safe=False)
+                except Exception, e:
+                    attempts += 1
+                    if attempts > retries or not is_retryable(e):
+                        raise
+                    time.sleep(self.retry_policy.get_delay(attempts))
+                    
+                    # Ask the service how many bytes it committed.
+                    offset = self._query_resumable_offset(state.session_uri, size)
+                    if offset is None:
+                        raise err(NOT_FOUND, 'Resumable upload session expired.')
+                    response = None
+                    continue
+                
+                if response.status == RESUME_INCOMPLETE:
+                    offset = self._get_committed_offset(response)
+                else:
+                    offset = size
+                
+                state.offset = offset
+                state.save()
+        finally:
+            file.close()
+        
+        state.delete()
+        self._verify_upload(digests, response, bucket_name, object_name)
+        return response, content
+    
+    
+    def _put_object_composite(self, file_path, bucket_name, object_name, headers,
+                              component_size=config.COMPOSITE_COMPONENT_SIZE,
+                              concurrency=config.COMPOSITE_CONCURRENCY,
+                              retries=config.TRANSFER_RETRIES):
+        '''
+            Uploads a local file into an object as a parallel composite upload.
+            @param file_path: The absolute path of the file to upload.
+            @param bucket_name: The name of the target bucket.
+            @param object_name: The name of the object to create.
+            @param headers: The object headers (Content-Type, x-goog-acl, etc).
+            @param component_size: The number of bytes of each component.
+            @param concurrency: The number of components uploaded in parallel.
+            @param retries: How many times a failed component is repeated.
+            @return: The response dictionary and string content of the 
+            compose request that created the object.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: The file is split into components which are uploaded 
+            concurrently as temporary objects in the same bucket. A compose
+            request then concatenates them into the final object, and the 
+            temporary objects are deleted. A compose request accepts at most
+            MAX_COMPOSE_COMPONENTS components, so larger files are composed 
+            in several steps. The CRC32C of the composed object is compared
+            with the one combined from the components before the temporary
+            objects are deleted.
+        '''
+        size = os.path.getsize(file_path)
+        temp_prefix = '%s%s/%s.' % (COMPOSITE_TEMP_PREFIX, 
+                                    binascii.hexlify(os.urandom(8)), object_name)
+        
+        components = [('%s%06d' % (temp_prefix, index), offset, 
+                       min(component_size, size - offset))
+                      for index, offset in enumerate(range(0, size, component_size))]
+        
+        # The base64 CRC32C of each component, None if unknown.
+        component_crcs = {}
+        
+        def upload_component(component):
+            component_name, offset, length = component
+            url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, 
+                                urllib.quote(component_name))
+            component_headers = {'Content-Type' : 'application/octet-stream'}
+            
+            # Each component uses its own file object, so the reads of 
+            # different threads do not interfere.
+            file = open(file_path, 'rb')
+            try:
+                digests = None
+                source = file
+                if config.VERIFY_CHECKSUMS:
+                    digests = GCS_Digests(get_default_algorithms())
+                    source = GCS_Hashing_File(file, digests, offset)
+                response, content = self._api_request(
+                                        url, 'PUT', headers=component_headers,
+                                        body=GCS_File_Slice(source, offset, length))
+            finally:
+                file.close()
+            self._verify_upload(digests, response, bucket_name, component_name)
+            if digests is not None and 'crc32c' in digests.algorithms:
+                component_crcs[component_name] = digests.b64digests()['crc32c']
+            else:
+                component_crcs[component_name] = parse_hash_header(response).get('crc32c')
+            return length
+        
+        print 'Upload "%s" in %d components.' % (file_path, len(components))
+        
+        temp_names = []
+        try:
+            report = GCS_Transfer_Report()
+            pool = GCS_Worker_Pool(concurrency, retries)
+            for component, nbytes, error, attempts in pool.imap_unordered(
+                                                        upload_component, components):
+                report.add(component[0], nbytes, error, attempts)
+                if error is None:
+                    temp_names.append(component[0])
+            
+            if report.failed:
+                raise report.failures[0][1]
+            
+            # Compose the components in groups until one compose request
+            # can create the final object.
+            names = [component[0] for component in components]
+            step = 0
+            while len(names) > MAX_COMPOSE_COMPONENTS:
+                groups = [names[i:i + MAX_COMPOSE_COMPONENTS] 
+                          for i in range(0, len(names), MAX_COMPOSE_COMPONENTS)]
+                names = []
+                for index, group in enumerate(groups):
+                    composed_name = '%scompose-%d-%06d' % (temp_prefix, step, index)
+                    self._compose_object(bucket_name, composed_name, group, 
+                                         {'Content-Type' : 'application/octet-stream'})
+                    temp_names.append(composed_name)
+                    names.append(composed_name)
+                step += 1
+            
+            response, content = self._compose_object(bucket_name, object_name, names, headers)
+            if config.VERIFY_CHECKSUMS:
+                self._verify_composite(bucket_name, object_name, response,
+                                       [(component_crcs[component[0]], component[2])
+                                        for component in components])
+            return response, content
+        finally:
+            self._delete_objects(bucket_name, temp_names, concurrency)
+    
+    
+    def _compose_object(self, bucket_name, object_name, component_names, headers):
+        '''
+            Concatenates objects of a bucket into a new object.
+            @param bucket_name: The name of the bucket that contains the objects.
+            @param object_name: The name of the object to create.
+            @param component_names: The names of the objects to concatenate.
+            @param headers: The headers of the new object.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a PUT request with the compose query string parameter.
+        '''
+        url = '%s.%s/%s?compose' % (bucket_name, config.GCS_END_POINT, 
+                                    urllib.quote(object_name))
+        body = self._get_compose_body(component_names)
+        return self._api_request(url, 'PUT', headers=dict(headers), body=body)
+    
+    
+    def _delete_objects(self, bucket_name, object_names, concurrency):
+        '''
+            Deletes temporary objects, ignoring the errors.
+            @param bucket_name: The name of the bucket that contains the objects.
+            @param object_names: The names of the objects to delete.
+            @param concurrency: The number of parallel requests.
+        '''
+        def delete(object_name):
+            self._delete_object(bucket_name, object_name)
+        
+        pool = GCS_Worker_Pool(concurrency)
+        for object_name, result, error, attempts in pool.imap_unordered(
+                                                        delete, object_names):
+            if error is not None:
+                print 'Temporary object "%s" not deleted: %s' % (object_name, error)
+    
+    
+    def _start_resumable_upload(self, bucket_name, object_name, headers):
+        '''
+            Initiates a resumable upload.
+            @param bucket_name: The name of the target bucket.
+            @param object_name: The name of the target object.
+            @param headers: The object headers (Content-Type, x-goog-acl, etc).
+            @return: The session URI to which the data is sent.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a POST request with the x-goog-resumable header.
+        '''
+        start_headers = dict(headers)
+        start_headers['x-goog-resumable'] = 'start'
+        start_headers['Content-Length'] = '0'
+        
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        # Starting a second session is harmless, so the POST can be retried.
+        response, content = self._api_request(url, 'POST', headers=start_headers,
+                                              retry_safe=True)
+        
+        if 'location' not in response:
+            raise err(response.status, 'The resumable upload session URI is missing.')
+        return response['location']
+    
+    
+    def _query_resumable_offset(self, session_uri, size):
+        '''
+            Gets the number of bytes committed in a resumable upload.
+            @param session_uri: The resumable upload session URI.
+            @param size: The total size of the upload.
+            @return: The committed offset, or None if the session does 
+            not exist anymore.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs an empty PUT request with Content-Range bytes */size.
+        '''
+        headers = {'Content-Range' : 'bytes */%d' % size,
+                   'Content-Length' : '0'}
+        try:
             response, content = self._api_request(
-                                    url, method,
-                                    headers=headers, 
-                                    body=file_contents)  
-        except err:
+                                    session_uri, 'PUT', headers=headers,
+                                    ok_statuses=(RESUME_INCOMPLETE,))
+        except err, e:
+            if e.status in (NOT_FOUND, GONE):
+                return None
             raise
-
-        # Display response
-        self._display_response(response, content)
+        
+        if response.status == RESUME_INCOMPLETE:
+            return self._get_committed_offset(response)
+        
+        # The upload already completed.
+        return size
+    
+    
+    def _get_committed_offset(self, response):
+        '''
+            Gets the committed offset from a 308 Resume Incomplete response.
+            @param response: The response dictionary.
+            @return: The number of bytes committed.
+            @note: The Range header has the format bytes=0-[last byte]. 
+            It is missing if no bytes were committed.
+        '''
+        committed_range = response.get('range')
+        if not committed_range:
+            return 0
+        return int(committed_range.rsplit('-', 1)[1]) + 1
+    
+    
+    def upload_objects(self):
+        '''
+            Uploads the files contained in a local directory tree.
+            User input:
+                directory path: The directory path in the format dir/subdir.
+                object prefix: The target prefix in the format gs://bucketname/prefix.
+                concurrency: The number of parallel uploads.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a PUT request for each file.  
+        '''
+        
+        # User input.
+        dir_path = raw_input("Directory path (in the format dir/subdir): ")
+        abs_dir_path = os.path.join(os.environ['HOME'], dir_path)
+        
+        target_path = raw_input("Target prefix (in the format gs://bucketname/prefix): ")
+        
+        concurrency = raw_input("Parallel uploads. Enter for %d: " 
+                                % config.TRANSFER_CONCURRENCY)
+        if not concurrency.strip():
+            # Assign default value.
+            concurrency = config.TRANSFER_CONCURRENCY
+        
+        self.upload_directory(abs_dir_path, target_path, int(concurrency))
+    
+    
+    def upload_directory(self, dir_path, target_path, 
+                         concurrency=config.TRANSFER_CONCURRENCY,
+                         retries=config.TRANSFER_RETRIES, permission='private'):
+        '''
+            Uploads the files contained in a local directory tree, 
+            without user interaction.
+            @param dir_path: The local directory to upload.
+            @param target_path: The target prefix in the format gs://bucketname/prefix.
+            The object names are the prefix followed by the file paths 
+            relative to dir_path.
+            @param concurrency: The number of parallel uploads.
+            @param retries: How many times a failed upload is repeated.
+            @param permission: The access permission to associate with the objects.
+            @return: The GCS_Transfer_Report with the outcome of the uploads.
+            @note: Performs a PUT request for each file.
+        '''
+        bucket_name, prefix = self._split_object_path(target_path)
+        if prefix and not prefix.endswith('/'):
+            prefix = prefix + '/'
+        
+        def walk_files():
+            for root, dirs, files in os.walk(dir_path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    relative_path = os.path.relpath(file_path, dir_path)
+                    object_name = prefix + relative_path.replace(os.sep, '/')
+                    yield file_path, object_name
+        
+        def upload(task):
+            file_path, object_name = task
+            self._put_object(file_path, bucket_name, object_name, permission)
+            return os.path.getsize(file_path)
+        
+        print 'Upload "%s" into "gs://%s/%s".' % (dir_path, bucket_name, prefix)
+        
+        pool = GCS_Worker_Pool(concurrency, retries)
+        report = GCS_Transfer_Report()
+        for task, nbytes, error, attempts in pool.imap_unordered(upload, walk_files()):
+            report.add(task[0], nbytes, error, attempts)
+        
+        report.display()
+        return report
      
   
     def download_object(self):
@@ -116,30 +604,429 @@ class GCS_Object(GCS_Command_Utility):
 
       
         #  Get the path of the object to download.
-        bucket_object = raw_input("Object to download path (in the format gs://bucketname/objectname): ")
+        bucket_object = raw_input("Object to download path "
+                                  "(in the format gs://bucketname/objectname): ")
         tmpstr=bucket_object.split('/', 3)
         bucket_name = tmpstr[2]
         object_name = tmpstr[3]
   
 
-        # Issue the request.
+        # Issue the request and download the object content.
         try:
-            url = '%s.%s/%s' % (bucket_name, GCS_END_POINT, object_name)
-            method = 'GET'
-            response, content = self._api_request(url, method)  
+            response, digests = self._get_object_to_file(
+                                    bucket_name, object_name, abs_file_path)
         except err:
             raise
-
-        try:
-            # Download object content.
-            file = open(abs_file_path, 'wb')
-            file.write(content)
         except IOError:
             raise
         
         # Display response
         self._display_response(response)
     
+    
+    def _get_object_to_file(self, bucket_name, object_name, file_path, 
+                            hash_algorithms=(), headers=None):
+        '''
+            Downloads an object into a local file.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object to download.
+            @param file_path: The absolute path of the destination file.
+            @param hash_algorithms: The hashlib names of the digests to compute
+            while the data is written (for example ('md5',)).
+            @param headers: Any additional headers to send.
+            @return: The response dictionary and a dictionary with the 
+            hexadecimal digest of each hash algorithm. The response status 
+            is 304 if the data was copied from content_cache.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: The object is read and written in chunks of 
+            config.TRANSFER_CHUNK_SIZE bytes, so the memory used does not 
+            depend on the object size. The data is written to a temporary 
+            file in the destination directory, which is renamed to file_path
+            only when the download completes.
+            Without additional headers, a copy of the object in content_cache
+            is revalidated with its ETag and generation, and the service 
+            sends no body if the object did not change. The data written is
+            then compared with the MD5 or CRC32C digest of the object, and 
+            the file is not replaced if it differs. A body received is also
+            written to the content_cache copy, which is stored only if the 
+            digests match.
+        '''
+        hashes = [(name, hashlib.new(name)) for name in hash_algorithms]
+        
+        # Define URL in the format: [bucket_name].storage.googleapis.com/[object_name]
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        method = 'GET'
+        
+        # Additional headers, such as a Range, select other content than 
+        # the cached copy.
+        use_cache = headers is None
+        entry, cached_file = None, None
+        if use_cache:
+            entry, cached_file = self.content_cache.open_entry(bucket_name, object_name)
+        
+        try:
+            if entry is not None:
+                # The service answers 304 if either precondition fails,
+                # that is if the object still has this ETag and generation.
+                headers = {'If-None-Match' : entry['etag']}
+                if entry['generation'] is not None:
+                    headers['x-goog-if-generation-not-match'] = str(entry['generation'])
+            
+            try:
+                response, stream = self._api_stream_request(
+                                        url, method, headers=headers, ok_statuses=(304,))
+            except err, e:
+                if use_cache and e.status == NOT_FOUND:
+                    self.content_cache.invalidate(bucket_name, object_name)
+                raise
+            
+            try:
+                if response.status == 304:
+                    if cached_file is None:
+                        raise self._get_error(response, '')
+                    chunks = iter(lambda: cached_file.read(config.TRANSFER_CHUNK_SIZE), '')
+                else:
+                    chunks = stream.iter_chunks(config.TRANSFER_CHUNK_SIZE)
+                
+                # A range of the object cannot be compared with its digests.
+                verify = None
+                if use_cache and config.VERIFY_CHECKSUMS:
+                    verify = GCS_Digests.for_response(response)
+                
+                temp_fd, temp_path = self._make_temp_file(file_path)
+                cache_writer = None
+                try:
+                    # The copy for content_cache is written with the file.
+                    if use_cache and response.status != 304:
+                        content_length = response.get('content-length')
+                        cache_writer = self.content_cache.start_store(
+                                            bucket_name, object_name,
+                                            content_length and int(content_length),
+                                            response.get('etag'))
+                    
+                    temp_file = os.fdopen(temp_fd, 'wb')
+                    try:
+                        for chunk in chunks:
+                            temp_file.write(chunk)
+                            if cache_writer is not None:
+                                cache_writer.write(chunk)
+                            for name, digest in hashes:
+                                digest.update(chunk)
+                            if verify is not None:
+                                verify.update(chunk)
+                    finally:
+                        temp_file.close()
+                    
+                    mismatch = None
+                    if verify is not None:
+                        mismatch = verify.find_mismatch(response)
+                    if mismatch is not None:
+                        if response.status == 304:
+                            self.content_cache.invalidate(bucket_name, object_name)
+                        raise err(BAD_DIGEST, 'Download of "%s" corrupted: %s' 
+                                  % (object_name, mismatch), BAD_DIGEST_CODE)
+                    
+                    if response.status == 304:
+                        self.content_cache.record_hit(bucket_name, object_name)
+                    elif cache_writer is not None:
+                        cache_writer.commit(response.get('x-goog-generation'))
+                    self._replace_file(temp_path, file_path)
+                except:
+                    if cache_writer is not None:
+                        cache_writer.discard()
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+            finally:
+                stream.close()
+        finally:
+            if cached_file is not None:
+                cached_file.close()
+        
+        digests = {}
+        for name, digest in hashes:
+            digests[name] = digest.hexdigest()
+        
+        return response, digests
+    
+  
+    def _get_object(self, bucket_name, object_name, headers=None):
+        '''
+            Downloads an object into memory.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object to download.
+            @param headers: Any additional headers to send.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a GET request. Meant for small objects; use 
+            _get_object_to_file for large ones.
+        '''
+        # Define URL in the format: [bucket_name].storage.googleapis.com/[object_name]
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        return self._api_request(url, 'GET', headers=headers)
+    
+  
+    def download_object_sliced(self):
+        '''
+            Gets a large object from a bucket using parallel ranged requests.
+           `User input:
+                file path: The file path in the format dir/filename.
+                object path: The object path in the format gs://bucketname/objectname.
+                concurrency: The number of parallel slices.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a HEAD request and a GET request for each slice.  
+        '''
+        
+        # User input.
+        file_path = raw_input("Destination file path (in the format dir/filename): ")
+        abs_file_path = os.path.join(os.environ['HOME'], file_path)
+        
+        bucket_object = raw_input("Object to download path "
+                                  "(in the format gs://bucketname/objectname): ")
+        bucket_name, object_name = self._split_object_path(bucket_object)
+        
+        concurrency = raw_input("Parallel slices. Enter for %d: " 
+                                % config.TRANSFER_CONCURRENCY)
+        if not concurrency.strip():
+            # Assign default value.
+            concurrency = config.TRANSFER_CONCURRENCY
+        
+        try:
+            report = self.download_sliced(bucket_name, object_name, abs_file_path,
+                                          concurrency=int(concurrency))
+        except err:
+            raise
+        
+        report.display()
+    
+    
+    def download_sliced(self, bucket_name, object_name, file_path,
+                        slice_size=config.SLICED_DOWNLOAD_SLICE_SIZE,
+                        concurrency=config.TRANSFER_CONCURRENCY,
+                        retries=config.TRANSFER_RETRIES):
+        '''
+            Downloads an object into a local file, fetching byte ranges 
+            (slices) of the object concurrently.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object to download.
+            @param file_path: The absolute path of the destination file.
+            @param slice_size: The number of bytes of each slice.
+            @param concurrency: The number of slices downloaded in parallel.
+            @param retries: How many times a failed slice is repeated.
+            @return: The GCS_Transfer_Report of the slices.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: The object size and generation are obtained with a HEAD 
+            request, never from metadata_cache: a cached generation of an 
+            object overwritten since would fail every slice. Every slice is 
+            requested with a Range header and pinned to that generation, 
+            then written at its offset in a temporary file preallocated to 
+            the object size. Objects smaller than 
+            config.SLICED_DOWNLOAD_THRESHOLD are downloaded in one request.
+            The assembled file is compared with the digests of the HEAD 
+            response before it replaces file_path: the CRC32C of each slice,
+            computed while it is written, are combined in offset order; 
+            without a CRC32C C extension, the file is read again for its MD5.
+        '''
+        
+        # Define URL in the format: [bucket_name].storage.googleapis.com/[object_name]
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        
+        # The slices are planned from the current size and generation.
+        self.metadata_cache.invalidate(bucket_name, object_name)
+        response, metadata = self._head_object(bucket_name, object_name)
+        object_size = metadata.size
+        generation = metadata.generation
+        
+        report = GCS_Transfer_Report()
+        
+        if object_size < config.SLICED_DOWNLOAD_THRESHOLD:
+            self._get_object_to_file(bucket_name, object_name, file_path)
+            report.add(object_name, object_size, None, 1)
+            return report
+        
+        slices = [(start, min(start + slice_size, object_size) - 1) 
+                  for start in range(0, object_size, slice_size)]
+        
+        verify = None
+        if config.VERIFY_CHECKSUMS:
+            verify = GCS_Digests.for_response(response)
+        expected = parse_hash_header(response)
+        
+        # The CRC32C of each slice by start offset, if CRC32C is verified.
+        slice_crcs = None
+        if verify is not None and 'crc32c' in expected and (
+                CRC32C_NATIVE or 'crc32c' in verify.algorithms):
+            slice_crcs = {}
+        
+        temp_fd, temp_path = self._make_temp_file(file_path)
+        try:
+            # Preallocate the file, so each slice can be written at its offset.
+            temp_file = os.fdopen(temp_fd, 'wb')
+            try:
+                temp_file.truncate(object_size)
+            finally:
+                temp_file.close()
+            
+            def download_slice(byte_range):
+                start, end = byte_range
+                headers = {'Range' : 'bytes=%d-%d' % byte_range}
+                if generation:
+                    headers['x-goog-if-generation-match'] = '%d' % generation
+                
+                response, stream = self._api_stream_request(url, 'GET', headers=headers)
+                try:
+                    # Each slice uses its own file descriptor, so the 
+                    # seek and write of different threads do not interfere.
+                    slice_file = open(temp_path, 'r+b')
+                    try:
+                        slice_file.seek(start)
+                        nbytes = 0
+                        crc = GCS_Crc32c()
+                        for chunk in stream.iter_chunks(config.TRANSFER_CHUNK_SIZE):
+                            slice_file.write(chunk)
+                            nbytes += len(chunk)
+                            if slice_crcs is not None:
+                                crc.update(chunk)
+                    finally:
+                        slice_file.close()
+                finally:
+                    stream.close()
+                
+                if nbytes != end - start + 1:
+                    raise err(response.status, 
+                              'Slice %d-%d is incomplete: %d bytes received.' 
+                              % (start, end, nbytes))
+                if slice_crcs is not None:
+                    slice_crcs[start] = crc.value
+                return nbytes
+            
+            print 'Download "gs://%s/%s" in %d slices.' % (
+                                bucket_name, object_name, len(slices))
+            
+            pool = GCS_Worker_Pool(concurrency, retries)
+            for byte_range, nbytes, error, attempts in pool.imap_unordered(
+                                                    download_slice, slices):
+                report.add('bytes=%d-%d' % byte_range, nbytes, error, attempts)
+            
+            if report.failed:
+                raise report.failures[0][1]
+            
+            mismatch = None
+            if slice_crcs is not None:
+                crc = slice_crcs[0]
+                for start, end in slices[1:]:
+                    crc = crc32c_combine(crc, slice_crcs[start], end - start + 1)
+                if crc != decode_crc32c(expected['crc32c']):
+                    mismatch = 'crc32c mismatch: local %08x, service %08x.' % (
+                                    crc, decode_crc32c(expected['crc32c']))
+            elif verify is not None:
+                temp_file = open(temp_path, 'rb')
+                try:
+                    for chunk in iter(lambda: temp_file.read(config.TRANSFER_CHUNK_SIZE), ''):
+                        verify.update(chunk)
+                finally:
+                    temp_file.close()
+                mismatch = verify.find_mismatch(response)
+            if mismatch is not None:
+                raise err(BAD_DIGEST, 'Download of "%s" corrupted: %s' 
+                          % (object_name, mismatch), BAD_DIGEST_CODE)
+            
+            self._replace_file(temp_path, file_path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        return report
+    
+    
+    def _verify_upload(self, digests, response, bucket_name, object_name):
+        '''
+            Compares the digests of uploaded data with the ones the service
+            reports for the object.
+            @param digests: The GCS_Digests of the data sent, or None.
+            @param response: The response dictionary of the upload.
+            @param bucket_name: The name of the bucket.
+            @param object_name: The name of the uploaded object.
+            @raise err: The GCS_Error exception if the digests differ. The 
+            corrupted object is deleted first.
+        '''
+        if digests is None:
+            return
+        mismatch = digests.find_mismatch(response)
+        if mismatch is None:
+            return
+        
+        try:
+            self._delete_object(bucket_name, object_name)
+        except err:
+            pass
+        raise err(BAD_DIGEST, 'Upload of "%s" corrupted: %s' % (object_name, mismatch),
+                  BAD_DIGEST_CODE)
+    
+    
+    def _verify_composite(self, bucket_name, object_name, response, component_crcs):
+        '''
+            Compares the CRC32C of a composed object with the one combined 
+            from its components.
+            @param bucket_name: The name of the bucket.
+            @param object_name: The name of the composed object.
+            @param response: The response dictionary of the compose request.
+            @param component_crcs: The list of the base64 CRC32C (None if 
+            unknown) and length of each component, in the object order.
+            @raise err: The GCS_Error exception if the checksums differ. The
+            corrupted object is deleted first.
+            @note: The object is read with a HEAD request if the compose 
+            response has no CRC32C.
+        '''
+        if None in [crc for crc, length in component_crcs]:
+            logging.warning('Composite upload of "%s" not verified: the service reported '
+                            'no CRC32C of a component.', object_name)
+            return
+        
+        expected = decode_crc32c(component_crcs[0][0])
+        for crc, length in component_crcs[1:]:
+            expected = crc32c_combine(expected, decode_crc32c(crc), length)
+        
+        reported = parse_hash_header(response).get('crc32c')
+        if reported is None:
+            self.metadata_cache.invalidate(bucket_name, object_name)
+            response = self._head_object(bucket_name, object_name)[0]
+            reported = parse_hash_header(response).get('crc32c')
+        if reported is None or decode_crc32c(reported) == expected:
+            return
+        
+        try:
+            self._delete_object(bucket_name, object_name)
+        except err:
+            pass
+        raise err(BAD_DIGEST, 'Upload of "%s" corrupted: crc32c mismatch: components %08x, '
+                  'service %08x.' % (object_name, expected, decode_crc32c(reported)),
+                  BAD_DIGEST_CODE)
+    
+    
+    def _make_temp_file(self, file_path):
+        '''
+            Creates a temporary file next to a destination file.
+            @param file_path: The absolute path of the destination file.
+            @return: The file descriptor and path of the temporary file.
+        '''
+        return tempfile.mkstemp(prefix='.%s.' % os.path.basename(file_path), 
+                                suffix='.part',
+                                dir=os.path.dirname(file_path) or '.')
+    
+    
+    def _replace_file(self, temp_path, file_path):
+        '''
+            Renames a completed temporary file to its destination path.
+            @param temp_path: The path of the temporary file.
+            @param file_path: The destination path.
+        '''
+        # On Windows rename fails if the destination exists.
+        if os.name == 'nt' and os.path.exists(file_path):
+            os.remove(file_path)
+        os.rename(temp_path, file_path)
+    
   
     def get_object_acls(self):
         '''
@@ -163,13 +1050,7 @@ class GCS_Object(GCS_Command_Utility):
         
         # Issue the request.
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
-            # Also specify the acl query string parameter.
-            url = '%s.%s/%s?acl' % (bucket_name, GCS_END_POINT, object_name)
-            # Assign HTTP verb.
-            method = 'GET'
-            # Perform API call.
-            response, content = self._api_request(url, method)
+            response, content = self._get_object_acl(bucket_name, object_name)
         except err:   
             raise
         
@@ -177,6 +1058,33 @@ class GCS_Object(GCS_Command_Utility):
         self._display_response(response, content)
      
         
+    def _get_object_acl(self, bucket_name, object_name):
+        '''
+            Gets an object's ACL document.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a GET request, unless the response is cached.
+        '''
+        # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
+        # Also specify the acl query string parameter.
+        url = '%s.%s/%s?acl' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        return self._cached_api_request((bucket_name, object_name, 'acl'), url)
+     
+        
+    def _fetch_object_acl(self, bucket_name, object_name):
+        '''
+            Gets an object's ACL.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object.
+            @return: A GCS_Acl record.
+            @raise err: The GCS_Error exception if the API request failed.
+        '''
+        response, content = self._get_object_acl(bucket_name, object_name)
+        return parse_acl(content)
+     
+        
     def set_object_email_acl(self):
         '''
             Sets an object's ACL for individual or group e-mail.
@@ -219,23 +1127,39 @@ class GCS_Object(GCS_Command_Utility):
             # Assign default value.
             permission = 'READ'
         
-        # Format message body.
-        body = self._get_acls_email_body(permission, scope, email)
-
         # Issue request.
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
-            # Also specify the acl query string parameter.
-            url = '%s.%s/%s?acl' % (bucket_name, GCS_END_POINT, object_name)
-            # Assign HTTP verb.
-            method = 'PUT'
-            # Perform API call.
-            response, content = self._api_request(url, method, body=body)
+            response, content = self._put_object_email_acl(
+                                    bucket_name, object_name, permission, scope, email)
         except err:   
             raise
         
         # Display response
         self._display_response(response, content)
+    
+    
+    def _put_object_email_acl(self, bucket_name, object_name, permission, scope, email):
+        '''
+            Sets an object's ACL for individual or group e-mail.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object for which to set the ACL.
+            @param permission: The access permission for the specified e-mail.
+            @param scope: The ACL applicable scope (UserByEmail or GroupByEmail).
+            @param email: Group or individual e-mail for which to create the ACL.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a PUT request.  
+        '''
+        # Format message body.
+        body = self._get_acls_email_body(permission, scope, email)
+        
+        # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
+        # Also specify the acl query string parameter.
+        url = '%s.%s/%s?acl' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        try:
+            return self._api_request(url, 'PUT', body=body)
+        finally:
+            self.metadata_cache.invalidate(bucket_name, object_name)
   
         
     def get_object_metadata(self):
@@ -244,9 +1168,9 @@ class GCS_Object(GCS_Command_Utility):
             User input:
                 bucket_name: The name of the bucket that contains the objects.
                 object_name: The name of the object for which to obtain the ACLs.
-            @return: The string XML representation of the object's ACLs.
+            @return: The GCS_Object_Metadata of the object.
             @raise err: The GCS_Error exception if the API request failed.
-            @note: Performs a GET request.  
+            @note: Performs a HEAD request.  
         '''
         
         # User input.
@@ -258,17 +1182,30 @@ class GCS_Object(GCS_Command_Utility):
         object_name = tmpstr[3]
         
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
-            url = '%s.%s/%s' % (bucket_name, GCS_END_POINT, object_name)
-            # Assign HTTP verb.
-            method = 'HEAD'
-            # Perform API call.
-            response, content = self._api_request(url, method)
+            response, metadata = self._head_object(bucket_name, object_name)
         except err:   
             raise
         
         # Display response
-        self._display_response(response, content)
+        self._display_response(response)
+        
+        return metadata
+    
+    
+    def _head_object(self, bucket_name, object_name):
+        '''
+            Gets a Cloud Storage object's metadata.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object.
+            @return: The response dictionary and the GCS_Object_Metadata.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a HEAD request, unless the response is cached.
+        '''
+        # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        response, content = self._cached_api_request(
+                                (bucket_name, object_name, 'metadata'), url, 'HEAD')
+        return response, GCS_Object_Metadata.from_headers(object_name, response)
         
     
     def copy_object(self):
@@ -281,7 +1218,7 @@ class GCS_Object(GCS_Command_Utility):
                 permission: The access permission of the new object. 
             @return: The string XML representation of the response.
             @raise err: The GCS_Error exception if the API request failed.
-            @note: Performs a GET request.  
+            @note: Performs a PUT request.  
         '''
         
         # User input           
@@ -304,44 +1241,117 @@ class GCS_Object(GCS_Command_Utility):
             
    
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
-            url = '%s.%s/%s' % (bucket_name, GCS_END_POINT, object_name)
-            # Assign HTTP verb.
-            method = 'HEAD'
-            # Perform API call.
-            response, content = self._api_request(url, method)
+            # The copy request has no body, so the source object does not
+            # need to be read first.
+            response, content = self._copy_object(bucket_name, object_name,
+                                                  target_bucket_name, target_object_name,
+                                                  permission)
         except err:   
             raise
         
-        content_length = 0
-        for key, value in response.items():
-            if key == "content-length":
-               content_length = value
-      
-        copy_source = '%s/%s' % (bucket_name, object_name)
+        # Display response
+        self._display_response(response, content)
         
+        print "Object %s has been copied into object %s" % (object_name, target_object_name)
+        
+      
         
-        headers = {'x-goog-copy-source': copy_source,
+    def _copy_object(self, bucket_name, object_name, 
+                     target_bucket_name, target_object_name, permission='private'):
+        '''
+            Copies an object on the service side.
+            @param bucket_name: The name of the source bucket.
+            @param object_name: The name of the object to copy.
+            @param target_bucket_name: The name of the target bucket.
+            @param target_object_name: The name of the new object.
+            @param permission: The access permission of the new object.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a PUT request with the x-goog-copy-source header.
+            The request has no body, so no HEAD request is needed first.
+        '''
+        headers = {'x-goog-copy-source' : urllib.quote('%s/%s' % (bucket_name, object_name)),
                    'x-goog-acl' : permission,
-                   'Content-Length' : content_length
-                   }
+                   'Content-Length' : '0'}
+        
+        # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
+        url = '%s.%s/%s' % (target_bucket_name, config.GCS_END_POINT, 
+                            urllib.quote(target_object_name))
         try:
-            # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
-            url = '%s.%s/%s' % (target_bucket_name, GCS_END_POINT, object_name)
-            # Assign HTTP verb.
-            method = 'PUT'
-            # Perform API call.
-            response, content = self._api_request(url, method, headers=headers)
-        except err:   
-            raise
+            return self._api_request(url, 'PUT', headers=headers)
+        finally:
+            self.metadata_cache.invalidate(target_bucket_name, target_object_name)
         
-        # Display response
-        self._display_response(response, content)
+      
+    def copy_objects(self):
+        '''
+            Copies the objects under a prefix into another bucket or prefix.
+            User input:
+                source prefix: The source prefix in the format gs://bucketname/prefix.
+                target prefix: The target prefix in the format gs://bucketname/prefix.
+                concurrency: The number of parallel copies.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a PUT request for each object.  
+        '''
         
-        print "Object %s has been copied into object %s" % (object_name, target_object_name)
+        # User input.
+        source_path = raw_input("Source prefix (in the format gs://bucketname/prefix): ")
+        target_path = raw_input("Target prefix (in the format gs://bucketname/prefix): ")
         
-      
+        concurrency = raw_input("Parallel copies. Enter for %d: " 
+                                % config.TRANSFER_CONCURRENCY)
+        if not concurrency.strip():
+            # Assign default value.
+            concurrency = config.TRANSFER_CONCURRENCY
+        
+        self.copy_prefix(source_path, target_path, int(concurrency))
+    
+    
+    def copy_prefix(self, source_path, target_path, 
+                    concurrency=config.TRANSFER_CONCURRENCY,
+                    retries=config.TRANSFER_RETRIES, permission='private'):
+        '''
+            Copies the objects under a prefix on the service side, 
+            without user interaction.
+            @param source_path: The source prefix in the format gs://bucketname/prefix.
+            @param target_path: The target prefix in the format gs://bucketname/prefix.
+            The object names are the target prefix followed by the source 
+            names relative to the source prefix.
+            @param concurrency: The number of parallel copies.
+            @param retries: How many times a failed copy is repeated.
+            @param permission: The access permission of the new objects.
+            @return: The GCS_Transfer_Report with the outcome of the copies.
+            @note: The source listing is streamed into the copies, so the 
+            first copies start with the first listing page. Performs one 
+            PUT request for each object and no HEAD request. The listing
+            uses iter_objects of GCS_Bucket, which GCS_Command inherits.
+        '''
+        bucket_name, prefix = self._split_object_path(source_path)
+        if prefix and not prefix.endswith('/'):
+            prefix = prefix + '/'
+        target_bucket_name, target_prefix = self._split_object_path(target_path)
+        if target_prefix and not target_prefix.endswith('/'):
+            target_prefix = target_prefix + '/'
+        
+        def copy(entry):
+            target_object_name = target_prefix + entry.key[len(prefix):]
+            self._copy_object(bucket_name, entry.key, 
+                              target_bucket_name, target_object_name, permission)
+            return entry.size
         
+        print 'Copy "gs://%s/%s" into "gs://%s/%s".' % (bucket_name, prefix, 
+                                                        target_bucket_name, target_prefix)
+        
+        pool = GCS_Worker_Pool(concurrency, retries)
+        report = GCS_Transfer_Report()
+        for entry, nbytes, error, attempts in pool.imap_unordered(
+                                                copy, self.iter_objects(bucket_name, prefix)):
+            report.add(entry.key, nbytes, error, attempts)
+        
+        report.display()
+        return report
+    
+      
     def delete_object(self):
         '''
             Deletes an object.
@@ -369,20 +1379,121 @@ class GCS_Object(GCS_Command_Utility):
       
         if delete == 'yes':
             try:
-                # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
-                url = '%s.%s/%s' % (bucket_name, GCS_END_POINT, object_name)
-                # Assign HTTP verb.
-                method = 'DELETE'
-                # Perform API call.
-                response, content = self._api_request(url, method)
+                response, content = self._delete_object(bucket_name, object_name)
                 # Display response
                 self._display_response(response, content)
             except err:   
                 raise
         else:
             print "Object %s not deleted. Bye!" % object_name
-  
-        # Display response
-        self._display_response(response, content)
+    
+    
+    def _delete_object(self, bucket_name, object_name):
+        '''
+            Deletes an object.
+            @param bucket_name: The name of the bucket that contains the object.
+            @param object_name: The name of the object to delete.
+            @return: The response dictionary and string content.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a DELETE request.  
+        '''
+        # Define URL in the format: [bucket_name].storage.googleapis.com.[object_name]
+        url = '%s.%s/%s' % (bucket_name, config.GCS_END_POINT, urllib.quote(object_name))
+        try:
+            return self._api_request(url, 'DELETE')
+        finally:
+            self.metadata_cache.invalidate(bucket_name, object_name)
+    
+    
+    def delete_objects(self):
+        '''
+            Deletes the objects under a prefix.
+            User input:
+                prefix: The prefix in the format gs://bucketname/prefix.
+                dry run: Whether to only list the objects that would be deleted.
+                concurrency: The number of parallel deletions.
+            @raise err: The GCS_Error exception if the API request failed.
+            @note: Performs a DELETE request for each object.  
+        '''
+        
+        # User input.
+        target_path = raw_input("Prefix (in the format gs://bucketname/prefix): ")
+        
+        dry_run = ''
+        while dry_run != 'yes' and dry_run != 'no':
+            dry_run = raw_input("Dry run, list the objects only [yes | no]: ").strip()
+        
+        concurrency = raw_input("Parallel deletions. Enter for %d: " 
+                                % config.DELETE_CONCURRENCY)
+        if not concurrency.strip():
+            # Assign default value.
+            concurrency = config.DELETE_CONCURRENCY
+        
+        if dry_run == 'no':
+            print "Are you sure you want to delete all the objects in: %s ?: " % target_path
+            delete = ''
+            while delete != 'yes' and delete != 'no':
+                delete = raw_input("Enter [yes | no]: ").strip()
+            if delete != 'yes':
+                print "Objects in %s not deleted. Bye!" % target_path
+                return
+        
+        self.delete_prefix(target_path, int(concurrency), dry_run=(dry_run == 'yes'))
+    
+    
+    def delete_prefix(self, target_path, concurrency=config.DELETE_CONCURRENCY,
+                      retries=config.TRANSFER_RETRIES, dry_run=False,
+                      max_rate=config.DELETE_MAX_RATE):
+        '''
+            Deletes the objects under a prefix, without user interaction.
+            @param target_path: The prefix in the format gs://bucketname/prefix.
+            The prefix is a folder: gs://bucketname/data deletes data/... but
+            not database/... Use gs://bucketname for all the objects in the 
+            bucket.
+            @param concurrency: The number of parallel DELETE requests.
+            @param retries: How many times a failed DELETE is repeated.
+            @param dry_run: If True, lists the objects that would be deleted 
+            and deletes nothing.
+            @param max_rate: The maximum number of DELETE requests per second,
+            or None for no limit.
+            @return: The GCS_Transfer_Report with the outcome of the deletions.
+            The bytes are the sizes of the deleted objects.
+            @note: The listing is streamed into the deletions, page by page, 
+            so the memory used does not depend on the number of objects. 
+            An object that no longer exists counts as deleted. The listing 
+            uses iter_objects of GCS_Bucket, which GCS_Command inherits.
+        '''
+        bucket_name, prefix = self._split_object_path(target_path)
+        if prefix and not prefix.endswith('/'):
+            prefix = prefix + '/'
+        entries = self.iter_objects(bucket_name, prefix)
+        
+        report = GCS_Transfer_Report()
+        
+        if dry_run:
+            print 'Dry run. Objects that would be deleted from "gs://%s/%s":' % (
+                        bucket_name, prefix)
+            for entry in entries:
+                print 'gs://%s/%s' % (bucket_name, entry.key)
+                report.add(entry.key, entry.size, None, 1)
+            report.display()
+            return report
+        
+        def delete(entry):
+            try:
+                self._delete_object(bucket_name, entry.key)
+            except err, e:
+                # Deleted by a previous attempt or by another client.
+                if e.status != NOT_FOUND:
+                    raise
+            return entry.size
+        
+        print 'Delete the objects in "gs://%s/%s".' % (bucket_name, prefix)
+        
+        pool = GCS_Worker_Pool(concurrency, retries)
+        for entry, nbytes, error, attempts in pool.imap_unordered(
+                                                delete, throttle(entries, max_rate)):
+            report.add(entry.key, nbytes, error, attempts)
         
-    
\ No newline at end of file
+        report.display()
+        return report
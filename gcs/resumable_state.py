@@ -0,0 +1,130 @@
+'''
+    Contains the GCS_Resumable_State class which persists the progress
+    of resumable uploads in local state files.
+    @note: If the process stops during an upload, the next upload of the
+    same file into the same object continues from the last committed
+    offset instead of starting over.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+# The directory that contains the resumable upload state files.
+RESUMABLE_STATE_DIR = os.path.join(os.path.dirname(__file__), 'resumable_uploads')
+
+
+class GCS_Resumable_State(object):
+    '''
+        Stores the session URI and the committed offset of a resumable
+        upload.
+        Attributes:
+            file_path: The absolute path of the file being uploaded.
+            bucket_name: The name of the target bucket.
+            object_name: The name of the target object.
+            size: The file size when the upload started.
+            mtime: The file modification time when the upload started.
+            session_uri: The resumable upload session URI or None.
+            offset: The number of bytes committed by the service.
+        @note: The state file name is derived from the file path, the
+        target object, and the file size and modification time, so a file
+        modified after an interrupted upload starts a new session.
+    '''
+
+    def __init__(self, file_path, bucket_name, object_name,
+                 state_dir=RESUMABLE_STATE_DIR):
+        '''
+            Initializes GCS_Resumable_State.
+            @param file_path: The path of the file being uploaded.
+            @param bucket_name: The name of the target bucket.
+            @param object_name: The name of the target object.
+            @param state_dir: The directory that contains the state files.
+        '''
+        file_stat = os.stat(file_path)
+
+        self.file_path = os.path.abspath(file_path)
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.size = file_stat.st_size
+        self.mtime = int(file_stat.st_mtime)
+        self.session_uri = None
+        self.offset = 0
+
+        key = '\n'.join([self.file_path, bucket_name, object_name,
+                         str(self.size), str(self.mtime)])
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        self.state_dir = state_dir
+        self.state_path = os.path.join(
+                            state_dir, hashlib.sha1(key).hexdigest() + '.json')
+
+
+    def load(self):
+        '''
+            Reads the state of a previous upload of the same file.
+            @return: True if a previous session exists; otherwise, False.
+        '''
+        try:
+            state_file = open(self.state_path, 'r')
+            try:
+                state = json.load(state_file)
+            finally:
+                state_file.close()
+        except (IOError, ValueError):
+            return False
+
+        self.session_uri = state.get('session_uri')
+        self.offset = state.get('offset', 0)
+        return self.session_uri is not None
+
+
+    def save(self):
+        '''
+            Writes the state to the state file.
+            @note: The state is written to a temporary file that replaces
+            the state file, so a crash never leaves a truncated state file.
+        '''
+        if not os.path.isdir(self.state_dir):
+            try:
+                os.makedirs(self.state_dir)
+            except OSError:
+                # Created by another upload in the meantime.
+                if not os.path.isdir(self.state_dir):
+                    raise
+
+        state = {'file_path' : self.file_path,
+                 'bucket_name' : self.bucket_name,
+                 'object_name' : self.object_name,
+                 'size' : self.size,
+                 'mtime' : self.mtime,
+                 'session_uri' : self.session_uri,
+                 'offset' : self.offset}
+
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.state_dir)
+        temp_file = os.fdopen(temp_fd, 'w')
+        try:
+            json.dump(state, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        finally:
+            temp_file.close()
+
+        # On Windows rename fails if the destination exists.
+        if os.name == 'nt' and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        os.rename(temp_path, self.state_path)
+
+
+    def delete(self):
+        '''
+            Removes the state file once the upload completed.
+        '''
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
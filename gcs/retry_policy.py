@@ -0,0 +1,244 @@
+'''
+    Contains the GCS_Retry_Policy class which decides if and when a failed
+    API request is sent again, and the GCS_Retry_Stats class which counts
+    the attempts and the backoff time for the metrics.
+    @note: The delay before a repetition is chosen at random between 0 and
+    an exponentially growing cap (full jitter), so clients throttled at the
+    same time do not retry at the same time. A Retry-After header returned
+    by the service takes precedence over the computed delay.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import httplib
+import random
+import socket
+import sys
+import threading
+import time
+
+# Local imports
+import config
+from metadata_records import parse_http_timestamp
+
+
+# HTTP status codes for which a request is worth repeating.
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# XML API error codes for which a request is worth repeating: the data was
+# corrupted on the way, so sending or reading it again can succeed.
+RETRY_CODES = ('BadDigest',)
+
+# Methods that can be repeated without changing the outcome.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+
+def is_retryable(error):
+    '''
+        Checks if a request that failed with the given error can be repeated.
+        @param error: The exception raised by the request.
+        @return: True if the error is transient; otherwise, False.
+        @note: GCS_Error is recognized by its status attribute, since this
+        module is imported by command_utilities.
+    '''
+    if isinstance(error, (socket.error, httplib.HTTPException)):
+        return True
+    if getattr(error, 'code', None) in RETRY_CODES:
+        return True
+    status = getattr(error, 'status', None)
+    return isinstance(status, int) and status in RETRY_STATUSES
+
+
+def parse_retry_after(value):
+    '''
+        Converts a Retry-After header to a delay.
+        @param value: The header value, in seconds or as an HTTP date, or None.
+        @return: The delay in seconds or None.
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    timestamp = parse_http_timestamp(value)
+    if timestamp is None:
+        return None
+    return max(0.0, timestamp - time.time())
+
+
+class GCS_Retry_Stats(object):
+    '''
+        Counts the requests, attempts and backoff time of all the API calls.
+        Attributes:
+            calls: The number of API calls.
+            attempts: The number of requests sent, repetitions included.
+            retries: The number of repetitions.
+            backoff_secs: The total time spent waiting before repetitions.
+            exhausted: The number of calls that failed after repetitions,
+            because the attempts or the deadline ran out.
+        @note: The counters are updated by concurrent worker threads.
+    '''
+
+    def __init__(self):
+        '''
+            Initializes GCS_Retry_Stats.
+        '''
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        '''
+            Sets all the counters to zero.
+        '''
+        with self._lock:
+            self.calls = 0
+            self.attempts = 0
+            self.retries = 0
+            self.backoff_secs = 0.0
+            self.exhausted = 0
+
+
+    def add_call(self, attempts, backoff_secs, exhausted):
+        '''
+            Records the outcome of one API call.
+            @param attempts: The number of requests sent.
+            @param backoff_secs: The time spent waiting before repetitions.
+            @param exhausted: True if the call failed after repetitions.
+        '''
+        with self._lock:
+            self.calls += 1
+            self.attempts += attempts
+            self.retries += attempts - 1
+            self.backoff_secs += backoff_secs
+            if exhausted:
+                self.exhausted += 1
+
+
+    def snapshot(self):
+        '''
+            @return: Dictionary of the current counters.
+        '''
+        with self._lock:
+            return {'calls' : self.calls,
+                    'attempts' : self.attempts,
+                    'retries' : self.retries,
+                    'backoff_secs' : round(self.backoff_secs, 3),
+                    'exhausted' : self.exhausted}
+
+
+# The counters of all the API calls of the process.
+retry_stats = GCS_Retry_Stats()
+
+
+class GCS_Retry_Policy(object):
+    '''
+        Decides if a failed request is repeated and how long to wait first.
+        Attributes:
+            max_attempts: The maximum number of requests sent per call.
+            base_delay: The cap of the first backoff delay in seconds.
+            max_delay: The maximum cap of a backoff delay in seconds.
+            deadline: The maximum seconds a call may last, repetitions
+            included, or None for no limit.
+    '''
+
+    def __init__(self, max_attempts=config.RETRY_MAX_ATTEMPTS,
+                 base_delay=config.RETRY_BASE_DELAY_SECS,
+                 max_delay=config.RETRY_MAX_DELAY_SECS,
+                 deadline=config.RETRY_DEADLINE_SECS):
+        '''
+            Initializes GCS_Retry_Policy.
+            @param max_attempts: The maximum number of requests sent per call.
+            @param base_delay: The cap of the first backoff delay in seconds.
+            @param max_delay: The maximum cap of a backoff delay in seconds.
+            @param deadline: The maximum seconds a call may last or None.
+        '''
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+
+    def can_retry(self, method, replayable, retry_safe=None):
+        '''
+            Checks if a request may be repeated at all.
+            @param method: The HTTP request method.
+            @param replayable: False if the body cannot be sent again
+            (for example an iterator).
+            @param retry_safe: True to repeat a non idempotent request,
+            False to never repeat the request, None to repeat the
+            idempotent methods only.
+            @return: True if the request may be repeated; otherwise, False.
+        '''
+        if not replayable or retry_safe is False:
+            return False
+        return retry_safe or method in IDEMPOTENT_METHODS
+
+
+    def get_delay(self, attempts, retry_after=None):
+        '''
+            Computes the delay before the next attempt.
+            @param attempts: The number of requests already sent.
+            @param retry_after: The Retry-After delay returned by the service
+            or None. It is used as it is, without jitter.
+            @return: The delay in seconds.
+        '''
+        if retry_after is not None:
+            # The deadline bounds an excessive Retry-After.
+            return retry_after
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return random.uniform(0, cap)
+
+
+    def call(self, attempt_func, method, replayable=True, retry_safe=None,
+             rewind=None):
+        '''
+            Performs a call, repeating the request on transient errors.
+            @param attempt_func: The function that sends one request. It
+            returns the result of the call or raises an exception.
+            @param method: The HTTP request method.
+            @param replayable: False if the body cannot be sent again.
+            @param retry_safe: As in can_retry.
+            @param rewind: The function that prepares the body to be sent
+            again, or None.
+            @return: The result of attempt_func.
+            @raise exception: The error of the last attempt. Its attempts
+            attribute holds the number of requests sent.
+        '''
+        can_retry = self.can_retry(method, replayable, retry_safe)
+        start = time.time()
+        attempts = 0
+        backoff_secs = 0.0
+
+        while True:
+            attempts += 1
+            try:
+                result = attempt_func()
+            except Exception, e:
+                traceback = sys.exc_info()[2]
+                delay = None
+                if (can_retry and attempts < self.max_attempts and is_retryable(e)):
+                    delay = self.get_delay(
+                                attempts, parse_retry_after(getattr(e, 'retry_after', None)))
+                    if (self.deadline is not None and
+                            time.time() + delay - start > self.deadline):
+                        delay = None
+
+                if delay is None:
+                    retry_stats.add_call(attempts, backoff_secs, attempts > 1)
+                    try:
+                        e.attempts = attempts
+                    except AttributeError:
+                        pass
+                    raise e, None, traceback
+
+                time.sleep(delay)
+                backoff_secs += delay
+                if rewind is not None:
+                    rewind()
+                continue
+
+            retry_stats.add_call(attempts, backoff_secs, False)
+            return result
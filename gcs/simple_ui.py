@@ -15,7 +15,7 @@ MENU = '''
          ***** Bucket Operations  *****
          b1 -- GET Bucket           -- List objects in a bucket      
          b2 -- PUT Bucket           -- Create a bucket 
-         b3 -- DELETE Bucket        -- Delete a bucket 
+         b3 -- DELETE Bucket        -- Delete a bucket (optionally emptying it first)
          b4 -- GET Bucket CORS      -- Get a bucket CORS   
          b5 -- SET Bucket CORS      -- Set a bucket CORS 
          b6 -- GET Bucket Location  -- Get a bucket location    
@@ -28,10 +28,15 @@ MENU = '''
          o5 -- GET Object           -- Get an object ACLs  
          o6 -- HEAD Object          -- Get an object metadata
          o7 -- DELETE Object        -- Delete an object  
+         o8 -- PUT Objects          -- Upload a directory tree  
+         o9 -- GET Object ranges    -- Download an object in parallel slices  
+         o10 -- PUT Objects         -- Copy a prefix to another bucket or prefix  
+         o11 -- DELETE Objects      -- Delete the objects under a prefix  
 
          ***** Support Operations  *****
          s1 -- Change scope         -- Change application scope.
          s2 -- Get app data         -- Display application data.
+         s3 -- Get metrics          -- Display request metrics (JSON or Prometheus).
                                        
          Make your selection. Enter to clear or X to exit.
 '''
@@ -141,6 +146,22 @@ class GCS_SimpleUI():
             elif self.choice == "o7":
                 # Execute DELETE request to delete an object.
                 gcs_commands.delete_object()
+            
+            elif self.choice == "o8":
+                # Execute parallel PUT requests to upload a directory tree.
+                gcs_commands.upload_objects()
+            
+            elif self.choice == "o9":
+                # Execute parallel ranged GET requests to download an object.
+                gcs_commands.download_object_sliced()
+            
+            elif self.choice == "o10":
+                # Execute parallel PUT copy requests to copy a prefix.
+                gcs_commands.copy_objects()
+            
+            elif self.choice == "o11":
+                # Execute parallel DELETE requests to delete a prefix.
+                gcs_commands.delete_objects()
   
             
             # Support Operations       
@@ -151,6 +172,10 @@ class GCS_SimpleUI():
             elif self.choice == "s2":
                 print "Display application data."
                 gcs_commands.get_app_data()
+
+            elif self.choice == "s3":
+                print "Display request metrics."
+                gcs_commands.get_metrics()
             
             else:
                 if self.choice != "x":
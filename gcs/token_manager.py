@@ -0,0 +1,310 @@
+'''
+    Contains the GCS_Token_Manager class which keeps the OAuth2 access
+    token fresh and shares it with the other processes of the application.
+    @note: A background thread refreshes the token before it expires, so
+    no request waits for a token round trip. The current token is stored
+    in a cache file next to the stored credentials. The refresh happens
+    under an exclusive lock of that file: the first process to take the
+    lock refreshes the token, and the processes waiting for the lock find
+    the new token in the cache instead of refreshing it again. Without
+    fcntl (Windows) each process refreshes its own token.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import atexit
+import calendar
+import datetime
+import errno
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Local imports
+import config
+
+
+class GCS_Token_Manager(object):
+    '''
+        Refreshes an access token ahead of its expiry.
+        Attributes:
+            credentials: The oauth2client credentials.
+            http_client: The httplib2.Http object used to refresh the token.
+            cache_path: The path of the token cache file shared by the
+            processes. The lock file is cache_path + '.lock'.
+            refresh_margin: The seconds before the expiry at which the token
+            is refreshed.
+            refreshes: The number of refreshes this process performed.
+            adoptions: The number of tokens this process took from the cache.
+    '''
+
+    def __init__(self, credentials, http_client, cache_path,
+                 refresh_margin=config.TOKEN_REFRESH_MARGIN_SECS):
+        '''
+            Initializes GCS_Token_Manager.
+            @param credentials: The oauth2client credentials.
+            @param http_client: The httplib2.Http object used to refresh.
+            @param cache_path: The path of the token cache file.
+            @param refresh_margin: The seconds before the expiry at which
+            the token is refreshed.
+        '''
+        self.credentials = credentials
+        self.http_client = http_client
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.refreshes = 0
+        self.adoptions = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # The tokens of other credentials or scopes must not be shared.
+        key = '\n'.join([str(getattr(credentials, 'client_id', None)),
+                         str(getattr(credentials, 'refresh_token', None)),
+                         str(config.app_data.get('scope'))])
+        self._cache_key = hashlib.sha1(key).hexdigest()
+
+
+    def get_expiry(self):
+        '''
+            @return: The expiry of the current token in seconds since the
+            epoch, or None if it is unknown.
+        '''
+        token_expiry = self.credentials.token_expiry
+        if token_expiry is None:
+            return None
+        return calendar.timegm(token_expiry.timetuple())
+
+
+    def _is_fresh(self, margin, rejected_token=None):
+        '''
+            Checks if the current token can be used.
+            @param margin: The seconds the token must still be valid.
+            @param rejected_token: A token rejected by the service, or None.
+            @return: True if the token is valid for margin seconds and was
+            not rejected; otherwise, False.
+        '''
+        token = self.credentials.access_token
+        if token is None or token == rejected_token:
+            return False
+        expiry = self.get_expiry()
+        return expiry is None or expiry - time.time() > margin
+
+
+    def get_token(self):
+        '''
+            Gets a valid access token.
+            @return: The access token.
+            @note: The token is refreshed here only if the background
+            thread did not refresh it in time.
+        '''
+        if not self._is_fresh(0):
+            self.refresh()
+        return self.credentials.access_token
+
+
+    def apply(self, headers):
+        '''
+            Adds the authorization header of a valid token.
+            @param headers: The request headers dictionary.
+        '''
+        headers['Authorization'] = 'Bearer %s' % self.get_token()
+
+
+    def refresh(self, rejected_token=None, margin=0):
+        '''
+            Refreshes the token, or takes the token another process or
+            thread refreshed meanwhile.
+            @param rejected_token: The token rejected by the service, which
+            must be replaced, or None.
+            @param margin: The seconds the token must still be valid.
+        '''
+        with self._lock:
+            if self._is_fresh(margin, rejected_token):
+                # Refreshed by another thread while this one waited.
+                return
+
+            lock_file = self._lock_cache()
+            try:
+                if self._adopt_cached_token(margin, rejected_token):
+                    return
+                self.credentials.refresh(self.http_client)
+                self.refreshes += 1
+                self._write_cache()
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+
+    def _lock_cache(self, timeout=config.TOKEN_LOCK_TIMEOUT_SECS):
+        '''
+            Waits for the exclusive lock of the token cache.
+            @param timeout: The maximum seconds to wait.
+            @return: The open lock file, or None if the lock is not supported
+            or was not obtained in time.
+            @note: A process that holds the lock and hangs, for example in a
+            refresh request without a timeout, would otherwise block the 
+            other processes forever. Past the deadline the token is refreshed
+            without the lock, as without fcntl.
+        '''
+        if fcntl is None:
+            return None
+        lock_file = open(self.cache_path + '.lock', 'a')
+        deadline = time.time() + timeout
+        delay = 0.01
+        try:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return lock_file
+                except IOError, e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logging.warning('The token cache lock %s.lock was not obtained in %s '
+                                    'seconds; refreshing without it.', self.cache_path, timeout)
+                    lock_file.close()
+                    return None
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.5)
+        except:
+            lock_file.close()
+            raise
+
+
+    def _adopt_cached_token(self, margin, rejected_token):
+        '''
+            Takes the token stored in the cache by another process.
+            @param margin: The seconds the token must still be valid.
+            @param rejected_token: A token that must not be taken, or None.
+            @return: True if the cached token was taken; otherwise, False.
+        '''
+        try:
+            cache_file = open(self.cache_path, 'r')
+            try:
+                cache = json.load(cache_file)
+            finally:
+                cache_file.close()
+        except (IOError, ValueError):
+            return False
+
+        token = cache.get('access_token')
+        expiry = cache.get('expiry')
+        if (cache.get('key') != self._cache_key or not token or
+                token == rejected_token or token == self.credentials.access_token or
+                expiry is None or expiry - time.time() <= margin):
+            return False
+
+        self.credentials.access_token = token
+        self.credentials.token_expiry = datetime.datetime.utcfromtimestamp(expiry)
+        self.adoptions += 1
+        return True
+
+
+    def _write_cache(self):
+        '''
+            Stores the current token in the cache.
+            @note: The cache is written to a temporary file, readable by the
+            user only, which replaces the cache file.
+        '''
+        cache = {'key' : self._cache_key,
+                 'access_token' : self.credentials.access_token,
+                 'expiry' : self.get_expiry()}
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                              dir=os.path.dirname(self.cache_path) or '.')
+        try:
+            temp_file = os.fdopen(temp_fd, 'w')
+            try:
+                json.dump(cache, temp_file)
+            finally:
+                temp_file.close()
+            # On Windows rename fails if the destination exists.
+            if os.name == 'nt' and os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+            os.rename(temp_path, self.cache_path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+    def start(self):
+        '''
+            Starts the background refresh thread.
+            @note: The thread is stopped at exit. A daemon thread still
+            running while the interpreter shuts down would fail on the
+            modules already torn down.
+        '''
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+
+
+    def stop(self, timeout=config.TOKEN_STOP_TIMEOUT_SECS):
+        '''
+            Stops the background refresh thread.
+            @param timeout: The maximum seconds to wait for the thread, 
+            which may be in a refresh request.
+            @note: A thread still running after the timeout is a daemon 
+            thread, so it does not keep the process alive.
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+    def _run(self):
+        '''
+            Refreshes the token refresh_margin seconds before each expiry.
+            @note: A random part of the margin is added, so the processes
+            started together do not all queue for the lock at once. A failed
+            refresh is repeated after a short delay.
+        '''
+        while True:
+            margin = self.refresh_margin + random.uniform(0, self.refresh_margin / 2.0)
+            delay = 0
+            if self.credentials.access_token is not None:
+                expiry = self.get_expiry()
+                if expiry is None:
+                    # The lifetime is unknown: the token is refreshed when 
+                    # the service rejects it.
+                    return
+                delay = max(0, expiry - time.time() - margin)
+            
+            if self._stop.wait(delay):
+                return
+            try:
+                self.refresh(margin=margin)
+            except Exception:
+                if self._stop.wait(min(60, self.refresh_margin / 4.0)):
+                    return
+
+
+    def stats(self):
+        '''
+            @return: Dictionary of the refreshes, the adoptions and the
+            seconds left before the token expires.
+        '''
+        expiry = self.get_expiry()
+        return {'refreshes' : self.refreshes,
+                'adoptions' : self.adoptions,
+                'expires_in_secs' : (round(expiry - time.time(), 1)
+                                     if expiry is not None else None)}
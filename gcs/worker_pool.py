@@ -0,0 +1,247 @@
+'''
+    Contains the GCS_Worker_Pool class which runs Google Cloud Storage
+    operations concurrently on a bounded number of threads, and the
+    GCS_Transfer_Report class which summarizes the operations throughput.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import Queue
+import sys
+import threading
+import time
+
+# Local imports
+import config
+import retry_policy
+
+
+# Seconds the feeder and the workers wait before checking if the pool stopped.
+_POLL_SECS = 0.1
+
+# Marks the end of the tasks.
+_DONE = object()
+
+
+def is_retryable(error):
+    '''
+        Checks if an operation that failed with the given error can be repeated.
+        @param error: The exception raised by the operation.
+        @return: True if the error is transient; otherwise, False.
+        @note: An error raised after the API request was already retried
+        by the retry policy is not repeated again, so the two levels of
+        retries do not multiply.
+    '''
+    if getattr(error, 'attempts', 1) > 1:
+        return False
+    return retry_policy.is_retryable(error)
+
+
+def throttle(items, max_rate):
+    '''
+        Limits the rate at which the items of a stream are produced.
+        @param items: An iterable of items.
+        @param max_rate: The maximum number of items per second, or None 
+        (or 0) for no limit.
+        @return: A generator of the items.
+        @note: The worker pools consume their items lazily, so throttling
+        the items throttles the operations.
+    '''
+    if not max_rate:
+        for item in items:
+            yield item
+        return
+
+    interval = 1.0 / max_rate
+    next_time = time.time()
+    for item in items:
+        now = time.time()
+        if next_time > now:
+            time.sleep(next_time - now)
+            now = next_time
+        next_time = max(next_time, now) + interval
+        yield item
+
+
+class GCS_Worker_Pool(object):
+    '''
+        Runs a function over a stream of items using a bounded number of
+        worker threads.
+        Attributes:
+            concurrency: The number of worker threads.
+            retries: How many times a failed item is repeated.
+            retry_delay: The delay before the first repetition. It doubles
+            at every repetition.
+        @note: The items are consumed lazily, so the pool can process
+        listings or directory walks of any size with constant memory.
+    '''
+
+    def __init__(self, concurrency=config.TRANSFER_CONCURRENCY,
+                 retries=config.TRANSFER_RETRIES,
+                 retry_delay=config.TRANSFER_RETRY_DELAY_SECS):
+        '''
+            Initializes GCS_Worker_Pool.
+            @param concurrency: The number of worker threads.
+            @param retries: How many times a failed item is repeated.
+            @param retry_delay: The delay in seconds before the first repetition.
+        '''
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+
+    def _run_task(self, func, item):
+        '''
+            Runs the function for one item, repeating it on transient errors.
+            @param func: The function to run.
+            @param item: The item to pass to the function.
+            @return: The (item, result, error, attempts) tuple.
+        '''
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return item, func(item), None, attempts
+            except Exception, e:
+                if attempts > self.retries or not is_retryable(e):
+                    return item, None, e, attempts
+            time.sleep(self.retry_delay * (2 ** (attempts - 1)))
+
+
+    def imap_unordered(self, func, items):
+        '''
+            Runs the function for each item.
+            @param func: The function to run. It receives one item.
+            @param items: An iterable of items.
+            @return: A generator of (item, result, error, attempts) tuples in
+            completion order. The error is None when the function succeeded.
+        '''
+        task_queue = Queue.Queue(self.concurrency * 2)
+        result_queue = Queue.Queue()
+        stop = threading.Event()
+        feeder_error = []
+
+        def put_task(task):
+            while not stop.is_set():
+                try:
+                    task_queue.put(task, True, _POLL_SECS)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def feeder():
+            try:
+                for item in items:
+                    if not put_task(item):
+                        break
+            except Exception:
+                feeder_error.append(sys.exc_info())
+            for i in range(self.concurrency):
+                put_task(_DONE)
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    item = task_queue.get(True, _POLL_SECS)
+                except Queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                result_queue.put(self._run_task(func, item))
+            result_queue.put(_DONE)
+
+        threads = [threading.Thread(target=feeder)]
+        threads.extend([threading.Thread(target=worker) for i in range(self.concurrency)])
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            done = 0
+            while done < self.concurrency:
+                result = result_queue.get()
+                if result is _DONE:
+                    done += 1
+                else:
+                    yield result
+        finally:
+            stop.set()
+
+        if feeder_error:
+            raise feeder_error[0][0], feeder_error[0][1], feeder_error[0][2]
+
+
+class GCS_Transfer_Report(object):
+    '''
+        Collects the outcome of a bulk operation and displays its
+        progress and throughput.
+        Attributes:
+            succeeded: The number of items that succeeded.
+            failed: The number of items that failed.
+            retried: The number of repetitions.
+            bytes: The number of bytes transferred.
+            failures: List of (item, error) tuples.
+    '''
+
+    def __init__(self, progress_interval=1.0):
+        '''
+            Initializes GCS_Transfer_Report.
+            @param progress_interval: Seconds between progress lines.
+            Use None to disable the progress display.
+        '''
+        self.progress_interval = progress_interval
+        self.start_time = time.time()
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.bytes = 0
+        self.failures = []
+        self._last_progress = self.start_time
+
+
+    def add(self, item, nbytes, error, attempts):
+        '''
+            Records the outcome of one item.
+            @param item: The item processed.
+            @param nbytes: The number of bytes transferred for the item.
+            @param error: The error raised for the item or None.
+            @param attempts: The number of attempts made.
+        '''
+        self.retried += attempts - 1
+        if error is None:
+            self.succeeded += 1
+            self.bytes += nbytes or 0
+        else:
+            self.failed += 1
+            self.failures.append((item, error))
+
+        now = time.time()
+        if (self.progress_interval is not None and
+                now - self._last_progress >= self.progress_interval):
+            self._last_progress = now
+            print self.summary()
+
+
+    def summary(self):
+        '''
+            Returns the throughput summary.
+            @return: The summary string.
+        '''
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        megabytes = self.bytes / (1024.0 * 1024.0)
+        return ('%d done, %d failed, %d retries, %.2f MB in %.1f s '
+                '(%.1f files/s, %.2f MB/s)' % (
+                    self.succeeded, self.failed, self.retried, megabytes, elapsed,
+                    (self.succeeded + self.failed) / elapsed, megabytes / elapsed))
+
+
+    def display(self):
+        '''
+            Displays the final summary and the failed items.
+        '''
+        print "<---------- Transfer summary ------------->"
+        print self.summary()
+        for item, error in self.failures:
+            print "Failed: %s -- %s" % (item, error)
@@ -0,0 +1,239 @@
+'''
+    Contains the functions that parse the XML API response bodies into
+    lightweight records.
+    @note: The bodies are parsed incrementally with iterparse, so a
+    listing page is turned into records while it is read from the
+    connection, and the parsed elements are discarded right away.
+    No DOM is built and nothing is pretty-printed.
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+from collections import namedtuple
+from StringIO import StringIO
+
+try:
+    import xml.etree.cElementTree as xml
+except ImportError:
+    import xml.etree.ElementTree as xml
+
+# Local imports
+from metadata_records import GCS_Object_Metadata, GCS_Bucket_Metadata
+from metadata_records import parse_iso_timestamp
+
+
+# Define the response records.
+GCS_Prefix_Entry = namedtuple('GCS_Prefix_Entry', 'prefix')
+GCS_Acl = namedtuple('GCS_Acl', 'owner entries')
+GCS_Acl_Entry = namedtuple('GCS_Acl_Entry', 'scope_type scope permission')
+GCS_Cors = namedtuple('GCS_Cors', 'origins methods response_headers max_age_secs')
+GCS_Error_Details = namedtuple('GCS_Error_Details', 'code message details')
+
+
+def _local_tag(elem):
+    '''
+        Gets the tag of an element without its namespace.
+        @param elem: The element.
+        @return: The tag, such as Contents.
+    '''
+    return elem.tag.rsplit('}', 1)[-1]
+
+
+def _as_source(body):
+    '''
+        Wraps a string body in a file object.
+        @param body: A string or a file-like object with a read method.
+        @return: A file-like object for iterparse.
+    '''
+    if isinstance(body, basestring):
+        return StringIO(body)
+    return body
+
+
+def _children_text(elem):
+    '''
+        Collects the text of the direct children of an element.
+        @param elem: The element.
+        @return: Dictionary of the child local tags and texts.
+    '''
+    values = {}
+    for child in elem:
+        values[_local_tag(child)] = child.text
+    return values
+
+
+class GCS_List_Parser(object):
+    '''
+        Parses a ListBucketResult page.
+        Iterating over the parser yields a GCS_Object_Metadata for each
+        Contents element and a GCS_Prefix_Entry for each common prefix,
+        as soon as the element is read.
+        Attributes:
+            is_truncated: True if more pages follow. Set after the iteration.
+            next_marker: The NextMarker of the page or None.
+            last_name: The key or prefix of the last entry.
+    '''
+
+    def __init__(self, body):
+        '''
+            Initializes GCS_List_Parser.
+            @param body: The response body as a string or a file-like object.
+        '''
+        self.is_truncated = False
+        self.next_marker = None
+        self.last_name = None
+        self._source = _as_source(body)
+
+
+    def __iter__(self):
+        '''
+            Parses the page.
+            @return: A generator of listing entries.
+        '''
+        root = None
+        depth = 0
+        for event, elem in xml.iterparse(self._source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                # Only the direct children of ListBucketResult are handled.
+                continue
+
+            tag = _local_tag(elem)
+            if tag == 'Contents':
+                values = _children_text(elem)
+                generation = values.get('Generation')
+                self.last_name = values.get('Key')
+                yield GCS_Object_Metadata(values.get('Key'),
+                                          int(values.get('Size') or 0),
+                                          values.get('ETag'),
+                                          int(generation) if generation else None,
+                                          parse_iso_timestamp(values.get('LastModified')),
+                                          values.get('StorageClass'))
+            elif tag == 'CommonPrefixes':
+                for child in elem:
+                    if _local_tag(child) == 'Prefix':
+                        self.last_name = child.text
+                        yield GCS_Prefix_Entry(child.text)
+            elif tag == 'IsTruncated':
+                self.is_truncated = elem.text == 'true'
+            elif tag == 'NextMarker':
+                self.next_marker = elem.text
+
+            # Drop the parsed elements, so the memory used does not
+            # depend on the page size.
+            root.clear()
+
+
+def parse_bucket_list(body):
+    '''
+        Parses a ListAllMyBucketsResult body.
+        @param body: The response body as a string or a file-like object.
+        @return: A generator of GCS_Bucket_Metadata records.
+    '''
+    for event, elem in xml.iterparse(_as_source(body)):
+        if _local_tag(elem) == 'Bucket':
+            values = _children_text(elem)
+            yield GCS_Bucket_Metadata(values.get('Name'),
+                                      parse_iso_timestamp(values.get('CreationDate')))
+            elem.clear()
+
+
+def parse_acl(body):
+    '''
+        Parses an AccessControlList body.
+        @param body: The response body as a string or a file-like object.
+        @return: A GCS_Acl record. The scope of each entry is the e-mail,
+        ID or domain the permission is granted to, or None for scopes such
+        as AllUsers.
+    '''
+    owner = None
+    entries = []
+    for event, elem in xml.iterparse(_as_source(body)):
+        tag = _local_tag(elem)
+        if tag == 'Owner':
+            owner = _children_text(elem).get('ID')
+        elif tag == 'Entry':
+            scope_type = None
+            scope = None
+            permission = None
+            for child in elem:
+                child_tag = _local_tag(child)
+                if child_tag == 'Scope':
+                    scope_type = child.get('type')
+                    values = _children_text(child)
+                    scope = (values.get('EmailAddress') or values.get('ID') or
+                             values.get('Domain'))
+                elif child_tag == 'Permission':
+                    permission = child.text
+            entries.append(GCS_Acl_Entry(scope_type, scope, permission))
+            elem.clear()
+    return GCS_Acl(owner, entries)
+
+
+def parse_cors(body):
+    '''
+        Parses a CorsConfig body.
+        @param body: The response body as a string or a file-like object.
+        @return: A list of GCS_Cors records.
+    '''
+    cors_list = []
+    for event, elem in xml.iterparse(_as_source(body)):
+        if _local_tag(elem) != 'Cors':
+            continue
+        origins = []
+        methods = []
+        response_headers = []
+        max_age_secs = None
+        for child in elem.iter():
+            tag = _local_tag(child)
+            if tag == 'Origin':
+                origins.append(child.text)
+            elif tag == 'Method':
+                methods.append(child.text)
+            elif tag == 'ResponseHeader':
+                response_headers.append(child.text)
+            elif tag == 'MaxAgeSec' and child.text:
+                max_age_secs = int(child.text)
+        cors_list.append(GCS_Cors(origins, methods, response_headers, max_age_secs))
+        elem.clear()
+    return cors_list
+
+
+def parse_location(body):
+    '''
+        Parses a LocationConstraint body.
+        @param body: The response body as a string or a file-like object.
+        @return: The location string, such as US or EU.
+    '''
+    for event, elem in xml.iterparse(_as_source(body)):
+        if _local_tag(elem) == 'LocationConstraint':
+            return elem.text
+    return None
+
+
+def parse_error(body):
+    '''
+        Parses an Error body.
+        @param body: The response body as a string or a file-like object.
+        @return: A GCS_Error_Details record, or None if the body is not an
+        XML API error.
+    '''
+    if not body:
+        return None
+    try:
+        for event, elem in xml.iterparse(_as_source(body)):
+            if _local_tag(elem) == 'Error':
+                values = _children_text(elem)
+                return GCS_Error_Details(values.get('Code'), values.get('Message'),
+                                         values.get('Details'))
+    except SyntaxError:
+        # Not XML (for example an HTML error page).
+        pass
+    return None
@@ -9,15 +9,18 @@
 '''
 __author__ = 'mielem@gmail.com'
 
+import json
 import logging
 import os
 import sys
 
 import gflags
 
-# Local imports.
-from gcs.simple_ui import GCS_SimpleUI 
+# Local imports. The menu and the batch runner are imported by the modes
+# that use them, so the other modes start faster.
 from gcs.commands import GCS_Command
+from gcs.command_utilities import set_endpoint
+from gcs import config
 
 
 # Define the application's parameters the user must enter
@@ -31,6 +34,60 @@ LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
 gflags.DEFINE_enum(
     'logging_level', 'INFO', LOG_LEVELS, 'Set the level of logging detail.')
 
+# Endpoint of the XML API.
+gflags.DEFINE_string(
+    'endpoint', None, 'URL of another XML API endpoint than the service, such as http://127.0.0.1:8080 for gcs/fake_server.py.')
+
+# Non-interactive object metadata.
+gflags.DEFINE_string(
+    'head', None, 'Object to display the metadata of, in the format gs://bucketname/objectname.')
+
+# Non-interactive bulk upload.
+gflags.DEFINE_string(
+    'upload_dir', None, 'Local directory to upload without user interaction.')
+gflags.DEFINE_string(
+    'upload_target', None, 'Target prefix of the upload in the format gs://bucketname/prefix.')
+
+# Non-interactive bulk copy.
+gflags.DEFINE_string(
+    'copy_source', None, 'Source prefix to copy without user interaction, in the format gs://bucketname/prefix.')
+gflags.DEFINE_string(
+    'copy_target', None, 'Target prefix of the copy in the format gs://bucketname/prefix.')
+
+# Non-interactive bulk delete.
+gflags.DEFINE_string(
+    'delete_prefix', None, 'Prefix to delete without user interaction, in the format gs://bucketname/prefix. A trailing / is added to the prefix if missing.')
+gflags.DEFINE_boolean(
+    'delete_bucket', False, 'With --delete_prefix gs://bucketname, also delete the bucket once empty.')
+gflags.DEFINE_boolean(
+    'dry_run', False, 'List the objects --delete_prefix would delete, and delete nothing.')
+gflags.DEFINE_float(
+    'max_rate', config.DELETE_MAX_RATE, 'Maximum number of DELETE requests per second of '
+    '--delete_prefix. Default: no limit.')
+
+# Settings of the bulk operations.
+gflags.DEFINE_integer(
+    'concurrency', config.TRANSFER_CONCURRENCY, 'Number of operations performed in parallel.')
+gflags.DEFINE_integer(
+    'retries', config.TRANSFER_RETRIES, 'How many times a failed operation is repeated.')
+gflags.DEFINE_float(
+    'rate_per_host', config.FLOW_RATE_PER_HOST, 'Maximum number of requests per second sent '
+    'to each bucket host, by every mode. Default: no limit.')
+
+# Non-interactive batch mode.
+gflags.DEFINE_string(
+    'batch_file', None, 'JSONL file of the operations to perform, or - for stdin.')
+gflags.DEFINE_string(
+    'batch_results', '-', 'JSONL file of the operation results, or - for stdout.')
+gflags.DEFINE_integer(
+    'max_in_flight', config.TRANSFER_CONCURRENCY, 'Maximum number of batch operations in progress.')
+
+# Request metrics of the non-interactive modes.
+gflags.DEFINE_string(
+    'metrics_file', None, 'File to write the request metrics to at the end, or - for stderr.')
+gflags.DEFINE_enum(
+    'metrics_format', 'json', ['json', 'prometheus'], 'Format of the request metrics.')
+
 
 def __init__app(debug_level):
     '''
@@ -42,6 +99,7 @@ def __init__app(debug_level):
       2) GCS_Command. It allows you to issue commands to interact with 
          the storage service.
     '''
+    from gcs.simple_ui import GCS_SimpleUI 
             
     # Instantiate GCS_SimpleUI class.
     ui = GCS_SimpleUI()
@@ -53,6 +111,170 @@ def __init__app(debug_level):
     # Storage request based on user's selection.
     ui.simple_ui(gcs_commands)
 
+def __head__object(debug_level):
+    '''
+      Displays the metadata of the --head object as JSON, without 
+      displaying the menu.
+      @param debug_level: The level to display request/response 
+      debugging information.
+      @return: The process exit status.
+    '''
+    gcs_commands = GCS_Command(debug_level)
+    bucket_name, object_name = gcs_commands._split_object_path(FLAGS.head)
+    if not object_name:
+        print "--head requires an object in the format gs://bucketname/objectname."
+        return 1
+    
+    response, metadata = gcs_commands._head_object(bucket_name, object_name)
+    print json.dumps({'key' : metadata.key,
+                      'size' : metadata.size,
+                      'etag' : metadata.etag,
+                      'generation' : metadata.generation,
+                      'last_modified' : metadata.last_modified,
+                      'storage_class' : metadata.storage_class}, sort_keys=True)
+    return 0
+
+def __upload__dir(debug_level):
+    '''
+      Uploads the directory passed with --upload_dir into the prefix 
+      passed with --upload_target, without displaying the menu.
+      @param debug_level: The level to display request/response 
+      debugging information.
+      @return: The process exit status.
+    '''
+    if not FLAGS.upload_target:
+        print "--upload_target is required with --upload_dir."
+        return 1
+    
+    gcs_commands = GCS_Command(debug_level)
+    report = gcs_commands.upload_directory(
+                FLAGS.upload_dir, FLAGS.upload_target,
+                FLAGS.concurrency, FLAGS.retries)
+    
+    if report.failed:
+        return 1
+    return 0
+
+def __copy__prefix(debug_level):
+    '''
+      Copies the objects under the --copy_source prefix into the 
+      --copy_target prefix, without displaying the menu.
+      @param debug_level: The level to display request/response 
+      debugging information.
+      @return: The process exit status.
+    '''
+    if not FLAGS.copy_target:
+        print "--copy_target is required with --copy_source."
+        return 1
+    
+    gcs_commands = GCS_Command(debug_level)
+    report = gcs_commands.copy_prefix(
+                FLAGS.copy_source, FLAGS.copy_target,
+                FLAGS.concurrency, FLAGS.retries)
+    
+    if report.failed:
+        return 1
+    return 0
+
+def __delete__prefix(debug_level):
+    '''
+      Deletes the objects under the --delete_prefix prefix, and the bucket
+      if --delete_bucket is set, without displaying the menu.
+      @param debug_level: The level to display request/response 
+      debugging information.
+      @return: The process exit status.
+    '''
+    gcs_commands = GCS_Command(debug_level)
+    
+    if FLAGS.delete_bucket:
+        bucket_name, prefix = gcs_commands._split_object_path(FLAGS.delete_prefix)
+        if prefix:
+            print "--delete_bucket requires --delete_prefix in the format gs://bucketname."
+            return 1
+        report, response, content = gcs_commands.empty_and_delete_bucket(
+                                        bucket_name, FLAGS.concurrency, FLAGS.retries,
+                                        FLAGS.dry_run, FLAGS.max_rate)
+        if response is not None:
+            print "Bucket %s deleted." % bucket_name
+    else:
+        report = gcs_commands.delete_prefix(
+                    FLAGS.delete_prefix, FLAGS.concurrency, FLAGS.retries,
+                    FLAGS.dry_run, FLAGS.max_rate)
+    
+    if report.failed:
+        return 1
+    return 0
+
+def __run__batch(debug_level):
+    '''
+      Performs the operations of the --batch_file JSONL stream and writes
+      their results to the --batch_results JSONL stream.
+      @param debug_level: The level to display request/response 
+      debugging information.
+      @return: The process exit status.
+    '''
+    from gcs.batch_runner import GCS_Batch_Runner
+    
+    gcs_commands = GCS_Command(debug_level)
+    runner = GCS_Batch_Runner(gcs_commands, FLAGS.max_in_flight, FLAGS.retries)
+    
+    if FLAGS.batch_file == '-':
+        # The standard input carries the jobs, so the project ID cannot 
+        # be asked for.
+        if config.app_data['project_id'] is None:
+            try:
+                gcs_commands.get_gcs_project_id(prompt=False)
+            except IOError, e:
+                sys.stderr.write('%s\n' % e)
+                return 1
+        job_file = sys.stdin
+    else:
+        job_file = open(FLAGS.batch_file, 'r')
+    
+    stdout = sys.stdout
+    if FLAGS.batch_results == '-':
+        result_file = stdout
+    else:
+        result_file = open(FLAGS.batch_results, 'w')
+    
+    # The progress messages and the debugging output of the commands are 
+    # printed, so they go to stderr and the result stream stays parseable.
+    sys.stdout = sys.stderr
+    try:
+        failed = runner.run(job_file, result_file)
+    finally:
+        sys.stdout = stdout
+        if job_file is not sys.stdin:
+            job_file.close()
+        if result_file is not stdout:
+            result_file.close()
+    
+    if failed:
+        return 1
+    return 0
+
+def __write__metrics():
+    '''
+      Writes the request metrics to the --metrics_file file, in the 
+      --metrics_format format.
+    '''
+    if not FLAGS.metrics_file:
+        return
+    
+    text = GCS_Command.dump_metrics(FLAGS.metrics_format)
+    if not text.endswith('\n'):
+        text += '\n'
+    
+    if FLAGS.metrics_file == '-':
+        # The standard output may carry the batch results.
+        sys.stderr.write(text)
+    else:
+        metrics_file = open(FLAGS.metrics_file, 'w')
+        try:
+            metrics_file.write(text)
+        finally:
+            metrics_file.close()
+
 def main(argv):
     '''
         Main entry point for the application.
@@ -82,6 +304,28 @@ def main(argv):
     else:
         debug_level = 0
 
+    if FLAGS.endpoint:
+        set_endpoint(FLAGS.endpoint)
+    
+    if FLAGS.rate_per_host:
+        GCS_Command.flow_controller.rate = FLAGS.rate_per_host
+
+    status = None
+    if FLAGS.head:
+        status = __head__object(debug_level)
+    elif FLAGS.batch_file:
+        status = __run__batch(debug_level)
+    elif FLAGS.upload_dir:
+        status = __upload__dir(debug_level)
+    elif FLAGS.copy_source:
+        status = __copy__prefix(debug_level)
+    elif FLAGS.delete_prefix:
+        status = __delete__prefix(debug_level)
+    
+    if status is not None:
+        __write__metrics()
+        sys.exit(status)
+    
     # Initialize the application.
     __init__app(debug_level)
     
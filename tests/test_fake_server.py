@@ -0,0 +1,212 @@
+'''
+    Tests the commands against the local fake XML API server
+    (gcs/fake_server.py): the object operations, the listing, the
+    resumable and composite uploads, the asynchronous client and the
+    batch mode.
+    Usage: python -m unittest discover tests
+    @version: 1.0
+'''
+
+__author__ = 'mielem@gmail.com'
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+# The directory that contains main.py.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from gcs import config
+from gcs.async_client import GCS_Async_Client
+from gcs.command_utilities import GCS_Error, set_endpoint
+from gcs.commands import GCS_Command
+from gcs.fake_server import GCS_Fake_Server, _Fake_Bucket
+
+
+BUCKET = 'test-bucket'
+
+
+class _Static_Credentials(object):
+    '''
+        Credentials with a fixed token, which the fake server ignores.
+    '''
+    access_token = 'test'
+    access_token_expired = False
+
+    def apply(self, headers):
+        headers['Authorization'] = 'Bearer %s' % self.access_token
+
+    def refresh(self, http):
+        pass
+
+
+class GCS_Fake_Server_Test(unittest.TestCase):
+    '''
+        Runs the commands of GCS_Command against a GCS_Fake_Server started
+        in the test process.
+    '''
+
+    def setUp(self):
+        self.server = GCS_Fake_Server(crc32c=True).start()
+        self.server.buckets[BUCKET] = _Fake_Bucket('US')
+        set_endpoint(self.server.url)
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.commands = GCS_Command(0)
+        config.app_data['credentials'] = _Static_Credentials()
+        config.app_data['project_id'] = 'test'
+        self.commands.metadata_cache.clear()
+        self.commands.content_cache.cache_dir = os.path.join(self.temp_dir, 'cache')
+
+
+    def tearDown(self):
+        # The idle connections are closed before the server stops.
+        config.app_data['connection_pool'].clear()
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+
+
+    def make_file(self, name, size):
+        '''
+            @return: The path of a new file of random bytes.
+        '''
+        path = os.path.join(self.temp_dir, name)
+        data_file = open(path, 'wb')
+        try:
+            data_file.write(os.urandom(size))
+        finally:
+            data_file.close()
+        return path
+
+
+    def read_file(self, path):
+        data_file = open(path, 'rb')
+        try:
+            return data_file.read()
+        finally:
+            data_file.close()
+
+
+    def test_put_get_head(self):
+        self.commands._put_object_data('hello', BUCKET, 'dir/hello.txt',
+                                       content_type='text/plain')
+        response, content = self.commands._get_object(BUCKET, 'dir/hello.txt')
+        self.assertEqual(content, 'hello')
+
+        response, metadata = self.commands._head_object(BUCKET, 'dir/hello.txt')
+        self.assertEqual(metadata.size, 5)
+        self.assertEqual(metadata.etag, '"%s"' % hashlib.md5('hello').hexdigest())
+
+
+    def test_get_missing_object(self):
+        try:
+            self.commands._get_object(BUCKET, 'missing')
+        except GCS_Error, e:
+            self.assertEqual(e.status, 404)
+        else:
+            self.fail('A missing object was read.')
+
+
+    def test_list_pages(self):
+        names = ['list/%02d' % index for index in range(25)]
+        for name in names:
+            self.commands._put_object_data('x', BUCKET, name)
+        entries = list(self.commands.iter_objects(BUCKET, prefix='list/', max_keys=7))
+        self.assertEqual([entry.key for entry in entries], names)
+
+
+    def test_resumable_upload(self):
+        path = self.make_file('resumable.bin', 700 * 1024)
+        response, content = self.commands._put_object_resumable(
+                                path, BUCKET, 'resumable.bin',
+                                {'Content-Type' : 'application/octet-stream'},
+                                chunk_size=256 * 1024)
+        self.assertEqual(response.status, 200)
+
+        target = os.path.join(self.temp_dir, 'resumable.out')
+        self.commands._get_object_to_file(BUCKET, 'resumable.bin', target)
+        self.assertEqual(self.read_file(target), self.read_file(path))
+
+
+    def test_composite_upload(self):
+        path = self.make_file('composite.bin', 3 * 256 * 1024 + 5)
+        self.commands._put_object_composite(path, BUCKET, 'composite.bin',
+                                            {'Content-Type' : 'application/octet-stream'},
+                                            component_size=256 * 1024)
+        # The temporary components are deleted.
+        self.assertEqual(self.server.buckets[BUCKET].names, ['composite.bin'])
+
+        target = os.path.join(self.temp_dir, 'composite.out')
+        self.commands.download_sliced(BUCKET, 'composite.bin', target, slice_size=200 * 1024)
+        self.assertEqual(self.read_file(target), self.read_file(path))
+
+
+    def test_copy(self):
+        self.commands._put_object_data('copied', BUCKET, 'source')
+        self.commands._copy_object(BUCKET, 'source', BUCKET, 'target')
+        self.assertEqual(self.commands._get_object(BUCKET, 'target')[1], 'copied')
+
+
+    def test_async_callbacks(self):
+        client = GCS_Async_Client(self.commands, max_concurrency=1)
+        try:
+            future = client.put_object('async', BUCKET, 'async')
+            released = []
+            def check_slot(future):
+                released.append(client.semaphore.acquire(False))
+                if released[-1]:
+                    client.semaphore.release()
+            future.add_done_callback(check_slot)
+            # A failing callback is logged, and the worker goes on.
+            logging.disable(logging.CRITICAL)
+            try:
+                future.add_done_callback(lambda future: 1 / 0)
+                future.result()
+                self.assertEqual(client.get_object(BUCKET, 'async').result(), 'async')
+            finally:
+                logging.disable(logging.NOTSET)
+            # The callback ran after the request slot was released.
+            self.assertEqual(released, [True])
+        finally:
+            client.close()
+
+
+    def test_batch_results_on_stdout(self):
+        import main
+        path = self.make_file('batch.bin', 3 * 1024 * 1024)
+        job_path = os.path.join(self.temp_dir, 'jobs.jsonl')
+        job_file = open(job_path, 'w')
+        try:
+            job_file.write(json.dumps({'op' : 'upload', 'src' : path,
+                                       'dst' : 'gs://%s/batch.bin' % BUCKET}) + '\n')
+        finally:
+            job_file.close()
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+        try:
+            try:
+                main.main(['main.py', '--batch_file', job_path, '--batch_results', '-',
+                           '--endpoint', self.server.url])
+            except SystemExit, e:
+                status = e.code
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        self.assertEqual(status, 0)
+        # The progress messages of the composite upload are not mixed with
+        # the results.
+        results = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([result['status'] for result in results], ['ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()